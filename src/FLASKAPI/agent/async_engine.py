@@ -0,0 +1,368 @@
+"""
+Async search pipeline behind gogoduck_trafilatura_openai:
+DDG search -> streamed, byte-capped fetch on a shared HTTP/2 AsyncClient ->
+extraction in worker processes -> async OpenAI summary.
+
+Everything runs on one long-lived event loop per worker process (EngineLoop),
+so the AsyncClient and its pooled connections outlive single calls. Sync code
+reaches it through run_async().
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Coroutine, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from ddgs import DDGS
+from openai import AsyncOpenAI
+
+from .cache import content_key, get_summary_cache
+from .clients import get_registry
+from .compress import compress_for_llm
+from .extract import NotHTML, get_extract_pool, is_probably_non_html, sniff_non_html
+from .metrics import in_request, metrics, request_id
+from .pagecache import USER_AGENT, get_page_cache
+from .prompts import prompt_usage
+from .resilience import estimate_tokens, get_resilience
+
+MAX_PAGE_BYTES = int(os.getenv("ENGINE_MAX_PAGE_BYTES", 2 * 1024 * 1024))
+
+SUMMARY_PROMPT = """Tóm tắt nội dung sau bằng tiếng Việt, KHÔNG bịa:
+- Đúng 3 gạch đầu dòng (không hơn, không kém)
+- Mỗi gạch 1 câu ngắn
+- Giữ tên riêng/số liệu/mốc thời gian (nếu có)
+- Nếu bài thiếu dữ kiện quan trọng: ghi "không thấy đề cập"
+
+NỘI DUNG:
+{text}
+"""
+# the page text is the only variable part and already sits at the end
+SUMMARY_VERSION = f"summary@{content_key(SUMMARY_PROMPT)[:12]}"
+
+
+def summary_key(text: str, model: str, max_output_tokens: int) -> str:
+    # keyed on everything that shapes the output, so a prompt edit is a cache miss
+    return content_key("summary", text, model, SUMMARY_VERSION, max_output_tokens)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx[http2])
+    except ImportError:
+        return False
+    return True
+
+
+HTTP2 = _http2_available() and os.getenv("ENGINE_HTTP2", "1") != "0"
+
+
+# ---- the engine's event loop ----
+class EngineLoop:
+    """An event loop running forever on a daemon thread."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="engine-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("run_async() called from the engine loop itself; await the coroutine instead")
+        # the loop thread has its own context; carry the caller's request id over
+        return asyncio.run_coroutine_threadsafe(in_request(coro, request_id.get()), self.loop).result(timeout)
+
+
+_engine_loop: Optional[EngineLoop] = None
+_engine_loop_pid: Optional[int] = None
+_engine_loop_lock = threading.Lock()
+
+
+def get_engine_loop() -> EngineLoop:
+    global _engine_loop, _engine_loop_pid
+    pid = os.getpid()
+    if _engine_loop is not None and _engine_loop_pid == pid:
+        return _engine_loop
+    with _engine_loop_lock:
+        if _engine_loop is None or _engine_loop_pid != pid:
+            _engine_loop = EngineLoop()
+            _engine_loop_pid = pid
+        return _engine_loop
+
+
+def run_async(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """Run `coro` on the engine loop from synchronous code and wait for it."""
+    return get_engine_loop().run(coro, timeout)
+
+
+def page_client() -> httpx.AsyncClient:
+    return get_registry().async_http_client("pages_async", http2=HTTP2)
+
+
+# ---- fetch / extract / summarize ----
+async def fetch_capped(
+    client: httpx.AsyncClient, url: str, headers: Dict[str, str], timeout_sec: float, max_bytes: int
+) -> Tuple[int, httpx.Headers, bytes, Optional[str]]:
+    """
+    Stream the body and stop reading at `max_bytes`; a huge page costs at most
+    that much memory and bandwidth. Non-HTML bodies are refused (NotHTML) from
+    the Content-Type, or from the first chunk's magic bytes, before the rest is
+    read. Returns (status, headers, body, charset).
+    """
+    async with client.stream("GET", url, headers=headers, timeout=timeout_sec, follow_redirects=True) as resp:
+        if resp.status_code >= 300:
+            return resp.status_code, resp.headers, b"", None
+        reason = sniff_non_html(resp.headers.get("Content-Type"))
+        if reason:
+            raise NotHTML(reason)
+        chunks: List[bytes] = []
+        size = 0
+        async for chunk in resp.aiter_bytes():
+            if not chunks:
+                reason = sniff_non_html(None, chunk)
+                if reason:
+                    raise NotHTML(reason)
+            chunks.append(chunk[: max_bytes - size])
+            size += len(chunks[-1])
+            if size >= max_bytes:
+                break
+        return resp.status_code, resp.headers, b"".join(chunks), resp.charset_encoding
+
+
+async def aextract(html: str) -> str:
+    # ExtractPool.extract blocks its thread (not the loop) until a worker answers
+    with metrics.span("extract"):
+        return await asyncio.to_thread(get_extract_pool().extract, html)
+
+
+async def ascrape_main_text(url: str, timeout_sec: float = 20, max_bytes: int = MAX_PAGE_BYTES) -> str:
+    page_cache = get_page_cache()
+    row = html_hash = None
+    if page_cache is not None:
+        text, headers, row = page_cache.lookup(url)
+        if text is not None:
+            return text
+    else:
+        headers = {"User-Agent": USER_AGENT}
+
+    try:
+        with metrics.span("fetch", provider="web"):
+            status, resp_headers, content, charset = await fetch_capped(page_client(), url, headers, timeout_sec, max_bytes)
+    except NotHTML:
+        if page_cache is not None:
+            page_cache.on_response(url, row, 415, b"")  # negative entry: skip it next time too
+        raise
+    except Exception:
+        stale = page_cache.on_error(url, row) if page_cache is not None else None
+        if stale is not None:
+            return stale
+        raise
+
+    if page_cache is not None:
+        text, html_hash = page_cache.on_response(url, row, status, content)
+        if text is not None:
+            return text
+    elif status >= 300:
+        return ""
+
+    text = await aextract(content.decode(charset or "utf-8", errors="replace"))
+    if page_cache is not None:
+        page_cache.store_extract(url, html_hash, text, resp_headers, status)
+    return text
+
+
+async def asummarize_openai(client: AsyncOpenAI, text: str, model: str = "gpt-4o-mini",
+                            max_output_tokens: int = 220) -> str:
+    cache = get_summary_cache()
+    key = summary_key(text, model, max_output_tokens)
+    cached = cache.get(key)
+    if cached is not None:
+        cache.bump("input_tokens_saved", cached.get("input_tokens", 0))
+        cache.bump("output_tokens_saved", cached.get("output_tokens", 0))
+        return cached["summary"]
+
+    prompt = SUMMARY_PROMPT.format(text=text)
+    with metrics.span("summarize", provider="openai", model=model):
+        resp = await get_resilience().acall(
+            "openai", client.responses.create,
+            model=model,
+            input=prompt,
+            max_output_tokens=max_output_tokens,
+            est_tokens=estimate_tokens(prompt) + max_output_tokens,
+        )
+    summary = (resp.output_text or "").strip()
+    usage = getattr(resp, "usage", None)
+    counted = prompt_usage.record_openai(SUMMARY_VERSION, usage)
+    if counted:
+        metrics.tokens("openai", model, input_tokens=counted[0], cached_tokens=counted[1], output_tokens=counted[2])
+    if summary:
+        cache.set(key, {
+            "summary": summary,
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        })
+    return summary
+
+
+class AsyncHostLimiter:
+    """At most `per_host` concurrent fetches per host, spaced `min_interval` seconds apart."""
+
+    def __init__(self, per_host: int = 1, min_interval: float = 0.0):
+        self.per_host = max(1, per_host)
+        self.min_interval = min_interval
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._last: Dict[str, float] = {}
+
+    async def acquire(self, url: str) -> str:
+        host = (urlsplit(url).hostname or "").lower()
+        await self._slots.setdefault(host, asyncio.Semaphore(self.per_host)).acquire()
+        if self.min_interval:
+            now = time.monotonic()
+            start = max(now, self._last.get(host, 0.0) + self.min_interval)
+            self._last[host] = start
+            if start > now:
+                await asyncio.sleep(start - now)
+        return host
+
+    def release(self, host: str) -> None:
+        self._slots[host].release()
+
+
+async def _aprocess_result(
+    item: Dict[str, Any],
+    client: AsyncOpenAI,
+    limiter: AsyncHostLimiter,
+    query: str,
+    model: str,
+    max_input_tokens: int,
+    max_output_tokens: int,
+    timeout_sec: float,
+    max_page_bytes: int,
+) -> Dict[str, Any]:
+    url = item["url"]
+    if not url or is_probably_non_html(url):
+        item["error"] = "Skip (non-HTML or empty URL)."
+        return item
+
+    try:
+        host = await limiter.acquire(url)
+        try:
+            text = await ascrape_main_text(url, timeout_sec=timeout_sec, max_bytes=max_page_bytes)
+        finally:
+            limiter.release(host)
+        item["extracted_chars"] = len(text)
+
+        if len(text) < 200:
+            item["error"] = "Extract quá ít text (bị chặn / trang JS nặng / không phải bài viết)."
+            return item
+
+        # CPU-bound over the whole page; a thread keeps the loop serving other fetches
+        compressed = await asyncio.to_thread(compress_for_llm, text, query, max_input_tokens, model=model)
+        slim = compressed.text
+        item["sent_chars"] = len(slim)
+        item["tokens_in"] = compressed.tokens_in
+        item["tokens_out"] = compressed.tokens_out
+
+        item["summary"] = await asummarize_openai(client, slim, model=model, max_output_tokens=max_output_tokens)
+
+    except NotHTML as e:
+        item["error"] = f"Skip (non-HTML: {e})."
+    except Exception as e:
+        item["error"] = f"{type(e).__name__}: {e}"
+
+    return item
+
+
+def _ddgs_search(query: str, region: str, backend: str, k: int) -> List[Dict[str, Any]]:
+    with DDGS() as ddgs:
+        return ddgs.text(
+            query=query,
+            region=region,
+            safesearch="moderate",
+            timelimit=None,
+            max_results=k,
+            page=1,
+            backend=backend,
+        )
+
+
+async def agogoduck(
+    query: str,
+    k: int = 2,
+    region: str = "vn-vi",
+    backend: str = "duckduckgo",
+    model: str = "gpt-4o-mini",
+    max_input_chars: int = 12000,
+    max_output_tokens: int = 220,
+    timeout_sec: float = 20,
+    max_input_tokens: Optional[int] = None,
+    api_key: Optional[str] = None,
+    max_workers: int = 4,
+    deadline_sec: Optional[float] = 30,
+    per_host_limit: int = 1,
+    per_host_interval_sec: float = 0.5,
+    max_page_bytes: int = MAX_PAGE_BYTES,
+) -> Dict[str, Any]:
+    """
+    Async gogoduck_trafilatura_openai; same payload, without printing or saving.
+    Each page is compressed to `max_input_tokens` (default max_input_chars / 4)
+    of its passages most relevant to `query` before it is summarized.
+    """
+    started = time.monotonic()
+    budget = max_input_tokens or max_input_chars // 4
+
+    key = api_key or os.getenv("OPENAI_API_KEY2")
+    if not key:
+        raise RuntimeError("Thiếu OPENAI_API_KEY (env) hoặc truyền api_key=... vào hàm.")
+    client = get_registry().async_openai(api_key=key)
+
+    # ddgs is blocking; keep it off the loop
+    with metrics.span("search", provider="ddg", backend=backend):
+        raw = await asyncio.to_thread(_ddgs_search, query, region, backend, k)
+
+    output: List[Dict[str, Any]] = [
+        {
+            "rank": idx,
+            "title": (r.get("title") or "").strip() or "(no title)",
+            "url": (r.get("href") or "").strip(),
+            "snippet": (r.get("body") or "").strip(),
+            "extracted_chars": 0,
+            "sent_chars": 0,
+            "tokens_in": 0,
+            "tokens_out": 0,
+            "summary": "",
+            "error": "",
+        }
+        for idx, r in enumerate(raw, 1)
+    ]
+
+    if output:
+        limiter = AsyncHostLimiter(per_host=per_host_limit, min_interval=per_host_interval_sec)
+        workers = asyncio.Semaphore(max(1, max_workers))
+
+        async def work(item: Dict[str, Any]) -> Dict[str, Any]:
+            async with workers:
+                return await _aprocess_result(
+                    item, client, limiter, query, model, budget, max_output_tokens, timeout_sec, max_page_bytes,
+                )
+
+        # tasks fill a copy so a cancelled straggler cannot touch a returned item
+        tasks = {asyncio.create_task(work(dict(item))): item["rank"] for item in output}
+        remaining = None
+        if deadline_sec is not None:
+            remaining = max(0.0, deadline_sec - (time.monotonic() - started))
+        done, pending = await asyncio.wait(tasks, timeout=remaining)
+        for task in done:
+            output[tasks[task] - 1] = task.result()
+        for task in pending:
+            task.cancel()
+            output[tasks[task] - 1]["error"] = f"Timeout: vượt quá deadline {deadline_sec}s của truy vấn."
+
+    return {
+        "query": query,
+        "region": region,
+        "backend": backend,
+        "model": model,
+        "results": output,
+    }
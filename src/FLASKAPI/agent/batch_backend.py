@@ -0,0 +1,270 @@
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+from .clients import get_registry
+from .models import RubricScore, StudentCase, improving
+from .prompts import TEMPLATES, prompt_usage
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+# stage -> (output schema, system prompt, user prompt builder); the same templates as the interactive path
+BATCH_STAGES: Dict[str, Tuple[Type[BaseModel], str, Callable[[StudentCase], str]]] = {
+    "rubric": (
+        RubricScore,
+        TEMPLATES["rubric"].system,
+        lambda case: TEMPLATES["rubric"].user(case.potential, case.personal),
+    ),
+    "case": (
+        improving,
+        TEMPLATES["case"].system,
+        lambda case: TEMPLATES["case"].user(case),
+    ),
+}
+
+
+def _strict_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    schema = model.model_json_schema()
+    schema["additionalProperties"] = False
+    schema["required"] = list(schema.get("properties", {}))
+    return schema
+
+
+def build_request(custom_id: str, stage: str, case: StudentCase, model: str = "gpt-4o-mini",
+                  temperature: float = 0.1) -> Dict[str, Any]:
+    schema_model, system, user = BATCH_STAGES[stage]
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model,
+            "temperature": temperature,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user(case)},
+            ],
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": schema_model.__name__, "schema": _strict_schema(schema_model), "strict": True},
+            },
+        },
+    }
+
+
+def parse_output_line(line: Dict[str, Any]) -> Tuple[str, Optional[BaseModel], Optional[str]]:
+    """(custom_id, parsed model or None, error or None) for one output/error file line."""
+    custom_id = line.get("custom_id", "")
+    stage = custom_id.rsplit("::", 1)[-1]
+    if line.get("error"):
+        return custom_id, None, json.dumps(line["error"], ensure_ascii=False)
+    response = line.get("response") or {}
+    if response.get("status_code") != 200:
+        return custom_id, None, f"HTTP {response.get('status_code')}: {json.dumps(response.get('body'), ensure_ascii=False)[:300]}"
+    if stage not in BATCH_STAGES:
+        return custom_id, None, f"unknown stage {stage!r}"
+    try:
+        content = response["body"]["choices"][0]["message"]["content"]
+        usage = response["body"].get("usage") or {}
+        prompt_usage.record(
+            TEMPLATES[stage].version,
+            usage.get("prompt_tokens", 0),
+            (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+            usage.get("completion_tokens", 0),
+        )
+        return custom_id, BATCH_STAGES[stage][0].model_validate_json(content), None
+    except (KeyError, IndexError, TypeError, ValidationError, ValueError) as e:
+        return custom_id, None, f"{type(e).__name__}: {e}"
+
+
+class ProviderBatchBackend:
+    """
+    Offline execution backend for OpenAI's Batch API, next to WorkFlow's
+    interactive path: pack rubric/case prompts into a JSONL batch file, submit
+    it, poll until it is terminal, then parse the structured outputs back one
+    item at a time (a bad item never sinks the rest).
+    """
+
+    def __init__(self, client: Any = None, model: str = "gpt-4o-mini", poll_interval: float = 30.0,
+                 completion_window: str = "24h"):
+        self.client = client or get_registry().openai(api_key=os.getenv("OPENAI_API_KEY"))
+        self.model = model
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    def build_file(self, items: Iterable[Tuple[str, StudentCase]], stages=("rubric",)) -> io.BytesIO:
+        buf = io.BytesIO()
+        for record_id, case in items:
+            for stage in stages:
+                line = build_request(f"{record_id}::{stage}", stage, case, model=self.model)
+                buf.write((json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8"))
+        buf.seek(0)
+        buf.name = "batch.jsonl"
+        return buf
+
+    def submit(self, batch_file: io.BytesIO, metadata: Optional[Dict[str, str]] = None) -> str:
+        uploaded = self.client.files.create(file=batch_file, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+            metadata=metadata,
+        )
+        return batch.id
+
+    def wait(self, batch_id: str, timeout: Optional[float] = None, verbose: bool = True) -> Any:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if verbose:
+                counts = getattr(batch, "request_counts", None)
+                print(f"[batch {batch_id}] {batch.status} {counts or ''}")
+            if batch.status in TERMINAL:
+                return batch
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"batch {batch_id} still {batch.status}")
+            time.sleep(self.poll_interval)
+
+    def results(self, batch: Any) -> Iterator[Tuple[str, Optional[BaseModel], Optional[str]]]:
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for raw in self.client.files.content(file_id).text.splitlines():
+                if raw.strip():
+                    yield parse_output_line(json.loads(raw))
+
+    def run(self, items: Iterable[Tuple[str, StudentCase]], stages=("rubric",), timeout: Optional[float] = None,
+            on_submit: Optional[Callable[[str], None]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Submit, wait and return {record_id: {stage: model, "errors": {stage: msg}}}.
+        `on_submit(batch_id)` runs before waiting, so a caller can record the id
+        and collect() the batch later if the wait times out.
+        """
+        items = list(items)
+        batch_id = self.submit(self.build_file(items, stages))
+        if on_submit is not None:
+            on_submit(batch_id)
+        return self.collect(batch_id, [record_id for record_id, _ in items], stages=stages, timeout=timeout)
+
+    def collect(self, batch_id: str, record_ids: Iterable[str], stages=("rubric",),
+                timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Wait for an already submitted batch and parse it like run()."""
+        record_ids = list(record_ids)
+        batch = self.wait(batch_id, timeout=timeout)
+        out: Dict[str, Dict[str, Any]] = {record_id: {"errors": {}} for record_id in record_ids}
+        seen = set()
+        for custom_id, parsed, error in self.results(batch):
+            record_id, _, stage = custom_id.rpartition("::")
+            seen.add(custom_id)
+            entry = out.setdefault(record_id, {"errors": {}})
+            if error:
+                entry["errors"][stage] = error
+            else:
+                entry[stage] = parsed
+        for record_id in record_ids:
+            for stage in stages:
+                if f"{record_id}::{stage}" not in seen:
+                    out[record_id]["errors"][stage] = f"missing from batch output ({batch.status})"
+        return out
+
+
+class FakeBatchServer:
+    """
+    Local stand-in for the Files + Batches endpoints, for tests and dry runs.
+    `responder(request_line) -> body | Exception` produces each chat completion;
+    the default fills every schema field with a zero value. Batches complete
+    after `latency` seconds of wall time.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict[str, Any]], Any]] = None, latency: float = 0.0):
+        self.responder = responder or self._zero_responder
+        self.latency = latency
+        self._files: Dict[str, str] = {}
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.files = _FakeFiles(self)
+        self.batches = _FakeBatches(self)
+
+    def client(self) -> "FakeBatchServer":
+        return self
+
+    @staticmethod
+    def _zero_responder(line: Dict[str, Any]) -> Dict[str, Any]:
+        schema = line["body"]["response_format"]["json_schema"]["schema"]
+        zero = {"integer": 0, "number": 0, "string": "", "boolean": False}
+        content = {k: zero.get(v.get("type"), None) for k, v in schema["properties"].items()}
+        return {"choices": [{"message": {"role": "assistant", "content": json.dumps(content)}}]}
+
+    def _new_id(self, prefix: str) -> str:
+        return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+    def _run_batch(self, batch: Dict[str, Any]) -> None:
+        out, err = [], []
+        for raw in self._files[batch["input_file_id"]].splitlines():
+            if not raw.strip():
+                continue
+            line = json.loads(raw)
+            try:
+                body = self.responder(line)
+                if isinstance(body, Exception):
+                    raise body
+                out.append({"id": self._new_id("resp"), "custom_id": line["custom_id"],
+                            "response": {"status_code": 200, "body": body}, "error": None})
+            except Exception as e:
+                err.append({"id": self._new_id("resp"), "custom_id": line["custom_id"], "response": None,
+                            "error": {"code": type(e).__name__, "message": str(e)}})
+        batch["output_file_id"] = self._store("\n".join(json.dumps(x) for x in out)) if out else None
+        batch["error_file_id"] = self._store("\n".join(json.dumps(x) for x in err)) if err else None
+        batch["request_counts"] = {"total": len(out) + len(err), "completed": len(out), "failed": len(err)}
+        batch["status"] = "completed"
+
+    def _store(self, text: str) -> str:
+        file_id = self._new_id("file")
+        with self._lock:
+            self._files[file_id] = text
+        return file_id
+
+
+class _Obj(dict):
+    __getattr__ = dict.get
+
+
+class _FakeFiles:
+    def __init__(self, server: FakeBatchServer):
+        self.server = server
+
+    def create(self, file, purpose: str):
+        data = file.read()
+        text = data.decode("utf-8") if isinstance(data, bytes) else data
+        return _Obj(id=self.server._store(text), purpose=purpose)
+
+    def content(self, file_id: str):
+        return _Obj(text=self.server._files[file_id])
+
+
+class _FakeBatches:
+    def __init__(self, server: FakeBatchServer):
+        self.server = server
+
+    def create(self, input_file_id: str, endpoint: str, completion_window: str, metadata=None):
+        batch = {
+            "id": self.server._new_id("batch"), "status": "in_progress", "endpoint": endpoint,
+            "input_file_id": input_file_id, "output_file_id": None, "error_file_id": None,
+            "created_at": time.time(), "metadata": metadata,
+        }
+        with self.server._lock:
+            self.server._batches[batch["id"]] = batch
+        return _Obj(batch)
+
+    def retrieve(self, batch_id: str):
+        batch = self.server._batches[batch_id]
+        if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.server.latency:
+            self.server._run_batch(batch)
+        return _Obj(batch)
@@ -0,0 +1,358 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+BASE_DIR = Path(__file__).parent.parent
+DEFAULT_CACHE_DIR = BASE_DIR / "data" / "cache"
+SWEEP_EVERY = 100  # writes between eviction sweeps; the backends may overshoot max_entries by this much
+
+
+def canonical(value: Any) -> Any:
+    """Turn pydantic models / nested containers into plain, key-stable JSON data."""
+    if isinstance(value, BaseModel):
+        return canonical(value.model_dump())
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    if hasattr(value, "content") and hasattr(value, "type"):  # langchain messages
+        return {"type": value.type, "content": value.content}
+    return value
+
+
+def content_key(*parts: Any) -> str:
+    raw = json.dumps([canonical(p) for p in parts], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryLRUBackend:
+    def __init__(self, max_entries: int = 512, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """JSON values in a WAL-mode SQLite file, safe to share between gunicorn workers."""
+
+    def __init__(self, path: Path, table: str = "cache", ttl: Optional[float] = None, max_entries: int = 50000):
+        self.path = Path(path)
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, created_at REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_expires ON {self.table} (expires_at)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_created ON {self.table} (created_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn().execute(
+            f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None, now),
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % SWEEP_EVERY == 0
+        if sweep:
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+        (count,) = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                "ORDER BY created_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        conn.commit()
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        conn.commit()
+
+    def clear(self) -> None:
+        conn = self._conn()
+        conn.execute(f"DELETE FROM {self.table}")
+        conn.commit()
+
+    def __len__(self) -> int:
+        return self._conn().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class FileBackend:
+    """One JSON file per key under a sharded directory; writes are atomic (temp file + rename)."""
+
+    def __init__(self, root: Path, ttl: Optional[float] = None, max_entries: int = 50000):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry.get("expires_at") is not None and entry["expires_at"] < time.time():
+            self.delete(key)
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(
+            json.dumps({"value": value, "expires_at": time.time() + ttl if ttl else None}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        os.replace(tmp, path)
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % SWEEP_EVERY == 0
+        if sweep:
+            self._evict()
+
+    def _evict(self) -> None:
+        files = sorted(self.root.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        for path in files[: max(0, len(files) - self.max_entries)]:
+            path.unlink(missing_ok=True)
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        for path in self.root.glob("*/*.json"):
+            path.unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.root.glob("*/*.json"))
+
+
+class TieredBackend:
+    """Memory LRU in front of a shared backend; disk hits are promoted to memory."""
+
+    def __init__(self, front: MemoryLRUBackend, back: Any):
+        self.front = front
+        self.back = back
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.front.get(key)
+        if value is None:
+            value = self.back.get(key)
+            if value is not None:
+                self.front.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.front.set(key, value, ttl)
+        self.back.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.front.delete(key)
+        self.back.delete(key)
+
+    def clear(self) -> None:
+        self.front.clear()
+        self.back.clear()
+
+    def __len__(self) -> int:
+        return len(self.back)
+
+
+class Cache:
+    """Thin counter-keeping wrapper; values must be JSON-serialisable."""
+
+    def __init__(self, backend: Any = None, name: str = "cache"):
+        self.backend = backend
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"[{self.name}] get failed: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception as e:
+            print(f"[{self.name}] set failed: {e}")
+            return
+        with self._lock:
+            self.sets += 1
+
+    def bump(self, name: str, amount: int = 1) -> None:
+        """Cache-specific counters, e.g. tokens saved by a hit."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def clear(self) -> None:
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        try:
+            size = len(self.backend) if self.backend is not None else 0
+        except Exception:
+            size = None
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "entries": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "sets": self.sets,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            **self.counters,
+        }
+
+
+def build_cache(name: str, prefix: str, default_ttl: float, default_size: int = 512) -> Cache:
+    """
+    Build a cache from <PREFIX>_BACKEND (none | memory | sqlite | file), <PREFIX>_TTL,
+    <PREFIX>_SIZE and <PREFIX>_PATH environment variables.
+    """
+    kind = os.getenv(f"{prefix}_BACKEND", "memory").lower()
+    ttl = float(os.getenv(f"{prefix}_TTL", default_ttl)) or None
+    size = int(os.getenv(f"{prefix}_SIZE", default_size))
+    if kind in ("none", "off", ""):
+        return Cache(None, name)
+    memory = MemoryLRUBackend(max_entries=size, ttl=ttl)
+    if kind == "sqlite":
+        path = Path(os.getenv(f"{prefix}_PATH", DEFAULT_CACHE_DIR / f"{name}.sqlite"))
+        return Cache(TieredBackend(memory, SQLiteBackend(path, ttl=ttl)), name)
+    if kind == "file":
+        path = Path(os.getenv(f"{prefix}_PATH", DEFAULT_CACHE_DIR / name))
+        return Cache(TieredBackend(memory, FileBackend(path, ttl=ttl)), name)
+    return Cache(memory, name)
+
+
+_stage_cache: Optional[Cache] = None
+_stage_cache_lock = threading.Lock()
+
+
+def get_stage_cache() -> Cache:
+    global _stage_cache
+    if _stage_cache is None:
+        with _stage_cache_lock:
+            if _stage_cache is None:
+                _stage_cache = build_cache("stages", "STAGE_CACHE", default_ttl=24 * 3600)
+    return _stage_cache
+
+
+_summary_cache: Optional[Cache] = None
+_summary_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> Cache:
+    global _summary_cache
+    if _summary_cache is None:
+        with _summary_cache_lock:
+            if _summary_cache is None:
+                _summary_cache = build_cache("summaries", "SUMMARY_CACHE", default_ttl=30 * 24 * 3600, default_size=2048)
+    return _summary_cache
@@ -0,0 +1,189 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAI
+from openai import AsyncOpenAI, OpenAI
+
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class ClientRegistry:
+    """
+    Long-lived LLM / HTTP clients shared by every request in one worker process.
+
+    Each provider gets its own keep-alive httpx pool so connections (and TLS
+    sessions) survive between requests. Structured-output wrappers are cached
+    per (llm, schema) because with_structured_output rebuilds the runnable on
+    every call.
+    """
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or _env_int("LLM_POOL_MAX_CONNECTIONS", 20),
+            max_keepalive_connections=max_keepalive_connections or _env_int("LLM_POOL_MAX_KEEPALIVE", 10),
+            keepalive_expiry=keepalive_expiry or _env_float("LLM_POOL_KEEPALIVE_EXPIRY", 30.0),
+        )
+        self.timeout = httpx.Timeout(timeout or _env_float("LLM_HTTP_TIMEOUT", 60.0))
+        self._lock = threading.RLock()
+        self._http: Dict[str, httpx.Client] = {}
+        self._ahttp: Dict[str, httpx.AsyncClient] = {}
+        self._clients: Dict[Hashable, Any] = {}
+        self._structured: Dict[Hashable, Any] = {}
+
+    def _get_or_create(self, store: Dict, key: Hashable, factory: Callable[[], Any]):
+        client = store.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = store.get(key)
+            if client is None:
+                client = factory()
+                store[key] = client
+            return client
+
+    # ---- raw HTTP pools ----
+    def http_client(self, name: str) -> httpx.Client:
+        return self._get_or_create(
+            self._http, name,
+            lambda: httpx.Client(limits=self.limits, timeout=self.timeout),
+        )
+
+    def async_http_client(self, name: str, http2: bool = False) -> httpx.AsyncClient:
+        # an AsyncClient belongs to the event loop that first uses it; only share
+        # one between callers running on the same long-lived loop
+        return self._get_or_create(
+            self._ahttp, name,
+            lambda: httpx.AsyncClient(limits=self.limits, timeout=self.timeout, http2=http2),
+        )
+
+    # ---- provider clients ----
+    def chat_openai(self, model: str = "gpt-4o-mini", temperature: float = 0.1) -> ChatOpenAI:
+        return self._get_or_create(
+            self._clients, ("chat_openai", model, temperature),
+            lambda: ChatOpenAI(
+                model=model,
+                temperature=temperature,
+                max_retries=0,  # retries belong to agent.resilience
+                http_client=self.http_client("openai"),
+                http_async_client=self.async_http_client("openai"),
+            ),
+        )
+
+    def gemini(self, model: str = "gemini-2.5-flash", temperature: float = 0.3) -> GoogleGenerativeAI:
+        # The Gemini SDK manages its own transport; reusing the instance keeps its channel warm.
+        return self._get_or_create(
+            self._clients, ("gemini", model, temperature),
+            lambda: GoogleGenerativeAI(
+                model=model, temperature=temperature, api_key=os.getenv("GEMINI_API_KEY"),
+                max_retries=0,  # retries belong to agent.resilience
+            ),
+        )
+
+    def gemini_chat(self, model: str = "gemini-2.5-flash", temperature: float = 0.3) -> ChatGoogleGenerativeAI:
+        # chat flavour of gemini(); needed for with_structured_output
+        return self._get_or_create(
+            self._clients, ("gemini_chat", model, temperature),
+            lambda: ChatGoogleGenerativeAI(
+                model=model, temperature=temperature, api_key=os.getenv("GEMINI_API_KEY"),
+                max_retries=0,  # retries belong to agent.resilience
+            ),
+        )
+
+    def openai(self, api_key: Optional[str] = None) -> OpenAI:
+        key = api_key or os.getenv("OPENAI_API_KEY2")
+        return self._get_or_create(
+            self._clients, ("openai", key),
+            lambda: OpenAI(api_key=key, max_retries=0, http_client=self.http_client("openai_engine")),
+        )
+
+    def async_openai(self, api_key: Optional[str] = None) -> AsyncOpenAI:
+        key = api_key or os.getenv("OPENAI_API_KEY2")
+        return self._get_or_create(
+            self._clients, ("async_openai", key),
+            lambda: AsyncOpenAI(api_key=key, max_retries=0, http_client=self.async_http_client("openai_engine")),
+        )
+
+    def structured(self, llm: Any, schema: type, include_raw: bool = False) -> Any:
+        # include_raw keeps the AIMessage (and its token usage) next to the parsed object
+        return self._get_or_create(
+            self._structured, (id(llm), schema, include_raw),
+            lambda: llm.with_structured_output(schema, include_raw=include_raw),
+        )
+
+    # ---- introspection ----
+    @staticmethod
+    def _pool_usage(client: Any) -> Dict[str, int]:
+        # httpcore keeps the pool on the transport; these are not public attributes.
+        try:
+            connections = list(client._transport._pool.connections)
+        except AttributeError:
+            return {}
+        idle = sum(1 for c in connections if c.is_idle())
+        return {"connections": len(connections), "idle": idle, "active": len(connections) - idle}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "limits": {
+                    "max_connections": self.limits.max_connections,
+                    "max_keepalive_connections": self.limits.max_keepalive_connections,
+                    "keepalive_expiry": self.limits.keepalive_expiry,
+                },
+                "http": {name: self._pool_usage(c) for name, c in self._http.items()},
+                "async_http": {name: self._pool_usage(c) for name, c in self._ahttp.items()},
+                # never echo the api key that keys the raw OpenAI client
+                "clients": [k[0] if k[0] in ("openai", "async_openai") else f"{k[0]}:{k[1]}" for k in self._clients],
+                "structured_wrappers": len(self._structured),
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            for c in self._http.values():
+                c.close()
+            self._http.clear()
+            self._ahttp.clear()
+            self._clients.clear()
+            self._structured.clear()
+
+
+_registry: Optional[ClientRegistry] = None
+_registry_pid: Optional[int] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ClientRegistry:
+    """Process-wide registry; rebuilt after fork so gunicorn workers never share sockets."""
+    global _registry, _registry_pid
+    pid = os.getpid()
+    if _registry is not None and _registry_pid == pid:
+        return _registry
+    with _registry_lock:
+        if _registry is None or _registry_pid != pid:
+            _registry = ClientRegistry()
+            _registry_pid = pid
+        return _registry
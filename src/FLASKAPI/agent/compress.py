@@ -0,0 +1,263 @@
+"""
+Token-budgeted page compression before summarization.
+
+    python -m agent.compress page.txt --query "supply chain certificate" --budget 1500
+
+prints what each compressor keeps and the tokens in/out, to compare summary
+cost per page between the old head/tail cut and relevance-ranked passages.
+"""
+import argparse
+import math
+import os
+import re
+import threading
+from collections import Counter, deque
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from .extract import compress_text_for_llm
+from .localindex import tokenize
+
+
+# ---- token counting ----
+class TokenCounter:
+    def __init__(self, name: str, count: Callable[[str], int]):
+        self.name = name
+        self.count = count
+
+
+def _approx(text: str) -> int:
+    # same ~4 chars/token rule as resilience.estimate_tokens
+    return len(text) // 4 + 1 if text else 0
+
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+
+def get_token_counter(model: str = "gpt-4o-mini") -> TokenCounter:
+    """tiktoken's encoding for `model`, or a chars/4 estimate when tiktoken (or its data) is unavailable."""
+    counter = _counters.get(model)
+    if counter is not None:
+        return counter
+    with _counters_lock:
+        if model not in _counters:
+            try:
+                import tiktoken
+
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("o200k_base")
+                _counters[model] = TokenCounter(
+                    f"tiktoken:{encoding.name}", lambda text: len(encoding.encode(text, disallowed_special=()))
+                )
+            except Exception as e:  # not installed, or the BPE file cannot be downloaded
+                print(f"[compress] tiktoken unavailable for {model} ({type(e).__name__}); estimating tokens")
+                _counters[model] = TokenCounter("approx", _approx)
+        return _counters[model]
+
+
+# ---- passages ----
+def split_passages(text: str, max_tokens: int, counter: TokenCounter) -> List[str]:
+    """Paragraphs (trafilatura emits one per line); long ones are split at sentence ends."""
+    passages = []
+    for para in re.split(r"\n+", text or ""):
+        para = re.sub(r"\s+", " ", para).strip()
+        if not para:
+            continue
+        if counter.count(para) <= max_tokens:
+            passages.append(para)
+            continue
+        chunk = ""
+        for sentence in re.split(r"(?<=[.!?…])\s+", para):
+            candidate = f"{chunk} {sentence}".strip()
+            if chunk and counter.count(candidate) > max_tokens:
+                passages.append(chunk)
+                chunk = sentence
+            else:
+                chunk = candidate
+        if chunk:
+            passages.append(chunk)
+    return passages
+
+
+def _shingles(terms: List[str], n: int = 3) -> set:
+    if len(terms) < n:
+        return {" ".join(terms)}
+    return {" ".join(terms[i:i + n]) for i in range(len(terms) - n + 1)}
+
+
+def dedupe(passages: List[List[str]], threshold: float = 0.8, window: int = 32) -> List[int]:
+    """
+    Indexes of passages to keep: drop exact repeats anywhere on the page, and
+    any passage whose 3-gram Jaccard with one of the last `window` kept ones is
+    >= threshold. Near-duplicates (repeated blocks, pagination echoes) sit close
+    together, and the window keeps this linear in the page length.
+    """
+    kept: List[int] = []
+    seen: set = set()
+    recent: Deque[set] = deque(maxlen=window)
+    for i, terms in enumerate(passages):
+        if not terms:
+            continue
+        digest = hash(tuple(terms))
+        if digest in seen:
+            continue
+        sh = _shingles(terms)
+        if any(len(sh & other) / len(sh | other) >= threshold for other in recent):
+            continue
+        kept.append(i)
+        seen.add(digest)
+        recent.append(sh)
+    return kept
+
+
+def bm25_scores(query_terms: List[str], docs: List[List[str]], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    n = len(docs)
+    if not n or not query_terms:
+        return [0.0] * n
+    avgdl = sum(len(d) for d in docs) / n or 1
+    df = Counter(t for d in docs for t in set(d))
+    scores = []
+    for d in docs:
+        tf = Counter(d)
+        score = 0.0
+        for t in set(query_terms):
+            if tf[t]:
+                idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+                score += idf * tf[t] * (k1 + 1) / (tf[t] + k1 * (1 - b + b * len(d) / avgdl))
+        scores.append(score)
+    return scores
+
+
+@dataclass
+class Compressed:
+    text: str
+    tokens_in: int
+    tokens_out: int
+    passages_in: int = 0
+    passages_kept: int = 0
+    duplicates: int = 0
+    compressor: str = ""
+
+
+# ---- compressors ----
+class HeadTailCompressor:
+    """The original cut: first 65% / last 35% of the character budget (~4 chars per token)."""
+
+    name = "headtail"
+
+    def compress(self, text: str, query: str, budget_tokens: int, counter: TokenCounter) -> Compressed:
+        slim = compress_text_for_llm(text, budget_tokens * 4)
+        return Compressed(slim, counter.count(text), counter.count(slim), compressor=self.name)
+
+
+class BM25Compressor:
+    """
+    Near-duplicate paragraphs are dropped, the rest ranked by BM25 against the
+    query and added greedily while they fit the token budget, then emitted in
+    their original order. Without query matches the lead of the page wins.
+    Only the first `max_input_multiple` budgets' worth of characters are read,
+    so a 2 MB page costs no more than a long article.
+    """
+
+    name = "bm25"
+
+    def __init__(self, max_passage_tokens: int = 200, dup_threshold: float = 0.8, max_input_multiple: int = 8):
+        self.max_passage_tokens = max_passage_tokens
+        self.dup_threshold = dup_threshold
+        self.max_input_multiple = max_input_multiple
+
+    def compress(self, text: str, query: str, budget_tokens: int, counter: TokenCounter) -> Compressed:
+        text = (text or "")[:budget_tokens * 4 * self.max_input_multiple]  # ~4 chars per token
+        tokens_in = counter.count(text)
+        if tokens_in <= budget_tokens:
+            slim = re.sub(r"\s+", " ", text or "").strip()
+            return Compressed(slim, tokens_in, counter.count(slim), compressor=self.name)
+
+        passages = split_passages(text, self.max_passage_tokens, counter)
+        terms = [tokenize(p) for p in passages]
+        keep = dedupe(terms, self.dup_threshold)
+        scores = bm25_scores(tokenize(query), [terms[i] for i in keep])
+        # relevance first; position breaks ties, so the lead wins when nothing matches
+        ranked = sorted(range(len(keep)), key=lambda j: (-scores[j], keep[j]))
+
+        chosen, used = [], 0
+        for j in ranked:
+            cost = counter.count(passages[keep[j]]) + 1  # +1 for the joining newline
+            if used + cost <= budget_tokens:
+                chosen.append(keep[j])
+                used += cost
+        slim = "\n".join(passages[i] for i in sorted(chosen))
+        return Compressed(
+            slim, tokens_in, counter.count(slim),
+            passages_in=len(passages), passages_kept=len(chosen),
+            duplicates=len(passages) - len(keep), compressor=self.name,
+        )
+
+
+COMPRESSORS = {"headtail": HeadTailCompressor, "bm25": BM25Compressor}
+
+
+class CompressionStats:
+    def __init__(self):
+        self.pages = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self._lock = threading.Lock()
+
+    def add(self, result: Compressed) -> None:
+        with self._lock:
+            self.pages += 1
+            self.tokens_in += result.tokens_in
+            self.tokens_out += result.tokens_out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pages": self.pages,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "ratio": round(self.tokens_out / self.tokens_in, 4) if self.tokens_in else 0.0,
+            }
+
+
+compression_stats = CompressionStats()
+_compressor: Optional[Any] = None
+
+
+def get_compressor() -> Any:
+    """Compressor named by TEXT_COMPRESSOR (bm25 | headtail)."""
+    global _compressor
+    if _compressor is None:
+        _compressor = COMPRESSORS[os.getenv("TEXT_COMPRESSOR", "bm25").lower()]()
+    return _compressor
+
+
+def compress_for_llm(text: str, query: str, budget_tokens: int, model: str = "gpt-4o-mini") -> Compressed:
+    result = get_compressor().compress(text, query, budget_tokens, get_token_counter(model))
+    compression_stats.add(result)
+    return result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Compare page compressors on one extracted text.")
+    parser.add_argument("path", help="UTF-8 text file (e.g. a trafilatura extract)")
+    parser.add_argument("--query", default="")
+    parser.add_argument("--budget", type=int, default=3000, help="token budget")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    args = parser.parse_args(argv)
+
+    with open(args.path, encoding="utf-8") as f:
+        text = f.read()
+    counter = get_token_counter(args.model)
+    print(f"[counter] {counter.name}")
+    for name, cls in COMPRESSORS.items():
+        result = cls().compress(text, args.query, args.budget, counter)
+        report = {k: v for k, v in asdict(result).items() if k != "text"}
+        print(f"\n== {name}: {report}\n{result.text[:600]}")
+
+
+if __name__ == "__main__":
+    main()
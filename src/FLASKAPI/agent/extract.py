@@ -0,0 +1,282 @@
+"""
+HTML -> main text, kept free of network/LLM imports so extraction worker
+processes start light.
+"""
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from trafilatura import extract
+from trafilatura.settings import DEFAULT_CONFIG
+
+
+# leading bytes of formats that are never worth handing to trafilatura
+MAGIC_PREFIXES = (
+    (b"%PDF", "pdf"), (b"PK\x03\x04", "zip/office"), (b"\xd0\xcf\x11\xe0", "ole/office"),
+    (b"\x89PNG", "png"), (b"GIF8", "gif"), (b"\xff\xd8\xff", "jpeg"), (b"RIFF", "riff"),
+    (b"\x1f\x8b", "gzip"), (b"ID3", "mp3"), (b"\x00\x00\x01\x00", "ico"), (b"OggS", "ogg"),
+    (b"\x7fELF", "elf"), (b"MZ", "exe"),
+)
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "application/xml", "text/xml")
+
+
+class NotHTML(Exception):
+    """The response is not an HTML page (by Content-Type or magic bytes)."""
+
+
+def sniff_non_html(content_type: Optional[str], head: bytes = b"") -> Optional[str]:
+    """Why a response is not HTML, or None if it may be."""
+    mime = (content_type or "").split(";", 1)[0].strip().lower()
+    if mime and mime not in HTML_CONTENT_TYPES:
+        return f"content-type {mime}"
+    head = head.lstrip()[:16]
+    for magic, kind in MAGIC_PREFIXES:
+        if head.startswith(magic):
+            return f"{kind} bytes"
+    if head[4:8] == b"ftyp":
+        return "mp4 bytes"
+    return None
+
+
+def truncate_html(html: str, max_chars: int) -> str:
+    """Cut an oversized document at the last tag boundary before `max_chars`."""
+    if len(html) <= max_chars:
+        return html
+    cut = html.rfind(">", 0, max_chars)
+    return html[: cut + 1 if cut > 0 else max_chars]
+
+
+def is_probably_non_html(url: str) -> bool:
+    u = (url or "").lower()
+    return any(u.endswith(ext) for ext in [".pdf", ".doc", ".docx", ".ppt", ".pptx", ".xls", ".xlsx"])
+
+
+def compress_text_for_llm(text: str, max_chars: int) -> str:
+    text = re.sub(r"\s+", " ", (text or "")).strip()
+    if len(text) <= max_chars:
+        return text
+    head = int(max_chars * 0.65)
+    tail = max_chars - head
+    return text[:head] + " ... [TRUNCATED MIDDLE] ... " + text[-tail:]
+
+
+def extract_main_text(html: str, config=None) -> str:
+    text = extract(
+        html,
+        include_comments=False,
+        include_tables=False,
+        favor_precision=True,
+        deduplicate=True,
+        config=config or DEFAULT_CONFIG,
+    )
+    return (text or "").strip()
+
+
+class ExtractTimeout(Exception):
+    """The worker did not finish in time and was killed."""
+
+
+class ExtractCrashed(Exception):
+    """The worker died mid-task (CPU or memory limit, or a crash) and was replaced."""
+
+
+def _limit_worker(max_memory_mb: int) -> None:
+    try:
+        import resource
+    except ImportError:  # resource is POSIX-only
+        return
+    if max_memory_mb:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _set_cpu_budget(cpu_sec: float) -> None:
+    # RLIMIT_CPU counts the process's whole life, so move the soft limit to
+    # "used so far + budget" before every task; going over sends SIGXCPU.
+    try:
+        import resource
+    except ImportError:
+        return
+    if cpu_sec:
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        spent = used.ru_utime + used.ru_stime
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = int(spent + cpu_sec) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+
+
+def _worker_main(conn, max_memory_mb: int, cpu_sec: float) -> None:
+    _limit_worker(max_memory_mb)
+    while True:
+        try:
+            html = conn.recv()
+        except EOFError:
+            return
+        if html is None:
+            return
+        _set_cpu_budget(cpu_sec)
+        try:
+            conn.send(("ok", extract_main_text(html)))
+        except MemoryError:
+            conn.send(("error", "MemoryError: page too large for the extraction worker"))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, ctx, max_memory_mb: int, cpu_sec: float):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child, max_memory_mb, cpu_sec), daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ExtractPool:
+    """
+    Fixed set of extraction worker processes with hard limits.
+
+    Each worker runs under an address-space cap (max_memory_mb) and a CPU-time
+    budget per task (cpu_sec). The caller waits at most `timeout` wall seconds;
+    a worker that overruns, crashes or trips a limit is killed and replaced, so
+    one pathological page costs one task, never the pool. Input is truncated to
+    `max_html_chars` before it is sent.
+    """
+
+    def __init__(self, workers: int = 2, max_memory_mb: int = 512, cpu_sec: float = 10.0,
+                 timeout: float = 15.0, max_html_chars: int = 1_500_000):
+        self.size = max(1, workers)
+        self.max_memory_mb = max_memory_mb
+        self.cpu_sec = cpu_sec
+        self.timeout = timeout
+        self.max_html_chars = max_html_chars
+        # spawned, not forked, so workers never inherit the server's threads and sockets
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self.counters = {"tasks": 0, "errors": 0, "timeouts": 0, "crashes": 0, "replaced": 0, "truncated": 0,
+                         "busy_wait_sec": 0.0}
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def _checkout(self) -> _Worker:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._started < self.size:
+                self._started += 1
+                return _Worker(self._ctx, self.max_memory_mb, self.cpu_sec)
+        start = time.monotonic()
+        worker = self._idle.get()
+        self._count("busy_wait_sec", time.monotonic() - start)
+        return worker
+
+    def _replace(self, worker: _Worker) -> None:
+        worker.kill()
+        self._count("replaced")
+        self._idle.put(_Worker(self._ctx, self.max_memory_mb, self.cpu_sec))
+
+    def extract(self, html: str, timeout: Optional[float] = None) -> str:
+        """extract_main_text in a worker process; blocks the calling thread only."""
+        timeout = self.timeout if timeout is None else timeout
+        if len(html) > self.max_html_chars:
+            html = truncate_html(html, self.max_html_chars)
+            self._count("truncated")
+        self._count("tasks")
+        worker = self._checkout()
+        try:
+            worker.conn.send(html)
+            if not worker.conn.poll(timeout):
+                self._count("timeouts")
+                self._replace(worker)
+                raise ExtractTimeout(f"extraction exceeded {timeout}s")
+            status, value = worker.conn.recv()
+        except (EOFError, OSError, BrokenPipeError) as e:
+            self._count("crashes")
+            self._replace(worker)
+            raise ExtractCrashed(f"extraction worker died (exit code {worker.process.exitcode})") from e
+        self._idle.put(worker)
+        if status != "ok":
+            self._count("errors")
+            raise RuntimeError(value)
+        return value
+
+    def warm(self) -> None:
+        """Start every worker and run one tiny page through each, so no request pays for the spawn."""
+        with self._lock:
+            fresh = [_Worker(self._ctx, self.max_memory_mb, self.cpu_sec) for _ in range(self.size - self._started)]
+            self._started = self.size
+        for worker in fresh:
+            try:
+                worker.conn.send("<html><body><p>warm</p></body></html>")
+                if not worker.conn.poll(self.timeout):
+                    self._replace(worker)
+                    continue
+                worker.conn.recv()
+            except (EOFError, OSError):
+                self._replace(worker)
+                continue
+            self._idle.put(worker)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        counters["busy_wait_sec"] = round(counters["busy_wait_sec"], 3)
+        return {
+            **counters,
+            "workers": self.size,
+            "started": self._started,
+            "idle": self._idle.qsize(),
+            "max_memory_mb": self.max_memory_mb,
+            "cpu_sec": self.cpu_sec,
+            "timeout": self.timeout,
+        }
+
+    def close(self) -> None:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.kill()
+
+
+_pool: Optional[ExtractPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_extract_pool() -> ExtractPool:
+    """Per-process ExtractPool configured from EXTRACT_* env vars."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ExtractPool(
+                workers=int(os.getenv("EXTRACT_WORKERS", min(4, os.cpu_count() or 1))),
+                max_memory_mb=int(os.getenv("EXTRACT_MAX_MEMORY_MB", 512)),
+                cpu_sec=float(os.getenv("EXTRACT_CPU_SEC", 10)),
+                timeout=float(os.getenv("EXTRACT_TIMEOUT_SEC", 15)),
+                max_html_chars=int(os.getenv("EXTRACT_MAX_HTML_CHARS", 1_500_000)),
+            )
+            _pool_pid = pid
+        return _pool
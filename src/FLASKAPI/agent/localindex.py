@@ -0,0 +1,301 @@
+"""
+Local full-text index of curated resources (books, papers, news, certification
+pages), searched before the live web.
+
+    python -m agent.localindex add ../../result.json saved/*.json
+    python -m agent.localindex search "system analysis certificate" --category certificatin_course
+
+The index is an on-disk BM25 inverted index in SQLite. It grows incrementally:
+every gogoduck payload that _search_information fetches from the web is added,
+and result.json-style payloads (one JSON object, or JSONL) can be loaded with
+`add`.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from .cache import DEFAULT_CACHE_DIR
+from .pagecache import normalize_url
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it", "of", "on",
+    "or", "the", "to", "with", "your", "you",
+    # vietnamese, accents already stripped
+    "va", "cua", "cho", "cac", "nhung", "mot", "la", "de", "voi", "trong", "ve", "ban", "nen", "co", "the",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased, accent-free word tokens, so "chứng chỉ" matches "chung chi"."""
+    text = unicodedata.normalize("NFKD", (text or "").lower().replace("đ", "d"))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [t for t in re.findall(r"\w+", text) if len(t) > 1 and t not in STOPWORDS]
+
+
+class LocalIndex:
+    """
+    BM25 over title + snippet + summary (+ the query that found the page).
+    A search is a hit when at least one document covers `min_coverage` of the
+    query terms; anything weaker is treated as a miss and left to the web.
+    """
+
+    def __init__(self, path: Path, k1: float = 1.2, b: float = 0.75, min_coverage: float = 0.5,
+                 reranker: Any = None):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+        self.min_coverage = min_coverage
+        self.reranker = reranker  # optional agent.semantic embedder
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "added": 0, "updated": 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL UNIQUE, title TEXT NOT NULL,"
+            "snippet TEXT NOT NULL, summary TEXT NOT NULL, category TEXT, source_query TEXT,"
+            "length INTEGER NOT NULL, added_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc_id INTEGER NOT NULL, tf INTEGER NOT NULL,"
+            "PRIMARY KEY (term, doc_id)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    # ---- building ----
+    def add(self, url: str, title: str, snippet: str = "", summary: str = "", category: Optional[str] = None,
+            source_query: str = "") -> bool:
+        """Insert or refresh one document. Returns False when there is nothing to index."""
+        url = (url or "").strip()
+        terms = Counter(tokenize(" ".join((title, snippet, summary, source_query))))
+        if not url or not terms:
+            return False
+        conn = self._conn()
+        with conn:
+            row = conn.execute("SELECT id, category FROM docs WHERE url = ?", (normalize_url(url),)).fetchone()
+            if row is not None:
+                doc_id = row["id"]
+                conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                conn.execute(
+                    "UPDATE docs SET title = ?, snippet = ?, summary = ?, category = ?, source_query = ?, length = ?,"
+                    " added_at = ? WHERE id = ?",
+                    (title, snippet, summary, category or row["category"], source_query,
+                     sum(terms.values()), time.time(), doc_id),
+                )
+            else:
+                doc_id = conn.execute(
+                    "INSERT INTO docs (url, title, snippet, summary, category, source_query, length, added_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (normalize_url(url), title, snippet, summary, category, source_query,
+                     sum(terms.values()), time.time()),
+                ).lastrowid
+            conn.executemany(
+                "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                [(term, doc_id, tf) for term, tf in terms.items()],
+            )
+        self._count("updated" if row is not None else "added")
+        return True
+
+    def add_payload(self, payload: Dict[str, Any], category: Optional[str] = None) -> int:
+        """Index the usable results of one gogoduck_trafilatura_openai payload."""
+        added = 0
+        for item in payload.get("results", []) if isinstance(payload, dict) else []:
+            if not isinstance(item, dict) or item.get("error") or not (item.get("summary") or item.get("snippet")):
+                continue
+            added += self.add(
+                url=item.get("url", ""),
+                title=(item.get("title") or "").strip(),
+                snippet=item.get("snippet", ""),
+                summary=item.get("summary", ""),
+                category=category,
+                source_query=payload.get("query", ""),
+            )
+        return added
+
+    # ---- searching ----
+    def search(self, query: str, category: Optional[str] = None, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Top-k documents shaped like gogoduck result items (plus `score`).
+        Documents indexed without a category match every category.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        conn = self._conn()
+        n_docs, avgdl = conn.execute("SELECT COUNT(*), COALESCE(AVG(length), 0) FROM docs").fetchone()
+        if not n_docs:
+            self._count("misses")
+            return []
+        placeholders = ",".join("?" * len(terms))
+        category_clause = "AND (d.category IS NULL OR d.category = ?)" if category else ""
+        rows = conn.execute(
+            f"SELECT p.term, p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id "
+            f"WHERE p.term IN ({placeholders}) {category_clause}",
+            (*terms, *([category] if category else [])),
+        ).fetchall()
+        df = dict(conn.execute(
+            f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+        ).fetchall())
+
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        for term, doc_id, tf, length in rows:
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / (avgdl or 1)))
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+            matched[doc_id] = matched.get(doc_id, 0) + 1
+
+        needed = math.ceil(self.min_coverage * len(terms))
+        candidates = [d for d in scores if matched[d] >= needed]
+        if not candidates:
+            self._count("misses")
+            return []
+        candidates.sort(key=lambda d: -scores[d])
+        candidates = candidates[: max(k * 4, k)]
+        docs = {
+            row["id"]: row for row in conn.execute(
+                f"SELECT * FROM docs WHERE id IN ({','.join('?' * len(candidates))})", candidates
+            )
+        }
+        if self.reranker is not None:
+            candidates = self._rerank(query, candidates, docs)
+        self._count("hits")
+        return [
+            {
+                "rank": rank,
+                "title": docs[d]["title"] or "(no title)",
+                "url": docs[d]["url"],
+                "snippet": docs[d]["snippet"],
+                "summary": docs[d]["summary"],
+                "error": "",
+                "score": round(scores[d], 4),
+                "source": "local",
+            }
+            for rank, d in enumerate(candidates[:k], 1)
+        ]
+
+    def _rerank(self, query: str, candidates: List[int], docs: Dict[int, sqlite3.Row]) -> List[int]:
+        import numpy as np
+
+        def unit(text: str):
+            vec = np.asarray(self.reranker.embed(text), dtype=np.float32)
+            norm = float(np.linalg.norm(vec))
+            return vec / norm if norm else vec
+
+        try:
+            q = unit(query)
+            sims = {d: float(unit(f"{docs[d]['title']}\n{docs[d]['summary'] or docs[d]['snippet']}") @ q)
+                    for d in candidates}
+        except Exception as e:
+            print(f"[localindex] rerank skipped: {e}")
+            return candidates
+        return sorted(candidates, key=lambda d: -sims[d])
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        (docs,) = conn.execute("SELECT COUNT(*) FROM docs").fetchone()
+        (terms,) = conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()
+        by_category = dict(conn.execute(
+            "SELECT COALESCE(category, '*'), COUNT(*) FROM docs GROUP BY category"
+        ).fetchall())
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "docs": docs,
+            "terms": terms,
+            "by_category": by_category,
+            "reranker": getattr(self.reranker, "name", None),
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+def iter_payloads(path: Path) -> Iterator[Dict[str, Any]]:
+    """One payload per file, or one per line for JSONL."""
+    text = Path(path).read_text(encoding="utf-8")
+    try:
+        yield json.loads(text)
+    except ValueError:
+        for line in text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+
+
+_local_index: Optional[LocalIndex] = None
+_local_index_init = False
+_local_index_lock = threading.Lock()
+
+
+def get_local_index() -> Optional[LocalIndex]:
+    """LocalIndex configured from LOCAL_INDEX_* env vars, or None when LOCAL_INDEX_BACKEND=none."""
+    global _local_index, _local_index_init
+    if _local_index_init:
+        return _local_index
+    with _local_index_lock:
+        if not _local_index_init:
+            if os.getenv("LOCAL_INDEX_BACKEND", "sqlite").lower() not in ("none", "off", ""):
+                reranker = None
+                rerank = os.getenv("LOCAL_INDEX_RERANK", "none").lower()
+                if rerank not in ("none", "off", ""):
+                    from .semantic import EMBEDDERS
+
+                    reranker = EMBEDDERS[rerank]()
+                _local_index = LocalIndex(
+                    Path(os.getenv("LOCAL_INDEX_PATH", DEFAULT_CACHE_DIR / "local_index.sqlite")),
+                    min_coverage=float(os.getenv("LOCAL_INDEX_MIN_COVERAGE", 0.5)),
+                    reranker=reranker,
+                )
+            _local_index_init = True
+    return _local_index
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or query the local resource index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="index result.json-style payloads (JSON or JSONL)")
+    add.add_argument("paths", nargs="+", type=Path)
+    add.add_argument("--category", default=None, help="newspaper, books, article or certificatin_course")
+    search = sub.add_parser("search")
+    search.add_argument("query")
+    search.add_argument("--category", default=None)
+    search.add_argument("-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    index = get_local_index()
+    if index is None:
+        parser.error("LOCAL_INDEX_BACKEND is none")
+    if args.command == "add":
+        added = sum(index.add_payload(p, args.category) for path in args.paths for p in iter_payloads(path))
+        print(f"indexed {added} documents; {index.stats()}")
+    else:
+        print(json.dumps(index.search(args.query, args.category, args.k), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+In-process instrumentation: span timings, token usage and errors, rendered in
+the Prometheus text format at /metrics.
+
+    with span("fetch", provider="web"):
+        ...
+
+Spans are timed with time.monotonic(). Each (span, labels) series keeps
+cumulative histogram buckets for Prometheus plus a window of recent samples
+for p50/p95/p99. Set TRACE_LOG=1 (stderr) or TRACE_LOG=<path> to also emit
+one JSON line per span, tagged with the request id of the HTTP request that
+caused it.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Coroutine, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW = 2048  # recent samples per series behind the quantiles
+PREFIX = "mybrand"
+
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def bind(fn: Callable) -> Callable:
+    """`fn` running in a copy of the caller's context, so pool threads keep the request id."""
+    ctx = contextvars.copy_context()
+    # a Context can only be entered by one thread at a time, so every call gets its own copy
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+async def in_request(coro: Coroutine, rid: Optional[str]) -> Any:
+    """Await `coro` with the request id set; run_async() wraps coroutines in this."""
+    token = request_id.set(rid)
+    try:
+        return await coro
+    finally:
+        request_id.reset(token)
+
+
+class _Series:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent: Deque[float] = deque(maxlen=WINDOW)
+
+    def add(self, seconds: float) -> None:
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _fmt(labels: Labels, **extra: str) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: Dict[Tuple[str, Labels], _Series] = {}
+        self._errors: Dict[Tuple[str, Labels], int] = {}
+        self._tokens: Dict[Labels, int] = {}
+        self._trace = self._trace_logger()
+
+    @staticmethod
+    def _trace_logger() -> Optional[logging.Logger]:
+        target = os.getenv("TRACE_LOG", "").strip()
+        if target.lower() in ("", "0", "off", "none"):
+            return None
+        logger = logging.getLogger(f"{PREFIX}.trace")
+        if not logger.handlers:
+            handler = logging.StreamHandler() if target.lower() in ("1", "on", "stderr") else logging.FileHandler(target)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        return logger
+
+    # ---- recording ----
+    def observe(self, name: str, seconds: float, error: Optional[BaseException] = None, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            series = self._latency.get(key)
+            if series is None:
+                series = self._latency[key] = _Series()
+            series.add(seconds)
+            if error is not None:
+                err_key = (name, key[1] + (("error", type(error).__name__),))
+                self._errors[err_key] = self._errors.get(err_key, 0) + 1
+        if self._trace is not None:
+            self._trace.info(json.dumps({
+                "ts": round(time.time(), 3),
+                "request_id": request_id.get(),
+                "span": name,
+                **{k: v for k, v in key[1]},
+                "ms": round(seconds * 1000, 1),
+                "ok": error is None,
+                **({"error": f"{type(error).__name__}: {error}"[:300]} if error is not None else {}),
+            }, ensure_ascii=False))
+
+    @contextmanager
+    def span(self, name: str, **labels: Any) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.observe(name, time.monotonic() - started, error=e, **labels)
+            raise
+        self.observe(name, time.monotonic() - started, **labels)
+
+    def tokens(self, provider: str, model: str, input_tokens: int = 0, output_tokens: int = 0,
+               cached_tokens: int = 0) -> None:
+        with self._lock:
+            for kind, n in (("input", input_tokens), ("output", output_tokens), ("cached", cached_tokens)):
+                if n:
+                    key = _labels({"provider": provider, "model": model, "kind": kind})
+                    self._tokens[key] = self._tokens.get(key, 0) + int(n)
+
+    def reset(self) -> None:
+        """Forget everything recorded so far (benchmarks measure one scenario at a time)."""
+        with self._lock:
+            self._latency.clear()
+            self._errors.clear()
+            self._tokens.clear()
+
+    # ---- reading ----
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latency = {k: (list(s.buckets), s.count, s.sum, np.array(s.recent)) for k, s in self._latency.items()}
+            errors = dict(self._errors)
+            tokens = dict(self._tokens)
+        return {"latency": latency, "errors": errors, "tokens": tokens}
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        snap = self.snapshot()
+        lines: List[str] = []
+        by_name: Dict[str, List] = {}
+        for (name, labels), data in sorted(snap["latency"].items()):
+            by_name.setdefault(name, []).append((labels, data))
+
+        for name, series in by_name.items():
+            metric = f"{PREFIX}_{name}_seconds"
+            lines += [f"# HELP {metric} Duration of {name} spans.", f"# TYPE {metric} histogram"]
+            for labels, (buckets, count, total, _) in series:
+                cumulative = np.cumsum(buckets)
+                for edge, n in zip(BUCKETS, cumulative):
+                    lines.append(f"{metric}_bucket{_fmt(labels, le=repr(edge))} {int(n)}")
+                lines.append(f"{metric}_bucket{_fmt(labels, le='+Inf')} {count}")
+                lines.append(f"{metric}_sum{_fmt(labels)} {total:.6f}")
+                lines.append(f"{metric}_count{_fmt(labels)} {count}")
+            quantile = f"{metric}_quantile"
+            lines += [f"# HELP {quantile} p50/p95/p99 over the last {WINDOW} {name} spans.", f"# TYPE {quantile} gauge"]
+            for labels, (_, _, _, recent) in series:
+                values = np.quantile(recent, QUANTILES) if len(recent) else [float("nan")] * len(QUANTILES)
+                for q, v in zip(QUANTILES, values):
+                    lines.append(f"{quantile}{_fmt(labels, quantile=str(q))} {float(v):.6f}")
+
+        metric = f"{PREFIX}_span_errors_total"
+        lines += [f"# HELP {metric} Spans that raised, by span, labels and exception type.", f"# TYPE {metric} counter"]
+        for (name, labels), n in sorted(snap["errors"].items()):
+            lines.append(f"{metric}{_fmt((('span', name),) + labels)} {n}")
+
+        metric = f"{PREFIX}_llm_tokens_total"
+        lines += [f"# HELP {metric} Tokens reported by providers.", f"# TYPE {metric} counter"]
+        for labels, n in sorted(snap["tokens"].items()):
+            lines.append(f"{metric}{_fmt(labels)} {n}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Any]:
+        """p50/p95/p99 in ms per series, for logs and /health pages."""
+        out = {}
+        for (name, labels), (_, count, _, recent) in self.snapshot()["latency"].items():
+            key = name + _fmt(labels)
+            qs = np.quantile(recent, QUANTILES) * 1000 if len(recent) else []
+            out[key] = {"count": count, **{f"p{int(q * 100)}": round(float(v), 1) for q, v in zip(QUANTILES, qs)}}
+        return out
+
+
+metrics = Metrics()
+span = metrics.span
@@ -3,7 +3,7 @@ from typing import List, Dict, Any, Optional
 from google.genai.types import ProactivityConfig
 from httpx import options
 from langchain_core import messages
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from openai import OpenAI
 import os
 
@@ -66,6 +66,7 @@ class improving(BaseModel):
     books: str
     newspaper: str
     certificatin_course:str
+    _fallback: bool = PrivateAttr(default=False)  # set when this is a stand-in, not an LLM answer
     
     def __call__(self) -> Dict[str, Any]:
         return self.model_dump()
@@ -78,6 +79,28 @@ class improving(BaseModel):
 
 
 
+# maximum points per rubric dimension (total = 100)
+RUBRIC_WEIGHTS: Dict[str, int] = {
+    "professional_knowledge": 20,
+    "practical_skills": 20,
+    "experience_achievements": 20,
+    "personal_branding": 15,
+    "goals_vision": 15,
+    "growth_potential": 10,
+}
+
+# upper bound of each band on the 0–100 total; anything above the last is "strong"
+BAND_EDGES = (50, 70)
+BAND_NAMES = ("weak", "ok", "strong")
+
+
+def rubric_band(total: float) -> str:
+    for edge, name in zip(BAND_EDGES, BAND_NAMES):
+        if total <= edge:
+            return name
+    return BAND_NAMES[-1]
+
+
 class RubricScore(BaseModel):
     professional_knowledge: int # 20 - Kiến thức chuyên môn
     practical_skills: int # 20 - Kỹ năng thực hành
@@ -85,6 +108,9 @@ class RubricScore(BaseModel):
     personal_branding: int # 15 - Định vị cá nhân
     goals_vision: int # 15 - Mục tiêu & tầm nhìn
     growth_potential: int # 10 - Tiềm năng phát triển
+    _fallback: bool = PrivateAttr(default=False)  # set when this is a stand-in, not an LLM answer
+    _source: str = PrivateAttr(default="llm")  # "local" when agent.prescore answered without the LLM
+    _confidence: Optional[float] = PrivateAttr(default=None)  # the pre-scorer's confidence, if it ran
 
     def __call__(self) -> Dict[str, Any]:
         return self.model_dump()
@@ -95,26 +121,35 @@ class RubricScore(BaseModel):
     def __str__(self) -> str:
         return self.model_dump_json(indent=2)
     
-    def _overall(self) -> Dict[float,str]:
-        score = (
-                self.professional_knowledge + 
-                self.practical_skills + 
-                self.experience_achievements + 
-                self.personal_branding + 
-                self.goals_vision + 
-                self.growth_potential
-                )/100
-        kind = ""
-        
-        if score <= 50:
-            kind = "weak"
-        elif 50 < score <= 70:
-            kind = "ok"
-        else:
-            kind = "strong"
-
-        return {score:kind}
-  
+    def total(self) -> int:
+        return sum(getattr(self, name) for name in RUBRIC_WEIGHTS)
+
+    def _overall(self) -> Dict[str, Any]:
+        score = self.total()  # already on the 0–100 scale the bands use
+        return {"score": score, "band": rubric_band(score)}
+
+
+class FusedAnalysis(BaseModel):
+    # one structured answer covering all four per-profile stages
+    potentialResult: str
+    personalityResult: str
+    source_advice: improving
+    rubricResult: RubricScore
+
+    def problems(self) -> List[str]:
+        issues = []
+        if not self.potentialResult.strip():
+            issues.append("potentialResult is empty")
+        if not self.personalityResult.strip():
+            issues.append("personalityResult is empty")
+        if not self.source_advice.advice.strip():
+            issues.append("source_advice.advice is empty")
+        for name, limit in RUBRIC_WEIGHTS.items():
+            value = getattr(self.rubricResult, name)
+            if not 0 <= value <= limit:
+                issues.append(f"rubricResult.{name}={value} outside 0..{limit}")
+        return issues
+
 
 class Conclusion(BaseModel):
     personalityResult: str
@@ -122,4 +157,9 @@ class Conclusion(BaseModel):
     source_advice: improving
     rubricResult: RubricScore
     web: Dict[str,str] = {}
+    fallbacks: List[str] = []  # stages whose result is a stand-in after a failed call
+    semantic_hit: bool = False  # advice and web reused from a similar cached case
+    semantic_similarity: Optional[float] = None
+    rubric_source: str = "llm"  # "local" when the rubric came from agent.prescore
+    rubric_confidence: Optional[float] = None
 
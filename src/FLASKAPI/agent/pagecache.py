@@ -0,0 +1,228 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .cache import DEFAULT_CACHE_DIR, SWEEP_EVERY
+
+USER_AGENT = "Mozilla/5.0 (compatible; mybrand-bot/1.0; +https://github.com/HaoHaoHan610/MYBRAND)"
+MIN_TEXT_CHARS = 200
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit((url or "").strip())
+    scheme = parts.scheme.lower() or "http"
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+class PageCache:
+    """
+    Disk cache of scraped pages keyed by normalized URL.
+
+    Fresh entries are served without touching the network. Stale entries are
+    revalidated with If-None-Match / If-Modified-Since; a 304 (or an unchanged
+    HTML hash) reuses the stored extract. Blocked pages and too-short extracts
+    are cached as negative entries with their own, shorter TTL.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        ttl: float = 24 * 3600,
+        negative_ttl: float = 3600,
+        max_bytes: int = 200 * 1024 * 1024,
+        max_entries: int = 20000,
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters = {"fresh_hits": 0, "negative_hits": 0, "revalidated": 0, "refetched": 0, "misses": 0, "stale_served": 0, "evicted": 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, html_hash TEXT, text TEXT NOT NULL, etag TEXT, last_modified TEXT,"
+            "status INTEGER, negative INTEGER NOT NULL, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            "size INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def get(self, url: str) -> Optional[sqlite3.Row]:
+        return self._conn().execute("SELECT * FROM pages WHERE url = ?", (normalize_url(url),)).fetchone()
+
+    def _store(self, url: str, html_hash: Optional[str], text: str, etag: Optional[str],
+               last_modified: Optional[str], status: Optional[int], negative: bool) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (normalize_url(url), html_hash, text, etag, last_modified, status, int(negative), now, now,
+             len(text.encode("utf-8"))),
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % SWEEP_EVERY == 0
+        if sweep:
+            self._evict()
+
+    def _touch(self, url: str, refetched: bool = False) -> None:
+        now = time.time()
+        column = "fetched_at = ?, accessed_at = ?" if refetched else "accessed_at = ?"
+        args = (now, now) if refetched else (now,)
+        conn = self._conn()
+        conn.execute(f"UPDATE pages SET {column} WHERE url = ?", (*args, normalize_url(url)))
+        conn.commit()
+
+    def _evict(self) -> None:
+        conn = self._conn()
+        total, count = conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM pages").fetchone()
+        if total <= self.max_bytes and count <= self.max_entries:
+            return
+        over = count - self.max_entries
+        if total > self.max_bytes:
+            # least recently used rows that must go before the rest fits in max_bytes
+            (short,) = conn.execute(
+                "SELECT COUNT(*) FROM (SELECT SUM(size) OVER (ORDER BY accessed_at ROWS UNBOUNDED PRECEDING) AS freed"
+                " FROM pages) WHERE freed < ?",
+                (total - self.max_bytes,),
+            ).fetchone()
+            over = max(over, short + 1)
+        evicted = conn.execute(
+            "DELETE FROM pages WHERE url IN (SELECT url FROM pages ORDER BY accessed_at LIMIT ?)", (over,)
+        ).rowcount
+        conn.commit()
+        with self._lock:
+            self.counters["evicted"] += evicted
+
+    # lookup / on_error / on_response / store_extract: the async engine drives the
+    # cache around its own transport (async_engine.ascrape_main_text).
+    def lookup(self, url: str) -> Tuple[Optional[str], Dict[str, str], Optional[sqlite3.Row]]:
+        """(fresh text or None, request headers to send, existing row)."""
+        row = self.get(url)
+        if row is not None:
+            ttl = self.negative_ttl if row["negative"] else self.ttl
+            if time.time() - row["fetched_at"] < ttl:
+                self._count("negative_hits" if row["negative"] else "fresh_hits")
+                self._touch(url)
+                return row["text"], {}, row
+
+        headers = {"User-Agent": USER_AGENT}
+        if row is not None and not row["negative"]:
+            if row["etag"]:
+                headers["If-None-Match"] = row["etag"]
+            if row["last_modified"]:
+                headers["If-Modified-Since"] = row["last_modified"]
+        return None, headers, row
+
+    def on_error(self, url: str, row: Optional[sqlite3.Row]) -> Optional[str]:
+        """After a failed fetch: the stale extract if there is one, else None (and a negative entry)."""
+        if row is not None and not row["negative"]:
+            # stale-if-error: an old good extract beats no extract
+            self._count("stale_served")
+            return row["text"]
+        self._count("misses")
+        self._store(url, None, "", None, None, None, negative=True)
+        return None
+
+    def on_response(self, url: str, row: Optional[sqlite3.Row], status: int,
+                    content: bytes) -> Tuple[Optional[str], Optional[str]]:
+        """(text, None) when the response settles it, else (None, html_hash): extract, then store_extract."""
+        if status == 304 and row is not None:
+            self._count("revalidated")
+            self._touch(url, refetched=True)
+            return row["text"], None
+
+        if status >= 400:
+            self._count("misses")
+            self._store(url, None, "", None, None, status, negative=True)
+            return "", None
+
+        html_hash = hashlib.sha256(content).hexdigest()
+        if row is not None and row["html_hash"] == html_hash:
+            self._count("revalidated")
+            self._touch(url, refetched=True)
+            return row["text"], None
+        self._count("refetched" if row is not None else "misses")
+        return None, html_hash
+
+    def store_extract(self, url: str, html_hash: str, text: str, headers: Mapping[str, str], status: int) -> None:
+        self._store(
+            url, html_hash, text,
+            headers.get("ETag"), headers.get("Last-Modified"), status,
+            negative=len(text) < MIN_TEXT_CHARS,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        total, count, negative = self._conn().execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*), COALESCE(SUM(negative), 0) FROM pages"
+        ).fetchone()
+        with self._lock:
+            counters = dict(self.counters)
+        lookups = counters["fresh_hits"] + counters["negative_hits"] + counters["revalidated"] + counters["refetched"] + counters["misses"]
+        network_skipped = counters["fresh_hits"] + counters["negative_hits"]
+        return {
+            **counters,
+            "entries": count,
+            "negative_entries": negative,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "network_skip_rate": round(network_skipped / lookups, 4) if lookups else 0.0,
+        }
+
+
+_page_cache: Optional[PageCache] = None
+_page_cache_init = False
+_page_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> Optional[PageCache]:
+    """PageCache configured from PAGE_CACHE_* env vars, or None when PAGE_CACHE_BACKEND=none."""
+    global _page_cache, _page_cache_init
+    if _page_cache_init:
+        return _page_cache
+    with _page_cache_lock:
+        if not _page_cache_init:
+            if os.getenv("PAGE_CACHE_BACKEND", "sqlite").lower() not in ("none", "off", ""):
+                _page_cache = PageCache(
+                    Path(os.getenv("PAGE_CACHE_PATH", DEFAULT_CACHE_DIR / "pages.sqlite")),
+                    ttl=float(os.getenv("PAGE_CACHE_TTL", 24 * 3600)),
+                    negative_ttl=float(os.getenv("PAGE_CACHE_NEGATIVE_TTL", 3600)),
+                    max_bytes=int(os.getenv("PAGE_CACHE_MAX_BYTES", 200 * 1024 * 1024)),
+                    max_entries=int(os.getenv("PAGE_CACHE_MAX_ENTRIES", 20000)),
+                )
+            _page_cache_init = True
+    return _page_cache
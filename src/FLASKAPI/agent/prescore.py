@@ -0,0 +1,402 @@
+"""
+Local rubric pre-scorer: most of RubricScore follows from structured fields
+(GPA, year, counts of strengths/achievements/languages, mentor, goals), so
+clear-cut profiles are scored without an LLM call.
+
+    python -m agent.prescore evaluate          # rule table vs the LLM on the held-out split
+    python -m agent.prescore fit               # fit the linear model on the train split, report, save
+
+It is off by default. Only PRESCORE_BACKEND=linear with a model saved by
+`fit` puts it on the request path, because that model's error (sigma) is
+measured on held-out LLM scores. The hand-written rule table is uncalibrated
+and only feeds `evaluate` and cohort analytics. LLM rubric answers are
+logged as training samples either way (PRESCORE_SAMPLES, on by default).
+
+Profiles are turned into a feature matrix and scored in one NumPy pass, so a
+whole cohort costs about as much as one profile. A profile is "clear-cut"
+when its predicted total sits far from the weak/ok/strong band edges compared
+with the model's typical error; everything else still goes to the LLM, whose
+answers are logged as training samples for `fit`.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cache import DEFAULT_CACHE_DIR, content_key
+from .models import BAND_EDGES as _BAND_EDGES
+from .models import RUBRIC_WEIGHTS, PersonalProfile, PotentialAnalysis, RubricScore, StudentCase
+
+DIMENSIONS = tuple(RUBRIC_WEIGHTS)
+WEIGHTS = np.array([RUBRIC_WEIGHTS[d] for d in DIMENSIONS], dtype=np.float64)
+BAND_EDGES = np.array(_BAND_EDGES, dtype=np.float64)  # weak | ok | strong, as in RubricScore._overall
+
+# feature -> count at which it stops adding points
+FEATURES: Dict[str, float] = {
+    "gpa": 1.0,  # already scaled to 0..1
+    "year": 4.0,
+    "has_major": 1.0,
+    "strengths": 5.0,
+    "languages": 2.0,
+    "achievements": 4.0,
+    "mentor": 1.0,
+    "hobbies": 3.0,
+    "personality": 4.0,
+    "unique_brand": 1.0,
+    "study_style": 1.0,
+    "topics": 3.0,
+    "goal_horizons": 2.0,
+    "goal_items": 4.0,
+}
+SATURATION = np.array(list(FEATURES.values()), dtype=np.float64)
+
+# share of each dimension's points per feature; every column sums to 1
+_RULES = {
+    "professional_knowledge": {"gpa": 0.6, "year": 0.25, "has_major": 0.15},
+    "practical_skills": {"strengths": 0.6, "languages": 0.4},
+    "experience_achievements": {"achievements": 0.7, "mentor": 0.3},
+    "personal_branding": {"unique_brand": 0.45, "personality": 0.3, "study_style": 0.25},
+    "goals_vision": {"goal_horizons": 0.5, "goal_items": 0.5},
+    "growth_potential": {"topics": 0.5, "hobbies": 0.3, "study_style": 0.2},
+}
+RULE_TABLE = np.array([[_RULES[d].get(f, 0.0) for d in DIMENSIONS] for f in FEATURES])
+
+
+def _gpa(value: Optional[float]) -> float:
+    # 4-point and 10-point scales are both in use
+    if not value or value < 0:
+        return 0.0
+    return min(value / (4.0 if value <= 4 else 10.0), 1.0)
+
+
+def _row(potential: PotentialAnalysis, personal: PersonalProfile) -> List[float]:
+    goals = {k: v for k, v in (personal.goals or {}).items() if v}
+    return [
+        _gpa(potential.gpa),
+        float(potential.year or 0),
+        float(bool((potential.major or "").strip())),
+        float(len(potential.strengths)),
+        float(len(potential.language)),
+        float(len(potential.achievements)),
+        float(bool(potential.mentor)),
+        float(len(personal.hobbies)),
+        float(len(personal.personality)),
+        float(bool((personal.unique_brand or "").strip())),
+        float(bool((personal.study_style or "").strip())),
+        float(len(personal.exciting_topics)),
+        float(len(goals)),
+        float(sum(len(v) for v in goals.values())),
+    ]
+
+
+def feature_matrix(cases: Sequence[StudentCase]) -> np.ndarray:
+    """(n, len(FEATURES)) saturated features in 0..1."""
+    raw = np.array([_row(c.potential, c.personal) for c in cases], dtype=np.float64).reshape(-1, len(FEATURES))
+    return np.clip(raw / SATURATION, 0.0, 1.0)
+
+
+def score_matrix(rubrics: Sequence[RubricScore]) -> np.ndarray:
+    return np.array([[getattr(r, d) for d in DIMENSIONS] for r in rubrics], dtype=np.float64).reshape(-1, len(DIMENSIONS))
+
+
+def bands(totals: np.ndarray) -> np.ndarray:
+    """Indexes into models.BAND_NAMES (0 weak, 1 ok, 2 strong)."""
+    return np.searchsorted(BAND_EDGES, totals, side="left")
+
+
+# ---- models ----
+class RuleModel:
+    """The fixed rule table: each dimension is a weighted share of its features."""
+
+    kind = "rules"
+
+    def __init__(self, sigma: float = 8.0):
+        self.sigma = sigma  # typical error of the predicted total, in points
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return (X @ RULE_TABLE) * WEIGHTS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "sigma": self.sigma}
+
+
+class LinearModel:
+    """Ridge regression per dimension, fitted on logged LLM scores."""
+
+    kind = "linear"
+
+    def __init__(self, coef: np.ndarray, sigma: float, trained_on: int = 0, held_out: int = 0):
+        self.coef = np.asarray(coef, dtype=np.float64)  # (features + bias, dimensions)
+        self.sigma = sigma
+        self.trained_on = trained_on
+        self.held_out = held_out  # samples sigma was measured on; 0 means it is the (optimistic) training error
+
+    @classmethod
+    def fit(cls, X: np.ndarray, Y: np.ndarray, l2: float = 1.0) -> "LinearModel":
+        Xb = np.hstack([X, np.ones((len(X), 1))])
+        reg = l2 * np.eye(Xb.shape[1])
+        reg[-1, -1] = 0.0  # leave the bias unpenalized
+        coef = np.linalg.solve(Xb.T @ Xb + reg, Xb.T @ Y)
+        model = cls(coef, sigma=0.0, trained_on=len(X))
+        model.sigma = max(float(np.sqrt(np.mean((model.predict(X).sum(1) - Y.sum(1)) ** 2))), 1.0)
+        return model
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return np.hstack([X, np.ones((len(X), 1))]) @ self.coef
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "sigma": self.sigma, "trained_on": self.trained_on, "held_out": self.held_out,
+                "features": list(FEATURES), "dimensions": list(DIMENSIONS), "coef": self.coef.tolist()}
+
+    @classmethod
+    def load(cls, path: Path) -> "LinearModel":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        if data.get("features") != list(FEATURES) or data.get("dimensions") != list(DIMENSIONS):
+            raise ValueError(f"{path} was fitted on a different feature set; refit it")
+        return cls(np.array(data["coef"]), data["sigma"], data.get("trained_on", 0), data.get("held_out", 0))
+
+
+# ---- scoring ----
+@dataclass
+class Estimates:
+    scores: np.ndarray  # (n, dimensions) ints within 0..weight
+    totals: np.ndarray
+    confidence: np.ndarray  # 0..1
+
+
+@dataclass
+class Estimate:
+    rubric: RubricScore
+    confidence: float
+    confident: bool
+
+
+def agreement(pred: np.ndarray, truth: np.ndarray) -> Dict[str, Any]:
+    """How close predicted rubric scores are to the LLM's."""
+    if not len(truth):
+        return {"n": 0}
+    totals_pred, totals_true = pred.sum(1), truth.sum(1)
+    return {
+        "n": int(len(truth)),
+        "mae": {d: round(float(v), 2) for d, v in zip(DIMENSIONS, np.abs(pred - truth).mean(0))},
+        "total_mae": round(float(np.abs(totals_pred - totals_true).mean()), 2),
+        "total_within_5": round(float((np.abs(totals_pred - totals_true) <= 5).mean()), 4),
+        "band_agreement": round(float((bands(totals_pred) == bands(totals_true)).mean()), 4),
+    }
+
+
+class PreScorer:
+    def __init__(self, model: Any, min_confidence: float = 0.75, samples: Optional["SampleLog"] = None):
+        self.model = model
+        self.min_confidence = min_confidence
+        self.samples = samples
+        self._lock = threading.Lock()
+        self.counters = {"local": 0, "llm": 0, "band_agree": 0, "abs_error_sum": 0.0}
+
+    def score_cohort(self, cases: Sequence[StudentCase]) -> Estimates:
+        raw = self.model.predict(feature_matrix(cases))
+        scores = np.clip(np.rint(raw), 0, WEIGHTS)
+        totals = scores.sum(1)
+        # distance to the nearest band edge in units of the model's error; 2 sigma away counts as certain
+        margin = np.abs(totals[:, None] - BAND_EDGES[None, :]).min(1)
+        confidence = np.clip(margin / (2 * self.model.sigma), 0.0, 1.0)
+        return Estimates(scores.astype(int), totals, confidence)
+
+    def estimate(self, academic: PotentialAnalysis, personality: PersonalProfile) -> Estimate:
+        est = self.score_cohort([StudentCase(potential=academic, personal=personality)])
+        rubric = RubricScore(**dict(zip(DIMENSIONS, (int(v) for v in est.scores[0]))))
+        confidence = round(float(est.confidence[0]), 4)
+        confident = confidence >= self.min_confidence
+        rubric._source = "local"
+        rubric._confidence = confidence
+        if confident:
+            with self._lock:
+                self.counters["local"] += 1
+        return Estimate(rubric, confidence, confident)
+
+    def observe(self, academic: PotentialAnalysis, personality: PersonalProfile, result: RubricScore,
+                estimate: Optional[Estimate] = None) -> None:
+        """Record an LLM score: online agreement with the local estimate, plus a training sample."""
+        with self._lock:
+            self.counters["llm"] += 1
+            if estimate is not None:
+                pred = score_matrix([estimate.rubric]).sum(1)
+                true = score_matrix([result]).sum(1)
+                self.counters["band_agree"] += int(bands(pred)[0] == bands(true)[0])
+                self.counters["abs_error_sum"] += float(abs(pred[0] - true[0]))
+        if self.samples is not None:
+            self.samples.append(academic, personality, result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+        scored = c["local"] + c["llm"]
+        return {
+            "model": self.model.to_dict() if self.model.kind == "rules" else
+            {k: v for k, v in self.model.to_dict().items() if k != "coef"},
+            "min_confidence": self.min_confidence,
+            "local": c["local"],
+            "llm": c["llm"],
+            "skip_rate": round(c["local"] / scored, 4) if scored else 0.0,
+            # only over profiles the LLM scored, i.e. the low-confidence ones
+            "llm_band_agreement": round(c["band_agree"] / c["llm"], 4) if c["llm"] else None,
+            "llm_total_mae": round(c["abs_error_sum"] / c["llm"], 2) if c["llm"] else None,
+        }
+
+
+# ---- training data ----
+class SampleLog:
+    """LLM rubric scores with their inputs, one JSON object per line."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def append(self, potential: PotentialAnalysis, personal: PersonalProfile, rubric: RubricScore) -> None:
+        line = json.dumps({"potential": potential.model_dump(), "personal": personal.model_dump(),
+                           "rubric": rubric.model_dump(), "at": time.time()}, ensure_ascii=False)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"[prescore] sample not logged: {e}")
+
+    def load(self) -> Tuple[List[StudentCase], List[RubricScore]]:
+        if not self.path.exists():
+            return [], []
+        latest: Dict[str, Tuple[StudentCase, RubricScore]] = {}
+        for line in self.path.read_text(encoding="utf-8").splitlines():
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            case = StudentCase(potential=row["potential"], personal=row["personal"])
+            latest[content_key(case)] = (case, RubricScore.model_validate(row["rubric"]))  # newest score wins
+        return [c for c, _ in latest.values()], [r for _, r in latest.values()]
+
+
+def held_out_mask(cases: Sequence[StudentCase], fraction: float = 0.2) -> np.ndarray:
+    """Stable split by content hash, so a profile never moves between train and held-out."""
+    buckets = np.array([int(content_key(c)[:8], 16) % 1000 for c in cases])
+    return buckets < fraction * 1000
+
+
+_prescorer: Optional[PreScorer] = None
+_prescorer_init = False
+_prescorer_lock = threading.Lock()
+_sample_log: Optional[SampleLog] = None
+_sample_log_init = False
+
+
+def _model_path() -> Path:
+    return Path(os.getenv("PRESCORE_MODEL_PATH", DEFAULT_CACHE_DIR / "prescore_model.json"))
+
+
+def _samples_path() -> Path:
+    return Path(os.getenv("PRESCORE_SAMPLES_PATH", DEFAULT_CACHE_DIR / "rubric_samples.jsonl"))
+
+
+def get_sample_log() -> Optional[SampleLog]:
+    """Where LLM rubric answers are logged for `fit`, or None when PRESCORE_SAMPLES=off."""
+    global _sample_log, _sample_log_init
+    if _sample_log_init:
+        return _sample_log
+    with _prescorer_lock:
+        if not _sample_log_init:
+            if os.getenv("PRESCORE_SAMPLES", "on").lower() not in ("none", "off", ""):
+                _sample_log = SampleLog(_samples_path())
+            _sample_log_init = True
+    return _sample_log
+
+
+def _load_calibrated() -> Optional[LinearModel]:
+    try:
+        model = LinearModel.load(_model_path())
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[prescore] linear model unavailable ({e}); every rubric goes to the LLM")
+        return None
+    if not model.held_out:
+        print(f"[prescore] {_model_path()} has no held-out sigma; refit it with `fit`")
+        return None
+    return model
+
+
+def get_prescorer() -> Optional[PreScorer]:
+    """
+    PreScorer for the request path, or None (the default) unless
+    PRESCORE_BACKEND=linear and a held-out-calibrated model has been fitted.
+    """
+    global _prescorer, _prescorer_init
+    if _prescorer_init:
+        return _prescorer
+    samples = get_sample_log()
+    with _prescorer_lock:
+        if not _prescorer_init:
+            backend = os.getenv("PRESCORE_BACKEND", "none").lower()
+            model = None
+            if backend == "linear":
+                model = _load_calibrated()
+            elif backend not in ("none", "off", ""):
+                print(f"[prescore] PRESCORE_BACKEND={backend!r} is not supported on the request path; use 'linear'")
+            if model is not None:
+                _prescorer = PreScorer(model, float(os.getenv("PRESCORE_MIN_CONFIDENCE", 0.75)), samples)
+            _prescorer_init = True
+    return _prescorer
+
+
+def _report(name: str, scorer: PreScorer, cases: List[StudentCase], truth: np.ndarray) -> Dict[str, Any]:
+    est = scorer.score_cohort(cases)
+    confident = est.confidence >= scorer.min_confidence
+    return {
+        "model": name,
+        "all": agreement(est.scores, truth),
+        "confident": agreement(est.scores[confident], truth[confident]),
+        "skip_rate": round(float(confident.mean()), 4) if len(cases) else 0.0,
+    }
+
+
+def main(argv: Optional[Iterable[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Evaluate or fit the local rubric pre-scorer.")
+    parser.add_argument("command", choices=("evaluate", "fit"))
+    parser.add_argument("--samples", type=Path, default=None, help="rubric_samples.jsonl")
+    parser.add_argument("--out", type=Path, default=None, help="where `fit` saves the model")
+    parser.add_argument("--held-out", type=float, default=0.2)
+    parser.add_argument("--l2", type=float, default=1.0)
+    parser.add_argument("--min-confidence", type=float, default=float(os.getenv("PRESCORE_MIN_CONFIDENCE", 0.75)))
+    args = parser.parse_args(argv)
+
+    cases, rubrics = SampleLog(args.samples or _samples_path()).load()
+    if not cases:
+        parser.error("no logged LLM scores yet")
+    truth = score_matrix(rubrics)
+    test = held_out_mask(cases, args.held_out)
+    test_cases = [c for c, t in zip(cases, test) if t]
+    reports = [_report("rules", PreScorer(RuleModel(), args.min_confidence), test_cases, truth[test])]
+    if args.command == "fit":
+        train = ~test
+        if train.sum() < len(FEATURES) + 1:
+            parser.error(f"need more than {len(FEATURES)} training samples, have {int(train.sum())}")
+        if not test.any():
+            parser.error("no held-out samples to calibrate sigma on; log more LLM scores or raise --held-out")
+        model = LinearModel.fit(feature_matrix([c for c, t in zip(cases, train) if t]), truth[train], args.l2)
+        # calibrate confidence on held-out error rather than the (optimistic) training error
+        held_out_rmse = float(np.sqrt(np.mean((model.predict(feature_matrix(test_cases)).sum(1)
+                                               - truth[test].sum(1)) ** 2)))
+        model.sigma = max(held_out_rmse, 1.0)
+        model.held_out = int(test.sum())
+        reports.append(_report("linear", PreScorer(model, args.min_confidence), test_cases, truth[test]))
+        out = args.out or _model_path()
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(model.to_dict()), encoding="utf-8")
+        print(f"saved {out} (train={int(train.sum())}, held-out={int(test.sum())}, sigma={model.sigma:.2f})")
+    print(json.dumps(reports, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,156 @@
+"""
+Prompt templates.
+
+Every prompt is laid out static-first: the system text and the task
+instructions never change between students, and the student's data goes last
+as compact JSON. Providers that cache prompt prefixes (OpenAI does so
+automatically from 1024 tokens) can then reuse everything up to the data.
+Each template carries a version hash of its static text, so caches keyed on
+it turn over when a prompt is edited.
+"""
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel
+
 from .models import PotentialAnalysis, PersonalProfile, StudentCase
 
+
+def compact_json(data: Any) -> str:
+    """No indent, no spaces after separators: the cheapest stable rendering of a model."""
+    if isinstance(data, BaseModel):
+        return data.model_dump_json()
+    return str(data)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    system: str
+    task: str
+    labels: Tuple[str, ...]  # one heading per data object, in argument order
+    version: str = field(init=False)
+
+    def __post_init__(self):
+        digest = hashlib.sha256("\x00".join((self.name, self.system, self.task, *self.labels)).encode("utf-8"))
+        object.__setattr__(self, "version", f"{self.name}@{digest.hexdigest()[:12]}")
+
+    def user(self, *data: Any) -> str:
+        if len(data) != len(self.labels):
+            raise TypeError(f"template {self.name!r} takes {len(self.labels)} data objects, got {len(data)}")
+        blocks = [f"{label}:\n{compact_json(item)}" for label, item in zip(self.labels, data)]
+        return "\n\n".join([self.task, *blocks])
+
+    def messages(self, *data: Any) -> List[Any]:
+        return [SystemMessage(content=self.system), HumanMessage(content=self.user(*data))]
+
+
 class ImprovingBackground:
     HE_THONG_THUONG_HIEU_CA_NHAN = """
-    Bạn là chuyên gia hướng nghiệp và phân tích thương hiệu cá nhân cho sinh viên đại học.
-    Trả lời nhanh, ngắn, hành động được — tối đa 3–4 câu.
-    KHÔNG tự bịa thêm thông tin. Chỉ dùng dữ liệu trong object sinh viên; thiếu gì thì nói thiếu ngắn gọn.
-        """.strip()
+Bạn là chuyên gia hướng nghiệp và phân tích thương hiệu cá nhân cho sinh viên đại học.
+Trả lời nhanh, ngắn, hành động được — tối đa 3–4 câu.
+KHÔNG tự bịa thêm thông tin. Chỉ dùng dữ liệu trong object sinh viên; thiếu gì thì nói thiếu ngắn gọn.
+""".strip()
 
-    @staticmethod
-    def BackgroundAnalysis(student_object: PotentialAnalysis) -> str:
-        return f"""
-    Object sinh viên (JSON/chuỗi)
-    {student_object}: 
+    CALCULATOR_SYSTEM = """
+Bạn là chuyên gia đánh giá "THƯƠNG HIỆU CÁ NHÂN" cho sinh viên (personal brand readiness).
+Bạn sẽ nhận HAI object JSON:
+1) PotentialAnalysis
+2) PersonalProfile
+Nhiệm vụ:
+    - Chấm điểm mức độ sẵn sàng xây dựng thương hiệu cá nhân (KHÔNG đánh giá giá trị con người).
+    - Chấm theo rubric và trọng số sau (tổng = 100):
+        professional_knowledge: 20 - Kiến thức chuyên môn (GPA, năm học, chuyên ngành)
+        practical_skills: 20 - Kỹ năng thực hành (strengths, languages, technical abilities)
+        experience_achievements: 20 - Kinh nghiệm & thành tựu (achievements, mentor status, projects)
+        personal_branding: 15 - Định vị cá nhân (unique_brand, personality, study_style)
+        goals_vision: 15 - Mục tiêu & tầm nhìn (short_term và long_term goals, clarity)
+        growth_potential: 10 - Tiềm năng phát triển (hobbies, exciting_topics, learning ability)
+""".strip()
 
-    Hãy đưa ra khuyến nghị ngắn (tối đa 3–4 câu) gồm:
-    - Đánh giá tổng quan (1 câu)
-    - Lỗ hổng lớn nhất đang kéo điểm hồ sơ xuống (1 câu)
-    - Hành động tốt nhất để cải thiện thương hiệu cá nhân (3 câu)
-    - 1 câu định vị (positioning) phù hợp với ngành/năm học (1 câu)
+    BACKGROUND_TASK = """
+Hãy đưa ra khuyến nghị ngắn (tối đa 3–4 câu) cho object sinh viên ở cuối tin nhắn, gồm:
+- Đánh giá tổng quan (1 câu)
+- Lỗ hổng lớn nhất đang kéo điểm hồ sơ xuống (1 câu)
+- Hành động tốt nhất để cải thiện thương hiệu cá nhân (3 câu)
+- 1 câu định vị (positioning) phù hợp với ngành/năm học (1 câu)
 
-    Viết thẳng, gọn, không giải thích dài.
-    """
-    @staticmethod
-    def PersonalityBranding(personal: PersonalProfile) -> str:
-        personal_json = personal
-        return f"""
-    Object cá nhân (JSON/chuỗi):
-    {personal_json}
+Viết thẳng, gọn, không giải thích dài.
+""".strip()
+
+    PERSONALITY_TASK = """
+Hãy phân tích ngắn (tối đa 3–4 câu) object cá nhân ở cuối tin nhắn, gồm:
+- Tóm tắt “con người + hướng đi” (1 câu)
+- Điểm khác biệt có thể biến thành thương hiệu cá nhân (1 câu)
+- 1 hành động tốt nhất trong 7 ngày để củng cố định vị (1 câu)
+- 1 câu tagline/positioning phù hợp với trajectory + goals (1 câu)
 
-    Hãy phân tích ngắn (tối đa 3–4 câu) gồm:
+Viết thẳng, gọn, không giải thích dài.
+""".strip()
+
+    CASE_TASK = """
+Hãy đưa ra khuyến nghị ngắn (tối đa 3–4 câu) cho hồ sơ tổng hợp ở cuối tin nhắn, gồm:
+- Định vị phù hợp nhất để apply (1 câu)
+- Lỗ hổng lớn nhất đang làm hồ sơ yếu (1 câu)
+- Việc ưu tiên #1 trong 7 ngày để tăng “proof” (1 câu)
+- 1 câu positioning cuối cùng (1 câu)
+Và cho tui 3 chủ đề để tui có thê tìm kiếm trên internet để tìm kiếm thêm cách để cải thiện điều trên:
+    article
+    book
+    newspaper
+    Certification/course
+
+Không bịa. Nếu thiếu dữ liệu, nói thiếu.
+""".strip()
+
+    SCORE_TASK = "Chấm điểm hai object JSON ở cuối tin nhắn theo rubric trên."
+
+    FUSED_TASK = f"""
+Hồ sơ tổng hợp ở cuối tin nhắn gồm PotentialAnalysis (potential) và PersonalProfile (personal).
+
+Trả về MỘT object với 4 phần:
+1) potentialResult — chỉ dựa trên potential, tối đa 3–4 câu:
+    - Đánh giá tổng quan (1 câu)
+    - Lỗ hổng lớn nhất đang kéo điểm hồ sơ xuống (1 câu)
+    - Hành động tốt nhất để cải thiện thương hiệu cá nhân
+    - 1 câu định vị (positioning) phù hợp với ngành/năm học
+2) personalityResult — chỉ dựa trên personal, tối đa 3–4 câu:
     - Tóm tắt “con người + hướng đi” (1 câu)
     - Điểm khác biệt có thể biến thành thương hiệu cá nhân (1 câu)
     - 1 hành động tốt nhất trong 7 ngày để củng cố định vị (1 câu)
     - 1 câu tagline/positioning phù hợp với trajectory + goals (1 câu)
+3) source_advice — advice: định vị, lỗ hổng lớn nhất, việc ưu tiên #1 trong 7 ngày, 1 câu positioning;
+   article, books, newspaper, certificatin_course: mỗi mục 1 chủ đề để tìm kiếm trên internet.
+4) rubricResult — chấm điểm theo rubric:
+{CALCULATOR_SYSTEM}
+
+Viết thẳng, gọn, không giải thích dài. Không bịa. Nếu thiếu dữ liệu, nói thiếu.
+""".strip()
 
-    Viết thẳng, gọn, không giải thích dài.
-    """.strip()
+    # kept as static methods for callers that only need the user message (batch_backend)
+    @staticmethod
+    def BackgroundAnalysis(student_object: PotentialAnalysis) -> str:
+        return TEMPLATES["potential"].user(student_object)
+
+    @staticmethod
+    def PersonalityBranding(personal: PersonalProfile) -> str:
+        return TEMPLATES["personality"].user(personal)
 
     @staticmethod
     def case(case: StudentCase) -> str:
-        case_json = case
-        return f"""
-    Hồ sơ tổng hợp (JSON/chuỗi):
-    {case_json}
-
-    Hãy đưa ra khuyến nghị ngắn (tối đa 3–4 câu) gồm:
-    - Định vị phù hợp nhất để apply (1 câu)
-    - Lỗ hổng lớn nhất đang làm hồ sơ yếu (1 câu)
-    - Việc ưu tiên #1 trong 7 ngày để tăng “proof” (1 câu)
-    - 1 câu positioning cuối cùng (1 câu)
-    Và cho tui 3 chủ đề để tui có thê tìm kiếm trên internet để tìm kiếm thêm cách để cải thiện điều trên:
-        article
-        book
-        newspaper
-        Certification/course
-
-    Không bịa. Nếu thiếu dữ liệu, nói thiếu.
-    """.strip()
-    
-    CALCULATOR_SYSTEM = f"""
-    Bạn là chuyên gia đánh giá "THƯƠNG HIỆU CÁ NHÂN" cho sinh viên (personal brand readiness).
-    Bạn sẽ nhận HAI object JSON:
-    1) PotentialAnalysis
-    2) PersonalProfile
-    Nhiệm vụ:
-        - Chấm điểm mức độ sẵn sàng xây dựng thương hiệu cá nhân (KHÔNG đánh giá giá trị con người).
-        - Chấm theo rubric và trọng số sau (tổng = 100):
-            professional_knowledge: 20 - Kiến thức chuyên môn (GPA, năm học, chuyên ngành)
-            practical_skills: 20 - Kỹ năng thực hành (strengths, languages, technical abilities)
-            experience_achievements: 20 - Kinh nghiệm & thành tựu (achievements, mentor status, projects)
-            personal_branding: 15 - Định vị cá nhân (unique_brand, personality, study_style)
-            goals_vision: 15 - Mục tiêu & tầm nhìn (short_term và long_term goals, clarity)
-            growth_potential: 10 - Tiềm năng phát triển (hobbies, exciting_topics, learning ability)
-    """
+        return TEMPLATES["case"].user(case)
+
     @staticmethod
-    def Score(academic: PotentialAnalysis, personality: PersonalProfile)->str:
-        return f"""
-    PotentialAnalysis\n
-    {academic}\n 
-    PersonalProfile\n
-    {personality}
-    """
+    def Score(academic: PotentialAnalysis, personality: PersonalProfile) -> str:
+        return TEMPLATES["rubric"].user(academic, personality)
+
+    @staticmethod
+    def Fused(case: StudentCase) -> str:
+        return TEMPLATES["fused"].user(case)
+
     @staticmethod
     def search(academic:PotentialAnalysis,personality:PersonalProfile)->str:
         return f"""
@@ -99,3 +169,68 @@ class ImprovingBackground:
         Dùng operator khi cần: quotes, AND/OR, site:, filetype:pdf, intitle:, syllabus.
     """
 
+
+_P = ImprovingBackground
+TEMPLATES: Dict[str, PromptTemplate] = {
+    "potential": PromptTemplate("potential", _P.HE_THONG_THUONG_HIEU_CA_NHAN, _P.BACKGROUND_TASK,
+                                ("Object sinh viên (JSON)",)),
+    "personality": PromptTemplate("personality", _P.HE_THONG_THUONG_HIEU_CA_NHAN, _P.PERSONALITY_TASK,
+                                  ("Object cá nhân (JSON)",)),
+    "case": PromptTemplate("case", _P.HE_THONG_THUONG_HIEU_CA_NHAN, _P.CASE_TASK, ("Hồ sơ tổng hợp (JSON)",)),
+    "rubric": PromptTemplate("rubric", _P.CALCULATOR_SYSTEM, _P.SCORE_TASK, ("PotentialAnalysis", "PersonalProfile")),
+    "fused": PromptTemplate("fused", _P.HE_THONG_THUONG_HIEU_CA_NHAN, _P.FUSED_TASK, ("Hồ sơ tổng hợp (JSON)",)),
+}
+
+
+class PromptUsage:
+    """Prompt / cached / completion tokens per template version, as reported by the provider."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def record(self, version: str, input_tokens: int = 0, cached_tokens: int = 0, output_tokens: int = 0) -> None:
+        with self._lock:
+            usage = self._usage.setdefault(
+                version, {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+            )
+            usage["calls"] += 1
+            usage["input_tokens"] += input_tokens or 0
+            usage["cached_tokens"] += cached_tokens or 0
+            usage["output_tokens"] += output_tokens or 0
+
+    def record_message(self, version: str, message: Any) -> Optional[Tuple[int, int, int]]:
+        """
+        Usage from a LangChain AIMessage (usage_metadata); plain strings carry none.
+        Returns the (input, cached, output) tokens it recorded, if any.
+        """
+        usage = getattr(message, "usage_metadata", None)
+        if not usage:
+            return None
+        details = usage.get("input_token_details") or {}
+        counts = (usage.get("input_tokens", 0), details.get("cache_read", 0), usage.get("output_tokens", 0))
+        self.record(version, *counts)
+        return counts
+
+    def record_openai(self, version: str, usage: Any) -> Optional[Tuple[int, int, int]]:
+        """Usage from an OpenAI SDK response (Responses or Chat Completions); returns it like record_message."""
+        if usage is None:
+            return None
+        details = getattr(usage, "input_tokens_details", None) or getattr(usage, "prompt_tokens_details", None)
+        counts = (
+            getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", 0) or 0,
+            (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0,
+            getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", 0) or 0,
+        )
+        self.record(version, *counts)
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            usage = {version: dict(u) for version, u in self._usage.items()}
+        for u in usage.values():
+            u["cached_ratio"] = round(u["cached_tokens"] / u["input_tokens"], 4) if u["input_tokens"] else 0.0
+        return {"templates": {name: t.version for name, t in TEMPLATES.items()}, "usage": usage}
+
+
+prompt_usage = PromptUsage()
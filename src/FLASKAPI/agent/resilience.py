@@ -0,0 +1,304 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .ratelimit import TokenBucket
+
+TRANSIENT_STATUS = (408, 409, 425, 429, 500, 502, 503, 504)
+TRANSIENT_NAMES = ("RateLimit", "Timeout", "Connection", "ServiceUnavailable", "ResourceExhausted",
+                   "InternalServer", "DeadlineExceeded", "ServerError")
+
+
+class CircuitOpen(Exception):
+    """The provider's breaker is open; the call was not attempted."""
+
+
+class Throttled(Exception):
+    """The local rate limit could not admit the call within max_wait."""
+
+
+class PartialStreamError(Exception):
+    """A stream failed after tokens were emitted; retrying would duplicate them."""
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, (CircuitOpen, Throttled, PartialStreamError)):
+        return False
+    for attr in ("status_code", "code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int) and value in TRANSIENT_STATUS:
+            return True
+    response = getattr(exc, "response", None)
+    if isinstance(getattr(response, "status_code", None), int) and response.status_code in TRANSIENT_STATUS:
+        return True
+    return any(name in type(exc).__name__ for name in TRANSIENT_NAMES) or isinstance(exc, (TimeoutError, ConnectionError))
+
+
+@dataclass
+class ProviderPolicy:
+    rpm: float = 500
+    tpm: float = 200_000
+    max_retries: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    max_wait: float = 30.0  # longest we queue on the local rate limit
+    breaker_threshold: int = 5  # consecutive failures that open the breaker
+    breaker_cooldown: float = 30.0
+
+    @classmethod
+    def from_env(cls, provider: str, **defaults: Any) -> "ProviderPolicy":
+        policy = cls(**defaults)
+        prefix = provider.upper()
+        for field, cast in (("rpm", float), ("tpm", float), ("max_retries", int),
+                            ("breaker_threshold", int), ("breaker_cooldown", float), ("max_wait", float)):
+            raw = os.getenv(f"{prefix}_{field.upper()}")
+            if raw:
+                setattr(policy, field, cast(raw))
+        return policy
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True  # let exactly one probe through
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """The admitted call ended without an outcome (cancelled); let the next probe through."""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class Provider:
+    def __init__(self, name: str, policy: ProviderPolicy):
+        self.name = name
+        self.policy = policy
+        self.requests = TokenBucket(policy.rpm)
+        self.tokens = TokenBucket(policy.tpm)
+        self.breaker = CircuitBreaker(policy.breaker_threshold, policy.breaker_cooldown)
+        self.metrics: Dict[str, float] = {
+            "calls": 0, "succeeded": 0, "failed": 0, "retried": 0,
+            "throttled": 0, "throttle_wait_sec": 0.0, "rejected_open": 0, "fallbacks": 0,
+        }
+        self._lock = threading.Lock()
+
+    def count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.metrics[name] += amount
+
+    def admit(self, est_tokens: int) -> None:
+        start = time.monotonic()
+        deadline = start + self.policy.max_wait
+        waited = False
+        for bucket, amount in ((self.requests, 1), (self.tokens, est_tokens)):
+            while True:
+                wait = bucket.try_acquire(amount)
+                if wait == 0.0:
+                    break
+                waited = True
+                if time.monotonic() + wait > deadline:
+                    self.count("throttled")
+                    raise Throttled(f"{self.name}: local rate limit, would wait {wait:.1f}s")
+                time.sleep(min(wait, 1.0))
+        if waited:
+            self.count("throttled")
+            self.count("throttle_wait_sec", time.monotonic() - start)
+
+    async def aadmit(self, est_tokens: int) -> None:
+        # admit() without blocking the event loop
+        start = time.monotonic()
+        deadline = start + self.policy.max_wait
+        waited = False
+        for bucket, amount in ((self.requests, 1), (self.tokens, est_tokens)):
+            while True:
+                wait = bucket.try_acquire(amount)
+                if wait == 0.0:
+                    break
+                waited = True
+                if time.monotonic() + wait > deadline:
+                    self.count("throttled")
+                    raise Throttled(f"{self.name}: local rate limit, would wait {wait:.1f}s")
+                await asyncio.sleep(min(wait, 1.0))
+        if waited:
+            self.count("throttled")
+            self.count("throttle_wait_sec", time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics["throttle_wait_sec"] = round(metrics["throttle_wait_sec"], 3)
+        return {
+            **metrics,
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "requests_available": round(self.requests.available(), 1),
+            "tokens_available": round(self.tokens.available()),
+        }
+
+
+class Resilience:
+    """
+    Shared guard around every provider call: token-bucket admission (requests
+    and tokens per minute), retries with full-jitter exponential backoff for
+    transient errors, and a per-provider circuit breaker that fails fast.
+    """
+
+    def __init__(self, policies: Optional[Dict[str, ProviderPolicy]] = None):
+        self._providers: Dict[str, Provider] = {}
+        self._policies = policies or {}
+        self._lock = threading.Lock()
+
+    def provider(self, name: str) -> Provider:
+        p = self._providers.get(name)
+        if p is None:
+            with self._lock:
+                p = self._providers.get(name)
+                if p is None:
+                    p = Provider(name, self._policies.get(name) or ProviderPolicy.from_env(name))
+                    self._providers[name] = p
+        return p
+
+    def call(self, provider: str, fn: Callable[..., Any], *args: Any, est_tokens: int = 0, **kwargs: Any) -> Any:
+        p = self.provider(provider)
+        policy = p.policy
+        attempt = 0
+        while True:
+            # admission first: a Throttled raised here must not strand a half-open probe
+            p.admit(est_tokens)
+            if not p.breaker.allow():
+                p.count("rejected_open")
+                raise CircuitOpen(f"{provider}: circuit open after {p.breaker.failures} failures")
+            p.count("calls")
+            settled = False
+            try:
+                result = fn(*args, **kwargs)
+                p.breaker.record_success()
+                settled = True
+            except Exception as e:
+                settled = True
+                transient = is_transient(e)
+                if attempt >= policy.max_retries or not transient:
+                    # one failure per call, and only provider trouble: a 400 or a bad prompt says
+                    # nothing about the provider's health and must not open its breaker for everyone
+                    if transient:
+                        p.breaker.record_failure()
+                    else:
+                        p.breaker.release()
+                    p.count("failed")
+                    raise
+                p.breaker.release()  # the call's outcome is decided by its last attempt
+                attempt += 1
+                p.count("retried")
+                delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** attempt))
+                time.sleep(delay)
+                continue
+            finally:
+                if not settled:  # KeyboardInterrupt and the like: no outcome to record
+                    p.breaker.release()
+            p.count("succeeded")
+            return result
+
+    async def acall(self, provider: str, fn: Callable[..., Awaitable[Any]], *args: Any, est_tokens: int = 0,
+                    **kwargs: Any) -> Any:
+        """call() for coroutine functions: same admission, retries and breaker."""
+        p = self.provider(provider)
+        policy = p.policy
+        attempt = 0
+        while True:
+            await p.aadmit(est_tokens)
+            if not p.breaker.allow():
+                p.count("rejected_open")
+                raise CircuitOpen(f"{provider}: circuit open after {p.breaker.failures} failures")
+            p.count("calls")
+            settled = False
+            try:
+                result = await fn(*args, **kwargs)
+                p.breaker.record_success()
+                settled = True
+            except Exception as e:
+                settled = True
+                transient = is_transient(e)
+                if attempt >= policy.max_retries or not transient:
+                    # one failure per call, and only provider trouble: a 400 or a bad prompt says
+                    # nothing about the provider's health and must not open its breaker for everyone
+                    if transient:
+                        p.breaker.record_failure()
+                    else:
+                        p.breaker.release()
+                    p.count("failed")
+                    raise
+                p.breaker.release()  # the call's outcome is decided by its last attempt
+                attempt += 1
+                p.count("retried")
+                await asyncio.sleep(random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** attempt)))
+                continue
+            finally:
+                if not settled:  # cancelled mid-call (CancelledError is a BaseException)
+                    p.breaker.release()
+            p.count("succeeded")
+            return result
+
+    def record_fallback(self, provider: str) -> None:
+        self.provider(provider).count("fallbacks")
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: p.stats() for name, p in list(self._providers.items())}
+
+
+def estimate_tokens(*texts: Any) -> int:
+    # ~4 characters per token is close enough for admission control
+    return sum(len(str(t)) for t in texts) // 4 + 1
+
+
+_resilience: Optional[Resilience] = None
+_resilience_lock = threading.Lock()
+
+
+def get_resilience() -> Resilience:
+    global _resilience
+    if _resilience is None:
+        with _resilience_lock:
+            if _resilience is None:
+                _resilience = Resilience({
+                    "openai": ProviderPolicy.from_env("openai", rpm=500, tpm=200_000),
+                    "gemini": ProviderPolicy.from_env("gemini", rpm=1000, tpm=1_000_000),
+                })
+    return _resilience
@@ -0,0 +1,371 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import DEFAULT_CACHE_DIR, MemoryLRUBackend, canonical, content_key
+from .clients import get_registry
+from .models import StudentCase, improving
+from .resilience import estimate_tokens, get_resilience
+
+
+def case_text(case: StudentCase) -> str:
+    """The StudentCase JSON that gets embedded (key-sorted so field order never matters)."""
+    return json.dumps(canonical(case), ensure_ascii=False, sort_keys=True)
+
+
+# ---- embedders ----
+class OpenAIEmbedder:
+    def __init__(self, model: str = "text-embedding-3-small", client: Any = None):
+        self.model = model
+        self.name = f"openai:{model}"
+        self.client = client or get_registry().openai(api_key=os.getenv("OPENAI_API_KEY"))
+
+    def embed(self, text: str) -> np.ndarray:
+        response = get_resilience().call(
+            "openai", self.client.embeddings.create, model=self.model, input=text, est_tokens=estimate_tokens(text)
+        )
+        return np.asarray(response.data[0].embedding, dtype=np.float32)
+
+
+class HashingEmbedder:
+    """
+    Local, network-free embedding: word and word-bigram feature hashing. Coarser
+    than a learned model, but profiles that share most of their JSON still land
+    close together.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def embed(self, text: str) -> np.ndarray:
+        words = re.findall(r"\w+", text.lower())
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        return vec
+
+
+EMBEDDERS = {"openai": OpenAIEmbedder, "hashing": HashingEmbedder}
+
+
+def _normalize(vec: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+# ---- vector indexes (cosine similarity over unit vectors) ----
+class BruteForceIndex:
+    """Every vector in one float32 matrix; a query is a single matrix-vector product."""
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids: List[int] = []
+
+    def add(self, item_id: int, vec: np.ndarray) -> None:
+        n = len(self._ids)
+        if n == len(self._matrix):
+            grown = np.zeros((n * 2, self.dim), dtype=np.float32)
+            grown[:n] = self._matrix
+            self._matrix = grown
+        self._matrix[n] = vec
+        self._ids.append(item_id)
+
+    def remove(self, item_ids: Iterable[int]) -> None:
+        gone = set(item_ids)
+        keep = [i for i, item_id in enumerate(self._ids) if item_id not in gone]
+        if len(keep) == len(self._ids):
+            return
+        self._matrix[:len(keep)] = self._matrix[keep]
+        self._ids = [self._ids[i] for i in keep]
+
+    def search(self, vec: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        n = len(self._ids)
+        if n == 0:
+            return []
+        scores = self._matrix[:n] @ vec
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._ids[i], float(scores[i])) for i in top]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class HNSWIndex:
+    """Approximate index via hnswlib (optional dependency) for caches too big to scan."""
+
+    def __init__(self, dim: int, capacity: int = 1024, ef: int = 64, m: int = 16):
+        import hnswlib  # optional: only needed when SEMANTIC_CACHE_INDEX=hnsw
+
+        self.dim = dim
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        self._index.init_index(max_elements=capacity, ef_construction=200, M=m)
+        self._index.set_ef(ef)
+        self._ids: set = set()  # live labels; removed ones are only marked deleted in hnswlib
+
+    def add(self, item_id: int, vec: np.ndarray) -> None:
+        used = self._index.get_current_count()
+        if used >= self._index.get_max_elements():
+            self._index.resize_index(used * 2)
+        self._index.add_items(vec[None, :], [item_id])
+        self._ids.add(item_id)
+
+    def remove(self, item_ids: Iterable[int]) -> None:
+        for item_id in item_ids:
+            if item_id in self._ids:
+                self._index.mark_deleted(item_id)
+                self._ids.discard(item_id)
+
+    def search(self, vec: np.ndarray, k: int = 1) -> List[Tuple[int, float]]:
+        if not self._ids:
+            return []
+        labels, distances = self._index.knn_query(vec[None, :], k=min(k, len(self._ids)))
+        # hnswlib's "ip" space reports 1 - inner product
+        return [(int(label), 1.0 - float(dist)) for label, dist in zip(labels[0], distances[0])]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+INDEXES = {"bruteforce": BruteForceIndex, "hnsw": HNSWIndex}
+LOOKUP_CANDIDATES = 4  # nearest rows tried, so an expired or evicted neighbour cannot shadow a live one
+
+
+@dataclass
+class SemanticHit:
+    similarity: float
+    advice: improving
+    web: Dict[str, str]
+    source_key: str
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of case advice and search results.
+
+    Each stored StudentCase is embedded once; the vectors and payloads live in
+    SQLite so every worker (and restart) sees them, and each worker mirrors the
+    vectors into its in-memory index, picking up rows added by other workers on
+    the next lookup. A lookup is a hit when the nearest live stored case is at
+    least `threshold` cosine-similar.
+
+    Rows older than `ttl` are deleted on store() and dropped from the in-memory
+    index on lookup; past `max_entries` the oldest rows are evicted.
+    """
+
+    def __init__(self, path: Path, embedder: Any, index: str = "bruteforce", threshold: float = 0.95,
+                 ttl: Optional[float] = 7 * 24 * 3600, max_entries: int = 100_000):
+        self.path = Path(path)
+        self.embedder = embedder
+        self.index_kind = index
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._index: Any = None
+        self._last_id = 0
+        self._loaded: Deque[Tuple[float, int]] = deque()  # (created_at, id) in id order, to expire the index
+        self._vectors = MemoryLRUBackend(max_entries=256)  # case_key -> vector, so store() does not re-embed
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stored": 0, "expired": 0, "purged": 0, "evicted": 0,
+                         "errors": 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_cases ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, case_key TEXT NOT NULL, embedder TEXT NOT NULL,"
+            "vector BLOB NOT NULL, advice TEXT NOT NULL, web TEXT NOT NULL, created_at REAL NOT NULL,"
+            "UNIQUE (case_key, embedder))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS semantic_cases_created ON semantic_cases (created_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def _cutoff(self) -> float:
+        return time.time() - self.ttl if self.ttl else 0
+
+    def _new_index(self, dim: int) -> Any:
+        try:
+            return INDEXES[self.index_kind](dim)
+        except ImportError as e:
+            print(f"[semantic] {self.index_kind} index unavailable ({e}); using bruteforce")
+            self.index_kind = "bruteforce"
+            return BruteForceIndex(dim)
+
+    def _sync(self) -> None:
+        # pull rows written since the last lookup, including other workers' rows
+        cutoff = self._cutoff()
+        rows = self._conn().execute(
+            "SELECT id, vector, created_at FROM semantic_cases WHERE id > ? AND embedder = ? AND created_at >= ?"
+            " ORDER BY id",
+            (self._last_id, self.embedder.name, cutoff),
+        ).fetchall()
+        with self._lock:
+            for item_id, blob, created_at in rows:
+                if item_id <= self._last_id:
+                    continue
+                vec = np.frombuffer(blob, dtype=np.float32)
+                if self._index is None:
+                    self._index = self._new_index(len(vec))
+                self._index.add(item_id, vec)
+                self._loaded.append((created_at, item_id))
+                self._last_id = item_id
+            # ids grow with time, so the expired vectors are at the front
+            expired = []
+            while self._loaded and self._loaded[0][0] < cutoff:
+                expired.append(self._loaded.popleft()[1])
+            if expired:
+                self._index.remove(expired)
+
+    def _drop(self, item_ids: List[int]) -> None:
+        if item_ids:
+            with self._lock:
+                if self._index is not None:
+                    self._index.remove(item_ids)
+
+    def _vector(self, case: StudentCase, key: str) -> np.ndarray:
+        vec = self._vectors.get(key)
+        if vec is None:
+            vec = _normalize(self.embedder.embed(case_text(case)).astype(np.float32))
+            self._vectors.set(key, vec)
+        return vec
+
+    def lookup(self, case: StudentCase) -> Optional[SemanticHit]:
+        key = content_key(case)
+        try:
+            vec = self._vector(case, key)
+            self._sync()
+            with self._lock:
+                nearest = self._index.search(vec, LOOKUP_CANDIDATES) if self._index is not None else []
+            candidates = [(i, sim) for i, sim in nearest if sim >= self.threshold]
+            if not candidates:
+                self._count("misses")
+                return None
+            row = None
+            for item_id, similarity in candidates:
+                row = self._conn().execute(
+                    "SELECT case_key, advice, web, created_at FROM semantic_cases WHERE id = ? AND created_at >= ?",
+                    (item_id, self._cutoff()),
+                ).fetchone()
+                if row is not None:
+                    break
+                self._drop([item_id])  # expired, or evicted by another worker
+        except Exception as e:
+            print(f"[semantic] lookup failed: {e}")
+            self._count("errors")
+            return None
+        if row is None:
+            self._count("expired")
+            return None
+        self._count("hits")
+        return SemanticHit(
+            similarity=round(min(similarity, 1.0), 4),
+            advice=improving.model_validate_json(row[1]),
+            web=json.loads(row[2]),
+            source_key=row[0],
+        )
+
+    def store(self, case: StudentCase, advice: improving, web: Dict[str, str]) -> None:
+        key = content_key(case)
+        try:
+            vec = self._vector(case, key)
+            conn = self._conn()
+            with conn:
+                expired, evicted = self._make_room(conn)
+                conn.execute(
+                    "INSERT OR IGNORE INTO semantic_cases (case_key, embedder, vector, advice, web, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, self.embedder.name, vec.tobytes(), advice.model_dump_json(),
+                     json.dumps(web or {}, ensure_ascii=False), time.time()),
+                )
+        except Exception as e:
+            print(f"[semantic] store failed: {e}")
+            self._count("errors")
+            return
+        self._drop(expired + evicted)
+        self._count("purged", len(expired))
+        self._count("evicted", len(evicted))
+        self._count("stored")
+
+    def _make_room(self, conn: sqlite3.Connection) -> Tuple[List[int], List[int]]:
+        """Delete expired rows, then the oldest ones until one more fits; returns both id lists."""
+        cutoff = self._cutoff()
+        expired = [i for (i,) in conn.execute("SELECT id FROM semantic_cases WHERE created_at < ?", (cutoff,))]
+        (count,) = conn.execute("SELECT COUNT(*) FROM semantic_cases").fetchone()
+        over = count - len(expired) - self.max_entries + 1
+        evicted = []
+        if over > 0:
+            evicted = [i for (i,) in conn.execute(
+                "SELECT id FROM semantic_cases WHERE created_at >= ? ORDER BY id LIMIT ?", (cutoff, over))]
+        conn.executemany("DELETE FROM semantic_cases WHERE id = ?", [(i,) for i in expired + evicted])
+        return expired, evicted
+
+    def stats(self) -> Dict[str, Any]:
+        (count,) = self._conn().execute(
+            "SELECT COUNT(*) FROM semantic_cases WHERE embedder = ?", (self.embedder.name,)
+        ).fetchone()
+        with self._lock:
+            counters = dict(self.counters)
+            indexed = len(self._index) if self._index is not None else 0
+        lookups = counters["hits"] + counters["misses"] + counters["expired"]
+        return {
+            **counters,
+            "embedder": self.embedder.name,
+            "index": self.index_kind,
+            "threshold": self.threshold,
+            "entries": count,
+            "indexed": indexed,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+_semantic_cache: Optional[SemanticCache] = None
+_semantic_cache_init = False
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """SemanticCache configured from SEMANTIC_CACHE_* env vars, or None when SEMANTIC_CACHE_BACKEND=none."""
+    global _semantic_cache, _semantic_cache_init
+    if _semantic_cache_init:
+        return _semantic_cache
+    with _semantic_cache_lock:
+        if not _semantic_cache_init:
+            if os.getenv("SEMANTIC_CACHE_BACKEND", "sqlite").lower() not in ("none", "off", ""):
+                embedder = EMBEDDERS[os.getenv("SEMANTIC_CACHE_EMBEDDER", "openai").lower()]()
+                _semantic_cache = SemanticCache(
+                    Path(os.getenv("SEMANTIC_CACHE_PATH", DEFAULT_CACHE_DIR / "semantic.sqlite")),
+                    embedder,
+                    index=os.getenv("SEMANTIC_CACHE_INDEX", "bruteforce").lower(),
+                    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)),
+                    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", 7 * 24 * 3600)) or None,
+                    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 100_000)),
+                )
+            _semantic_cache_init = True
+    return _semantic_cache
@@ -1,143 +1,532 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Tuple
 from langgraph.graph import StateGraph, END
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import GoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage
-from .models import PotentialAnalysis, PersonalProfile, StudentCase, RubricScore, improving
-from dotenv import load_dotenv
-from .prompts import ImprovingBackground
+from .models import PotentialAnalysis, PersonalProfile, StudentCase, RubricScore, improving, FusedAnalysis
+from .prompts import TEMPLATES, prompt_usage
+import json
+import logging
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from .engine import gogoduck_trafilatura_openai
+from .localindex import LocalIndex, get_local_index
+from .prescore import PreScorer, SampleLog, get_prescorer, get_sample_log
+from .clients import ClientRegistry, get_registry
+from .cache import Cache, content_key, get_stage_cache
+from .resilience import PartialStreamError, Resilience, estimate_tokens, get_resilience
+from .metrics import PREFIX, bind, metrics
+
+
+# improving fields that name something to look up, searched one by one
+SEARCH_CATEGORIES = ("newspaper", "books", "article", "certificatin_course")
+SEARCH_K = 2  # results per category
+WEB_QUERY_MAX_WORDS = 16
+
+# failures also count in the resilience stats and spans; this is for debugging only
+logger = logging.getLogger(f"{PREFIX}.workflow")
+
+
+def _web_query(text: str) -> str:
+    # search engines do badly on paragraph-length queries
+    return " ".join(text.split()[:WEB_QUERY_MAX_WORDS])
+
+
+def _fallback(result):
+    """Mark a stage's stand-in result so it is never mistaken for a real answer."""
+    if isinstance(result, dict):
+        result["fallback"] = True
+    else:
+        result._fallback = True
+    return result
+
+
+def is_fallback(result) -> bool:
+    if isinstance(result, dict):
+        return bool(result.get("fallback"))
+    return bool(getattr(result, "_fallback", False))
+
+
+@dataclass
+class Route:
+    """Which models may answer a stage, in preference order, and when to hedge."""
+    models: List[str]
+    hedge_after: Optional[float] = None  # seconds before the backup is fired; None disables hedging
+
+
+def _default_hedge() -> Optional[float]:
+    raw = os.getenv("ROUTER_HEDGE_AFTER_SEC", "6")
+    try:
+        value = float(raw)
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+
+def default_routes() -> Dict[str, Route]:
+    """
+    Built-in routes, overridable per stage with ROUTER_ROUTES, e.g.
+    {"rubric": {"models": ["gpt-4o-mini"], "hedge_after": null}}.
+    """
+    hedge = _default_hedge()
+    routes = {
+        "potential": Route(["gemini-2.5-flash", "gpt-4o-mini"], hedge),
+        "personality": Route(["gemini-2.5-flash", "gpt-4o-mini"], hedge),
+        "case": Route(["gpt-4o-mini", "gemini-2.5-flash"], hedge),
+        "rubric": Route(["gpt-4o-mini", "gemini-2.5-flash"], hedge),
+        "fused": Route(["gpt-4o-mini"]),
+    }
+    raw = os.getenv("ROUTER_ROUTES")
+    if raw:
+        for stage, cfg in json.loads(raw).items():
+            base = routes.get(stage, Route([]))
+            routes[stage] = Route(list(cfg.get("models", base.models)), cfg.get("hedge_after", base.hedge_after))
+    return routes
+
+
+class ModelStats:
+    """Live EWMAs of one model's latency (successes only) and error rate."""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            a = self.alpha
+            self.error_rate = (1 - a) * self.error_rate + a * (0.0 if ok else 1.0)
+            if ok:
+                self.latency = elapsed if self.latency is None else (1 - a) * self.latency + a * elapsed
+            else:
+                self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls, "errors": self.errors, "wins": self.wins,
+            "latency_ewma_sec": None if self.latency is None else round(self.latency, 3),
+            "error_ewma": round(self.error_rate, 3),
+        }
+
+
+class ModelRouter:
+    """
+    Sends a stage's prompt to one of the models its Route allows.
+
+    Candidates are ranked by latency EWMA inflated by the error EWMA (untried
+    backups rank last, so the configured primary wins until there is data).
+    If the leader has not answered after `hedge_after` seconds the next model
+    gets the same prompt and the first good answer wins; when a model fails,
+    the next one is tried. Every call still goes through Resilience.
+    """
+
+    # model name -> (provider, temperature)
+    MODELS: Dict[str, Tuple[str, float]] = {
+        "gpt-4o-mini": ("openai", 0.1),
+        "gemini-2.5-flash": ("gemini", 0.3),
+    }
+    PRIOR_LATENCY = 10.0  # stands in for a model that has only ever failed
+
+    def __init__(self, registry: ClientRegistry, resilience: Resilience,
+                 routes: Optional[Dict[str, Route]] = None, alpha: float = 0.2, error_penalty: float = 4.0,
+                 max_workers: int = 16):
+        self.registry = registry
+        self.resilience = resilience
+        self.routes = routes or default_routes()
+        self.error_penalty = error_penalty
+        self.models = {name: ModelStats(alpha) for name in self.MODELS}
+        self.counters: Dict[str, Dict[str, int]] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="router")
+        self._lock = threading.Lock()
+        for stage, route in self.routes.items():
+            unknown = [m for m in route.models if m not in self.MODELS]
+            if unknown or not route.models:
+                raise ValueError(f"route {stage!r}: unknown or empty models {unknown or route.models}")
+
+    def route(self, stage: str) -> Route:
+        return self.routes[stage]
+
+    def route_key(self, stage: str) -> str:
+        # any allowed model may have produced a cached answer
+        return "|".join(self.routes[stage].models)
+
+    def provider(self, model: str) -> str:
+        return self.MODELS[model][0]
+
+    def llm(self, model: str, structured: bool = False):
+        provider, temperature = self.MODELS[model]
+        if provider == "openai":
+            return self.registry.chat_openai(model=model, temperature=temperature)
+        if structured:
+            return self.registry.gemini_chat(model=model, temperature=temperature)
+        return self.registry.gemini(model=model, temperature=temperature)
+
+    def _count(self, stage: str, name: str) -> None:
+        with self._lock:
+            counters = self.counters.setdefault(stage, {"calls": 0, "hedged": 0, "hedge_won": 0, "failovers": 0})
+            counters[name] += 1
+
+    def _score(self, model: str, primary: bool) -> float:
+        s = self.models[model]
+        if s.calls == 0:
+            return 0.0 if primary else float("inf")
+        latency = s.latency if s.latency is not None else self.PRIOR_LATENCY
+        return latency * (1 + self.error_penalty * s.error_rate)
+
+    def rank(self, stage: str) -> List[str]:
+        models = self.routes[stage].models
+        scored = [(self._score(m, i == 0), i, m) for i, m in enumerate(models)]
+        return [m for _, _, m in sorted(scored)]
+
+    def _timed(self, model: str, fn: Callable[[], Any]) -> Any:
+        started = time.monotonic()
+        try:
+            result = fn()
+        except Exception:
+            self.models[model].record(time.monotonic() - started, ok=False)
+            raise
+        self.models[model].record(time.monotonic() - started, ok=True)
+        return result
+
+    def _call(self, stage: str, model: str, messages, schema: Optional[type]) -> Any:
+        llm = self.llm(model, structured=schema is not None)
+        runnable = self.registry.structured(llm, schema, include_raw=True) if schema is not None else llm
+        est = estimate_tokens(*(m.content for m in messages))
+        version = TEMPLATES[stage].version
+        provider = self.provider(model)
+
+        def record(message) -> None:
+            usage = prompt_usage.record_message(version, message)
+            if usage is not None:
+                metrics.tokens(provider, model, input_tokens=usage[0], cached_tokens=usage[1], output_tokens=usage[2])
+
+        def call():
+            with metrics.span("llm", provider=provider, model=model, stage=stage):
+                result = self.resilience.call(provider, runnable.invoke, messages, est_tokens=est)
+                if schema is not None:
+                    record(result["raw"])
+                    if result["parsed"] is None:
+                        raise result["parsing_error"] or ValueError(f"{model} returned no {schema.__name__}")
+                    return result["parsed"]
+            # chat models answer with a message, GoogleGenerativeAI with a str
+            record(result)
+            return result if isinstance(result, str) else result.content
+
+        return self._timed(model, call)
+
+    def invoke(self, stage: str, messages, schema: Optional[type] = None) -> Any:
+        """Best answer for `stage`: hedged after route.hedge_after, failing over on errors."""
+        route = self.routes[stage]
+        order = self.rank(stage)
+        self._count(stage, "calls")
+        backups = order[1:]
+        futures = {self._pool.submit(bind(self._call), stage, order[0], messages, schema): order[0]}
+        hedged = False
+        error: Optional[BaseException] = None
+        while futures:
+            hedge_now = not hedged and backups and route.hedge_after is not None
+            done, _ = wait(futures, timeout=route.hedge_after if hedge_now else None, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                self._count(stage, "hedged")
+                model = backups.pop(0)
+                futures[self._pool.submit(bind(self._call), stage, model, messages, schema)] = model
+                continue
+            for future in done:
+                model = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self.models[model].wins += 1
+                if model != order[0]:
+                    self._count(stage, "hedge_won" if hedged else "failovers")
+                return result  # a losing hedge finishes in the background; its answer is dropped
+            if not futures and backups:
+                model = backups.pop(0)
+                futures[self._pool.submit(bind(self._call), stage, model, messages, schema)] = model
+        raise error
+
+    def stream(self, stage: str, messages, on_token: Callable[[str], None]) -> str:
+        """
+        Streamed answers cannot be hedged (two streams would interleave), but a
+        model that fails before its first token is failed over.
+        """
+        self._count(stage, "calls")
+        order = self.rank(stage)
+        est = estimate_tokens(*(m.content for m in messages))
+        version = TEMPLATES[stage].version
+        error: Optional[BaseException] = None
+        for i, model in enumerate(order):
+            llm = self.llm(model)
+
+            def stream() -> str:
+                parts = []
+                try:
+                    for chunk in llm.stream(messages):
+                        text = chunk if isinstance(chunk, str) else getattr(chunk, "content", "")
+                        if text:
+                            parts.append(text)
+                            on_token(text)
+                        usage = prompt_usage.record_message(version, chunk)  # arrives on one (usually the last) chunk
+                        if usage is not None:
+                            metrics.tokens(self.provider(model), model, input_tokens=usage[0],
+                                           cached_tokens=usage[1], output_tokens=usage[2])
+                except Exception as e:
+                    if parts:
+                        raise PartialStreamError(f"{type(e).__name__}: {e}") from e
+                    raise
+                return "".join(parts)
+
+            try:
+                with metrics.span("llm", provider=self.provider(model), model=model, stage=stage):
+                    result = self._timed(model, lambda: self.resilience.call(self.provider(model), stream, est_tokens=est))
+            except PartialStreamError:
+                raise
+            except Exception as e:
+                error = e
+                continue
+            self.models[model].wins += 1
+            if i:
+                self._count(stage, "failovers")
+            return result
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {stage: dict(c) for stage, c in self.counters.items()}
+        return {
+            "routes": {stage: {"models": r.models, "hedge_after": r.hedge_after, "ranked": self.rank(stage)}
+                       for stage, r in self.routes.items()},
+            "models": {name: s.stats() for name, s in self.models.items()},
+            "stages": counters,
+        }
 
 class WorkFlow:
-    def __init__(self):
-        load_dotenv()
+    def __init__(self, registry: Optional[ClientRegistry] = None, cache: Optional[Cache] = None,
+                 resilience: Optional[Resilience] = None, router: Optional[ModelRouter] = None,
+                 index: Optional[LocalIndex] = None, prescorer: Optional[PreScorer] = None,
+                 samples: Optional[SampleLog] = None):
+        self.registry = registry or get_registry()
+        self.cache = cache or get_stage_cache()
+        self.resilience = resilience or get_resilience()
+        self.router = router or ModelRouter(self.registry, self.resilience)
+        self.index = index or get_local_index()
+        self.prescorer = prescorer or get_prescorer()
+        self.samples = samples or get_sample_log()  # LLM rubrics to fit the pre-scorer on
         # Scrape model
-        # Analyzing models
-        self.llm1 = ChatOpenAI(model= "gpt-4o-mini",temperature=0.1)
-        self.llm2 = GoogleGenerativeAI(model = "gemini-2.5-flash",temperature = 0.3,api_key = os.getenv("GEMINI_API_KEY"))
-        self.prompts = ImprovingBackground()
+        # Analyzing models (primaries; ModelRouter may hedge or fail over to the other)
+        self.llm1 = self.registry.chat_openai(model= "gpt-4o-mini",temperature=0.1)
+        self.llm2 = self.registry.gemini(model = "gemini-2.5-flash",temperature = 0.3)
+        self.templates = TEMPLATES
+
+    def _cache_key(self, stage: str, *inputs) -> str:
+        # the template version hashes the static prompt text, so editing a prompt changes the key
+        return content_key(stage, self.router.route_key(stage), self.templates[stage].version, *inputs)
+
+    def _generate(self, stage: str, messages, on_token: Optional[Callable[[str], None]] = None) -> str:
+        # stream token by token when someone is listening, otherwise one (hedged) round-trip
+        if on_token is None:
+            return self.router.invoke(stage, messages)
+        return self.router.stream(stage, messages, on_token)
 
-    def _analyze_potential(self,state:PotentialAnalysis):
-        print(f"Analyzing your background....")
+    def _fail(self, stage: str, result):
+        self.resilience.record_fallback(self.router.provider(self.router.route(stage).models[0]))
+        return _fallback(result)
+
+    def _analyze_potential(self,state:PotentialAnalysis, on_token: Optional[Callable[[str], None]] = None):
         # structure_llm = self.llm.with_structured_output(PotentialAnalysis)
 
-        messages = [
-                SystemMessage(self.prompts.HE_THONG_THUONG_HIEU_CA_NHAN),
-                HumanMessage(self.prompts.BackgroundAnalysis(state))
-                ]
+        messages = self.templates["potential"].messages(state)
+        key = self._cache_key("potential", state)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return {"result": cached}
 
         try:
-            result = self.llm2.invoke(messages)
+            result = self._generate("potential", messages, on_token)
+            self.cache.set(key, result)
             return {"result":result}
         except Exception as e:
-            print(e)
-            return {"result":"Failed to generate"}
+            logger.debug("potential failed, using the fallback: %s", e)
+            return self._fail("potential", {"result":"Failed to generate"})
 
-    def _analyze_personality(self,state:PersonalProfile)-> Dict[str,Any]:
-        print(f"Analyzing your personality....")
+    def _analyze_personality(self,state:PersonalProfile, on_token: Optional[Callable[[str], None]] = None)-> Dict[str,Any]:
         # structure_llm = self.llm.with_structured_output(PotentialAnalysis)
 
-        messages = [
-                SystemMessage(content=self.prompts.HE_THONG_THUONG_HIEU_CA_NHAN),
-                HumanMessage(content = self.prompts.PersonalityBranding(state))
-                ]
+        messages = self.templates["personality"].messages(state)
+        key = self._cache_key("personality", state)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return {"result": cached}
 
         try:
-            result = self.llm2.invoke(messages)
+            result = self._generate("personality", messages, on_token)
+            self.cache.set(key, result)
             return {"result": result}
         except Exception as e:
-            print(e)
-            return {"result":"Failed to generate"}
+            logger.debug("personality failed, using the fallback: %s", e)
+            return self._fail("personality", {"result":"Failed to generate"})
         
     def _analyze_case(self,state:StudentCase)->improving:
-        print(f"Analyzing your Case....")
-        structure_llm = self.llm1.with_structured_output(improving)
 
-        messages = [
-                SystemMessage(content=self.prompts.HE_THONG_THUONG_HIEU_CA_NHAN),
-                HumanMessage(content = self.prompts.case(state))
-                ]
+        messages = self.templates["case"].messages(state)
+        key = self._cache_key("case", state)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return improving.model_validate(cached)
 
         try:
-            result = structure_llm.invoke(messages)
+            result = self.router.invoke("case", messages, improving)
+            self.cache.set(key, result.model_dump())
             return result
         except Exception as e:
-            print(e)
-            return improving(
+            logger.debug("case failed, using the fallback: %s", e)
+            return self._fail("case", improving(
             advice="",
             newspaper = "",
             books="",
             certificatin_course="",
             article = ""
-            )
+            ))
     
     def _rate_profile(self,academic: PotentialAnalysis, personality: PersonalProfile) -> RubricScore:
-        structured_llm = self.llm1.with_structured_output(RubricScore)
-            
-        message = [
-                SystemMessage(self.prompts.CALCULATOR_SYSTEM),
-                HumanMessage(self.prompts.Score(academic=academic,personality=personality))
-                ]
-        structured_llm = self.llm1.with_structured_output(RubricScore)
+        # clear-cut profiles are scored locally; the LLM only sees the ambiguous ones
+        estimate = self.prescorer.estimate(academic, personality) if self.prescorer is not None else None
+        if estimate is not None and estimate.confident:
+            return estimate.rubric
+        message = self.templates["rubric"].messages(academic, personality)
+        key = self._cache_key("rubric", academic, personality)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return RubricScore.model_validate(cached)
         try:
-            
-            message = [
-                    SystemMessage(self.prompts.CALCULATOR_SYSTEM),
-                    HumanMessage(self.prompts.Score(academic=academic,personality=personality))
-                    ]
-            result = structured_llm.invoke(message)
+            result = self.router.invoke("rubric", message, RubricScore)
+            self.cache.set(key, result.model_dump())
+            if self.prescorer is not None:
+                self.prescorer.observe(academic, personality, result, estimate)
+                result._confidence = estimate.confidence
+            elif self.samples is not None:
+                self.samples.append(academic, personality, result)
             return result
         except Exception as e:
-            print(str(e))
-            return RubricScore(
+            logger.debug("rubric failed, using the fallback: %s", e)
+            return self._fail("rubric", RubricScore(
                     professional_knowledge=0,
                     practical_skills=0,
                     experience_achievements=0,
                     personal_branding=0,
                     goals_vision=0,
                     growth_potential=0
-                )
-
-    def _search_information(self,advide:improving):
-
+                ))
 
-        queries = []
-        if getattr(advide, "newspaper", None):
-            queries.append(advide.newspaper)
-        if getattr(advide, "books", None):
-            queries.append(advide.books)
-        if getattr(advide, "article", None):
-            queries.append(advide.article)
-        if getattr(advide, "certificatin_course", None):
-            queries.append(advide.certificatin_course)
-
-
-        if not queries and getattr(advide, "advice", None):
-            queries.append(advide.advice)
-
-        query = " ".join(q for q in queries if q).strip()
-        if not query:
-            return {}
+    def _analyze_fused(self, case: StudentCase) -> Optional[FusedAnalysis]:
+        """
+        All four per-profile stages in one structured call. Returns None when the
+        call fails or the answer does not validate, so callers can fall back to
+        the per-stage path.
+        """
+        messages = self.templates["fused"].messages(case)
+        key = self._cache_key("fused", case)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return FusedAnalysis.model_validate(cached)
+        try:
+            result = self.router.invoke("fused", messages, FusedAnalysis)
+        except Exception as e:
+            logger.debug("fused call failed: %s", e)
+            return None
+        problems = result.problems()
+        if problems:
+            logger.debug("fused result rejected: %s", problems)
+            return None
+        self.cache.set(key, result.model_dump())
+        return result
 
+    def _search_category(self, category: str, query: str) -> List[Dict[str, Any]]:
+        """Local index first; the live web (whose results then join the index) only on a miss."""
+        if self.index is not None:
+            hits = self.index.search(query, category=category, k=SEARCH_K)
+            if hits:
+                return hits
         payload = gogoduck_trafilatura_openai(
-            query=query,
-            k=3,
+            query=_web_query(query),
+            k=SEARCH_K,
             region="vn-vi",
             backend="duckduckgo",
             model="gpt-4o-mini",
             verbose=False,
         )
+        if self.index is not None and isinstance(payload, dict):
+            self.index.add_payload(payload, category=category)
+        return payload.get("results", []) if isinstance(payload, dict) else []
+
+    def _search_information(self,advide:improving):
+
+        # one search per suggestion category instead of one long joined query
+        queries = {}
+        for category in SEARCH_CATEGORIES:
+            text = (getattr(advide, category, None) or "").strip()
+            if text:
+                queries[category] = text
 
+        if not queries and (getattr(advide, "advice", None) or "").strip():
+            queries["advice"] = advide.advice.strip()
 
-        results = payload.get("results", []) if isinstance(payload, dict) else []
+        if not queries:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="search") as pool:
+            futures = {category: pool.submit(bind(self._search_category), category, q) for category, q in queries.items()}
+            found = {}
+            for category, future in futures.items():
+                try:
+                    found[category] = future.result()
+                except Exception as e:
+                    logger.debug("search failed for %s: %s", category, e)
+                    found[category] = []
+
+        # a result whose scrape or summary failed still has a good link (book and
+        # course pages often block scraping), so only the URL decides
         web_links = {}
-        for item in results:
-            if not isinstance(item, dict):
-                continue
-            title = (item.get("title") or "").strip() or f"link_{item.get('rank', len(web_links) + 1)}"
-            url = (item.get("url") or "").strip()
-            if url:
+        seen = set()
+        for category in queries:
+            for item in found[category]:
+                if not isinstance(item, dict):
+                    continue
+                url = (item.get("url") or "").strip()
+                if not url or url in seen:
+                    continue
+                seen.add(url)
+                title = (item.get("title") or "").strip() or f"link_{item.get('rank', len(web_links) + 1)}"
+                if title in web_links:  # same title, different page: keep both
+                    title = f"{title} ({len(web_links) + 1})"
                 web_links[title] = url
 
         return web_links
+
+
+_workflow: Optional[WorkFlow] = None
+_workflow_pid: Optional[int] = None
+_workflow_lock = threading.Lock()
+
+
+def get_workflow() -> WorkFlow:
+    """One WorkFlow per worker process, built on the shared client registry."""
+    global _workflow, _workflow_pid
+    pid = os.getpid()
+    if _workflow is not None and _workflow_pid == pid:
+        return _workflow
+    with _workflow_lock:
+        if _workflow is None or _workflow_pid != pid:
+            _workflow = WorkFlow()
+            _workflow_pid = pid
+        return _workflow
@@ -3,6 +3,8 @@ from flask import Blueprint, jsonify, request
 from api.schemas.inputschema import PotentialAnalysisSchema, PersonalProfileSchema
 from agent.models import PotentialAnalysis, PersonalProfile
 from services.loadFile import save_potential, save_personality
+from services.profileStore import InvalidUserId
+from api.controllers.utils import request_user_id
 
 PotentialAnalysisRequest = PotentialAnalysisSchema()
 PersonalProfileRequest = PersonalProfileSchema()
@@ -13,6 +15,10 @@ bp = Blueprint("UserInput",__name__,url_prefix="/input")
 @bp.route("/potential",methods = ["POST"])
 def PotentialAnalysisInput():
     data = request.get_json()
+    try:
+        user_id = request_user_id()
+    except InvalidUserId as e:
+        return jsonify({"error": str(e)}), 400
     errors = PotentialAnalysisRequest.validate(data)
     if errors:
         return jsonify(errors),400
@@ -27,7 +33,7 @@ def PotentialAnalysisInput():
       mentor=data.get("mentor")
        )
 
-        save_potential(potential=potential)
+        save_potential(potential=potential, user_id=user_id)
 
         return jsonify(PotentialAnalysisRequest.dump(potential)),201
     except Exception as e:
@@ -36,6 +42,10 @@ def PotentialAnalysisInput():
 @bp.route("/personality",methods = ["POST"])
 def PersonalProfileInput():
     data = request.get_json()
+    try:
+        user_id = request_user_id()
+    except InvalidUserId as e:
+        return jsonify({"error": str(e)}), 400
     errors = PersonalProfileRequest.validate(data)
     if errors:
         return jsonify(errors),400
@@ -48,7 +58,7 @@ def PersonalProfileInput():
     exciting_topics = data.get("exciting_topics"),
     goals = data.get("goals")
        )
-       save_personality(personality=personality)
+       save_personality(personality=personality, user_id=user_id)
        return jsonify(PersonalProfileRequest.dump(personality)),201
     except Exception as e:
         return jsonify({"error":str(e)}),400
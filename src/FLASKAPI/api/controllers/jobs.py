@@ -0,0 +1,72 @@
+from flask import Blueprint, jsonify, request
+
+from services.jobs import get_job_manager, QueueFull, DONE
+from services.profileStore import InvalidUserId, check_user_id
+from api.controllers.utils import request_user_id
+
+
+bp = Blueprint("jobs", __name__, url_prefix="/AnalyzedData/jobs")
+
+
+def _job_response(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "user_id": job["user_id"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "deadline": job["deadline"],
+        "error": job["error"],
+        "timings": job["timings"],
+        # the full Conclusion once done, whatever has finished so far otherwise
+        "result" if job["status"] == DONE else "partial": job["partial"],
+    }
+
+
+@bp.route("", methods=["POST"])
+def submit_job():
+    data = request.get_json(silent=True) or {}
+    try:
+        user_id = check_user_id(data["user_id"]) if data.get("user_id") else request_user_id()
+    except InvalidUserId as e:
+        return jsonify({"error": str(e)}), 400
+    manager = get_job_manager()
+    deadline_sec = data.get("deadline_sec")
+    if deadline_sec is not None and (
+        isinstance(deadline_sec, bool) or not isinstance(deadline_sec, (int, float))
+        or not 0 < deadline_sec <= manager.max_deadline_sec
+    ):
+        return jsonify({"error": f"deadline_sec must be a number of seconds in (0, {manager.max_deadline_sec:g}]"}), 400
+    try:
+        job_id = manager.submit(
+            user_id=user_id,
+            deadline_sec=deadline_sec,
+        )
+    except QueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response, 429
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    response = jsonify({"job_id": job_id, "status": "queued"})
+    response.headers["Location"] = f"{bp.url_prefix}/{job_id}"
+    return response, 202
+
+
+@bp.route("/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = get_job_manager().status(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(_job_response(job)), 200
+
+
+@bp.route("/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    manager = get_job_manager()
+    if manager.status(job_id) is None:
+        return jsonify({"error": "job not found"}), 404
+    if not manager.cancel(job_id):
+        return jsonify({"error": "job already finished"}), 409
+    return jsonify(_job_response(manager.status(job_id))), 202
@@ -1,23 +1,197 @@
-from flask import Blueprint, jsonify
+import json
+import queue
+import threading
+import time
+
+from flask import Blueprint, Response, jsonify, request
 
 from api.schemas.outputSchema import ConclusionSchema
-from services.AnalyzingData import _return_result
+from agent.metrics import bind
+from services.AnalyzingData import _return_result, stage_value, STAGE_FIELDS
+from services.profileStore import InvalidUserId
+from services.cohort import cohort_stats
+from services.resultStore import get_result_store
+from agent.cache import content_key
+from api.controllers.utils import request_user_id
 
 
 bp = Blueprint("ouput", __name__, url_prefix="/AnalyzedData")
 
 resultResopnse = ConclusionSchema()
 
+SSE_HEARTBEAT_SEC = 15
+_END = object()
+
+
+def _server_timing(timings: dict) -> str:
+    return ", ".join(f"{name};dur={ms}" for name, ms in timings.items())
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _flag(name: str) -> bool:
+    return request.args.get(name, "").lower() in ("1", "true", "yes")
+
 
 @bp.route("/Advices", methods=["GET"])
 def get_advices():
+    """
+    The stored Conclusion for the user's current profile, computed only when
+    there is none (the profile changed, or nothing stored yet) or ?force=1.
+    Stored answers carry an ETag, so a repeat request with If-None-Match is a 304.
+    """
     try:
-        data = _return_result()
+        data = _return_result(
+            UserID=request_user_id(), mode=request.args.get("mode", "concurrent"), reuse=not _flag("force")
+        )
 
         if not data or "result" not in data:
             return jsonify({"error": "No result generated"}), 500
 
         conclusion = data["result"]
-        return jsonify(resultResopnse.dump(conclusion)), 200
+        stored = data.get("stored")
+        response = jsonify(resultResopnse.dump(conclusion))
+        if data.get("timings"):
+            response.headers["Server-Timing"] = _server_timing(data["timings"])
+        response.headers["X-Result-Source"] = "stored" if data.get("reused") else "computed"
+        if stored is not None:
+            response.set_etag(stored.digest)
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.last_modified = stored.created_at
+            return response.make_conditional(request)
+        return response, 200
+    except InvalidUserId as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/Advices/history", methods=["GET"])
+def get_history():
+    """
+    Stored Conclusions for the user, newest first. ?limit= (1–50, default 10)
+    and ?before=<id> page through them; `next_before` is the cursor for the
+    next page. Pages never change once written, so each has an ETag.
+    """
+    try:
+        user_id = request_user_id()
+        limit = min(max(request.args.get("limit", default=10, type=int), 1), 50)
+        before = request.args.get("before", type=int)
+        results = get_result_store()
+        items = results.history(user_id, limit=limit + 1, before=before)
+        page, more = items[:limit], len(items) > limit
+        current = results.latest(user_id)
+        etag = content_key("history", user_id, [r.digest for r in page], current.id if current else None)[:32]
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        response = jsonify({
+            "user_id": user_id,
+            "items": [
+                {
+                    "id": r.id,
+                    "profile_version": r.profile_version,
+                    "created_at": r.created_at,
+                    "latest": current is not None and r.id == current.id,
+                    "timings": r.timings,
+                    "result": resultResopnse.dump(r.conclusion),
+                }
+                for r in page
+            ],
+            "next_before": page[-1].id if more else None,
+        })
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response, 200
+    except InvalidUserId as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route("/Advices/stream", methods=["GET"])
+def stream_advices():
+    """
+    Server-Sent Events variant of /Advices. Each Conclusion field is sent as its
+    own event (potentialResult, personalityResult, source_advice, rubricResult,
+    web) the moment its stage finishes; free-text analyses also stream as
+    `delta` events. The stream ends with `done` (timings, fallbacks,
+    semantic hit) or `error`.
+    """
+    try:
+        user_id = request_user_id()
+    except InvalidUserId as e:
+        return jsonify({"error": str(e)}), 400
+    events: "queue.Queue" = queue.Queue()
+    disconnected = threading.Event()
+
+    def on_stage(name, result):
+        if disconnected.is_set():
+            raise RuntimeError("client disconnected")
+        events.put((STAGE_FIELDS[name], stage_value(name, result)))
+
+    def on_token(name, text):
+        if not disconnected.is_set():
+            events.put(("delta", {"field": STAGE_FIELDS[name], "text": text}))
+
+    def work():
+        try:
+            data = _return_result(UserID=user_id, on_stage=on_stage, on_token=on_token)
+            if not data or "result" not in data:
+                events.put(("error", {"error": "No result generated"}))
+            else:
+                conclusion = data["result"]
+                events.put(("done", {
+                    "timings": data.get("timings", {}),
+                    "fallbacks": conclusion.fallbacks,
+                    "semantic_hit": conclusion.semantic_hit,
+                    "semantic_similarity": conclusion.semantic_similarity,
+                    "rubric_source": conclusion.rubric_source,
+                }))
+        except Exception as e:
+            events.put(("error", {"error": str(e)}))
+        events.put(_END)
+
+    def generate():
+        threading.Thread(target=bind(work), name="sse-advices", daemon=True).start()
+        try:
+            while True:
+                try:
+                    item = events.get(timeout=SSE_HEARTBEAT_SEC)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is _END:
+                    return
+                yield _sse(*item)
+        finally:
+            disconnected.set()
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.route("/cohort", methods=["GET"])
+def get_cohort():
+    """
+    Rubric statistics over every stored LLM rubric: overall and per-dimension
+    percentiles and histograms, band counts, and major/year breakdowns. Profiles
+    without one are summarized separately under "estimated" (pre-scorer).
+    Optional filters: ?major=, ?year=; ?bins= sets the histogram resolution.
+    """
+    try:
+        year = request.args.get("year", type=int)
+        bins = min(max(request.args.get("bins", default=10, type=int), 1), 100)
+        start = time.perf_counter()
+        stats = cohort_stats(major=request.args.get("major"), year=year, bins=bins)
+        response = jsonify(stats)
+        response.headers["Server-Timing"] = _server_timing({"cohort": round((time.perf_counter() - start) * 1000, 1)})
+        return response, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,8 @@
+from flask import request
+
+from services.profileStore import check_user_id
+
+
+def request_user_id() -> str:
+    """User id from the X-User-Id header or ?user_id=; falls back to the shared default user."""
+    return check_user_id(request.headers.get("X-User-Id") or request.args.get("user_id"))
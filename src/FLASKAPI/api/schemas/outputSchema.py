@@ -25,3 +25,11 @@ class ConclusionSchema(Schema):
     rubricResult = fields.Nested(RubricScoreSchema, required=True)
     # dict {title: url}
     web = fields.Dict(keys=fields.Str(), values=fields.Str())
+    # stages that failed and returned placeholder content
+    fallbacks = fields.List(fields.Str())
+    # advice and web were reused from a similar profile (agent.semantic)
+    semantic_hit = fields.Bool()
+    semantic_similarity = fields.Float(allow_none=True)
+    # "llm", or "local" when the rule/linear pre-scorer was confident enough (agent.prescore)
+    rubric_source = fields.Str()
+    rubric_confidence = fields.Float(allow_none=True)
@@ -1,7 +1,20 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 from api.controllers.input import bp as bp_input
 from api.controllers.output import bp as bp_output
+from api.controllers.jobs import bp as bp_jobs
+from agent.clients import get_registry
+from agent.cache import get_stage_cache, get_summary_cache
+from agent.pagecache import get_page_cache
+from agent.semantic import get_semantic_cache
+from agent.localindex import get_local_index
+from agent.compress import compression_stats
+from agent.prompts import prompt_usage
+from agent.metrics import metrics, new_request_id, request_id
+from agent.prescore import get_prescorer
+from agent.resilience import get_resilience
+from agent.extract import get_extract_pool
+from agent.workflows import get_workflow
 
 def create_app():
     app = Flask(__name__)
@@ -10,6 +23,19 @@ def create_app():
     
     app.register_blueprint(bp_input)
     app.register_blueprint(bp_output)
+    app.register_blueprint(bp_jobs)
+
+    @app.before_request
+    def tag_request():
+        # spans recorded while serving this request carry its id in the trace log
+        g.request_id = (request.headers.get("X-Request-Id") or "").strip()[:64] or new_request_id()
+        request_id.set(g.request_id)
+
+    @app.after_request
+    def echo_request_id(response):
+        if "request_id" in g:
+            response.headers["X-Request-Id"] = g.request_id
+        return response
 
     @app.route('/')
     def home():
@@ -18,6 +44,45 @@ def create_app():
     @app.route('/health')
     def health():
         return jsonify({"status": "ok", "service": "mybrand-backend"}), 200
+
+    @app.route('/health/pools')
+    def pools():
+        return jsonify({**get_registry().stats(), "extract": get_extract_pool().stats()}), 200
+
+    @app.route('/health/providers')
+    def providers():
+        return jsonify(get_resilience().stats()), 200
+
+    @app.route('/health/router')
+    def router():
+        return jsonify(get_workflow().router.stats()), 200
+
+    @app.route('/health/prompts')
+    def prompts():
+        return jsonify(prompt_usage.stats()), 200
+
+    @app.route('/health/prescore')
+    def prescore():
+        prescorer = get_prescorer()
+        return jsonify(prescorer.stats() if prescorer else None), 200
+
+    @app.route('/metrics')
+    def prometheus():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route('/health/cache')
+    def cache():
+        page_cache = get_page_cache()
+        semantic_cache = get_semantic_cache()
+        local_index = get_local_index()
+        return jsonify({
+            "stages": get_stage_cache().stats(),
+            "summaries": get_summary_cache().stats(),
+            "pages": page_cache.stats() if page_cache else None,
+            "semantic": semantic_cache.stats() if semantic_cache else None,
+            "local_index": local_index.stats() if local_index else None,
+            "compression": compression_stats.stats(),
+        }), 200
     
     return app
 
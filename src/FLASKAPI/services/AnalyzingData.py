@@ -1,29 +1,197 @@
-from agent.workflows import WorkFlow
+from agent.workflows import WorkFlow, get_workflow, is_fallback
 from agent.models import Conclusion,StudentCase
-from typing import Optional,List,Dict, Any
+from agent.semantic import SemanticCache, get_semantic_cache
+from agent.metrics import PREFIX, bind, metrics
+from typing import Optional,List,Dict, Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
 from .loadFile import load_personality,load_potential
-def  _return_result(UserID: Optional[str] = None):
-    run = WorkFlow()
+from .resultStore import get_result_store, profile_version
+
+# potential, personality, case(+search), rubric
+MAX_STAGE_WORKERS = 4
+
+# stage timings and errors are spans (agent.metrics); this is for debugging only
+logger = logging.getLogger(f"{PREFIX}.pipeline")
+
+# stage name -> Conclusion field it fills
+STAGE_FIELDS = {
+    "potential": "potentialResult",
+    "personality": "personalityResult",
+    "case": "source_advice",
+    "rubric": "rubricResult",
+    "search": "web",
+}
+
+StageCallback = Callable[[str, Any], None]
+TokenCallback = Callable[[str, str], None]
+
+
+def stage_value(name: str, result: Any) -> Any:
+    """JSON-ready value of one stage, shaped like the matching Conclusion field."""
+    if name in ("potential", "personality"):
+        return result["result"]
+    if hasattr(result, "model_dump"):
+        return result.model_dump()
+    return result
+
+
+def _stager(timings: Dict[str, float], on_stage: Optional[StageCallback]):
+    def stage(name: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        error = None
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            timings[name] = round(elapsed * 1000, 1)
+            metrics.observe("stage", elapsed, error=error, stage=name)
+        if on_stage is not None and name in STAGE_FIELDS:
+            on_stage(name, result)
+        return result
+    return stage
+
+
+def _token_kwargs(name: str, on_token: Optional[TokenCallback]) -> Dict[str, Any]:
+    if on_token is None:
+        return {}
+    return {"on_token": lambda text: on_token(name, text)}
+
+
+def _case_and_search(run: WorkFlow, case: StudentCase, stage, semantic: Optional[SemanticCache]):
+    """
+    Case advice followed by its web search. A near-identical case already in the
+    semantic cache supplies both, skipping the LLM call and the search.
+    """
+    hit = semantic.lookup(case) if semantic is not None else None
+    if hit is not None:
+        logger.debug("semantic cache hit (%s)", hit.similarity)
+        total = stage("case", lambda: hit.advice)
+        web = stage("search", lambda: hit.web)
+        return total, web, hit
+    total = stage("case", run._analyze_case, case)
+    web = stage("search", run._search_information, advide=total)
+    if semantic is not None and not is_fallback(total):
+        semantic.store(case, total, web)
+    return total, web, None
+
+
+def _run_sequential(run: WorkFlow, file_potential, file_personality, stage, on_token=None, semantic=None):
+    potential = stage("potential", run._analyze_potential, file_potential, **_token_kwargs("potential", on_token))
+    personlity = stage("personality", run._analyze_personality, file_personality, **_token_kwargs("personality", on_token))
+    total, web, hit = _case_and_search(run, StudentCase(potential = file_potential,personal=file_personality), stage, semantic)
+    rate = stage("rubric", run._rate_profile, personality=file_personality, academic=file_potential)
+    return potential, personlity, total, rate, web, hit
+
+
+def _run_concurrent(run: WorkFlow, file_potential, file_personality, stage, on_token=None, semantic=None):
+    # Only the search stage reads another stage's output (the case advice), so it
+    # is chained onto the case worker and starts as soon as the advice arrives.
+    stage = bind(stage)  # workers keep the caller's request id
+
+    def case_then_search():
+        return _case_and_search(run, StudentCase(potential = file_potential,personal=file_personality), stage, semantic)
+
+    with ThreadPoolExecutor(max_workers=MAX_STAGE_WORKERS, thread_name_prefix="stage") as pool:
+        f_potential = pool.submit(stage, "potential", run._analyze_potential, file_potential, **_token_kwargs("potential", on_token))
+        f_personality = pool.submit(stage, "personality", run._analyze_personality, file_personality, **_token_kwargs("personality", on_token))
+        f_case = pool.submit(case_then_search)
+        f_rate = pool.submit(stage, "rubric", run._rate_profile, personality=file_personality, academic=file_potential)
+
+        potential = f_potential.result()
+        personlity = f_personality.result()
+        total, web, hit = f_case.result()
+        rate = f_rate.result()
+    return potential, personlity, total, rate, web, hit
+
+
+def _run_fused(run: WorkFlow, file_potential, file_personality, stage, on_token=None, semantic=None):
+    # the case advice comes out of the single fused call, so there is nothing for
+    # the semantic cache to skip here
+    case = StudentCase(potential = file_potential,personal=file_personality)
+    fused = stage("fused", run._analyze_fused, case)
+    if fused is None:
+        logger.debug("fused mode failed validation, falling back to per-stage calls")
+        return _run_concurrent(run, file_potential, file_personality, stage, on_token, semantic)
+    # replay the fused answer through the per-stage callbacks so listeners see the same events
+    potential = stage("potential", lambda: {"result": fused.potentialResult})
+    personlity = stage("personality", lambda: {"result": fused.personalityResult})
+    total = stage("case", lambda: fused.source_advice)
+    rate = stage("rubric", lambda: fused.rubricResult)
+    web = stage("search", run._search_information, advide=total)
+    return potential, personlity, total, rate, web, None
+
+
+RUNNERS = {
+    "concurrent": _run_concurrent,
+    "sequential": _run_sequential,
+    "fused": _run_fused,
+}
+
+
+def  _return_result(
+    UserID: Optional[str] = None,
+    concurrent: bool = True,
+    mode: Optional[str] = None,
+    on_stage: Optional[StageCallback] = None,
+    on_token: Optional[TokenCallback] = None,
+    semantic: bool = True,
+    reuse: bool = False,
+):
+    """
+    on_stage(name, result) is called as each stage finishes (name is a key of
+    STAGE_FIELDS); raising from it aborts the run. on_token(name, text) makes
+    the free-text stages stream and receives each chunk. mode picks a key of
+    RUNNERS and overrides `concurrent`. semantic=False bypasses the semantic
+    cache (see agent.semantic) for this call. reuse=True returns the stored
+    result for the current profile version, if any, instead of recomputing.
+
+    Every complete result (no fallbacks) is saved to the result store and
+    returned as "stored".
+    """
+    run = get_workflow()
+    results = get_result_store()
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
     try:
-        file_potential = load_potential()
-        potential = run._analyze_potential(file_potential)
-        print(potential)
-        file_personality = load_personality()
-        personlity = run._analyze_personality(file_personality)
-        print(personlity)
-        total = run._analyze_case(StudentCase(potential = file_potential,personal=file_personality))
-        print(total)
-        rate = run._rate_profile(personality=file_personality,academic=file_potential)
-        print(rate)
-        web = run._search_information(advide=total)
-    except Exception as e:
-        print(e)
+        file_potential = load_potential(UserID)
+        file_personality = load_personality(UserID)
+        version = profile_version(file_potential, file_personality)
+        stored = results.latest(UserID, version) if reuse else None
+        if stored is not None:
+            return {"result": stored.conclusion, "timings": {}, "stored": stored, "reused": True}
+        runner = RUNNERS.get(mode or ("concurrent" if concurrent else "sequential"), _run_concurrent)
+        semantic_cache = get_semantic_cache() if semantic else None
+        potential, personlity, total, rate, web, hit = runner(
+            run, file_potential, file_personality, _stager(timings, on_stage), on_token, semantic_cache
+        )
+    except Exception:
+        logger.debug("pipeline failed for %s", UserID, exc_info=True)
         return {}
-    return {"result":Conclusion(
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+    metrics.observe("pipeline", timings["total"] / 1000, mode=mode or ("concurrent" if concurrent else "sequential"))
+    stages = {"potential": potential, "personality": personlity, "case": total, "rubric": rate}
+    fallbacks = [name for name, result in stages.items() if is_fallback(result)]
+    conclusion = Conclusion(
             potentialResult = potential["result"],
             personalityResult = personlity["result"],
             source_advice=total,
             rubricResult=rate,
-            web = web
+            web = web,
+            fallbacks = fallbacks,
+            semantic_hit = hit is not None,
+            semantic_similarity = hit.similarity if hit is not None else None,
+            rubric_source = getattr(rate, "_source", "llm"),
+            rubric_confidence = getattr(rate, "_confidence", None)
             )
-            }
+    stored = None
+    if not fallbacks:  # a stand-in must never be served later as if it were an answer
+        try:
+            stored = results.save(UserID, version, conclusion, timings)
+        except Exception as e:
+            logger.debug("result not stored: %s", e)
+    return {"result": conclusion, "timings": timings, "stored": stored, "reused": False}
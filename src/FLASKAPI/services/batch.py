@@ -0,0 +1,386 @@
+"""
+Cohort batch scoring.
+
+    python -m services.batch cohort.jsonl results.jsonl --concurrency 8
+    python -m services.batch cohort.csv results.jsonl --stages case,rubric --openai-rpm 300
+    python -m services.batch cohort.jsonl results.jsonl --backend provider --chunk-size 2000
+
+Input records are streamed, one at a time, from JSONL ({"id", "potential", "personal"}
+or the PotentialAnalysis/PersonalProfile fields flat on one object) or CSV (one
+column per field; list/dict columns as JSON, or lists separated by ";"). Results
+are appended to the output JSONL as each profile finishes. Re-running with the
+same output file skips every id already scored, so an interrupted run resumes;
+ids that failed are retried and their new line supersedes the old one.
+
+--backend provider sends case/rubric prompts through the provider's Batch API
+instead (cheaper, hours of latency), one provider batch per --chunk-size records.
+Each submitted batch id is kept in <output>.pending until its results are
+written, so a run that times out or is killed while waiting collects that batch
+on the next run instead of submitting (and paying for) it again.
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.callbacks import get_usage_metadata_callback
+
+from agent.batch_backend import BATCH_STAGES, ProviderBatchBackend
+from agent.models import PersonalProfile, PotentialAnalysis, StudentCase
+from agent.ratelimit import TokenBucket
+from agent.workflows import WorkFlow, get_workflow, is_fallback
+from .AnalyzingData import stage_value
+
+# which provider each stage talks to
+STAGE_PROVIDERS = {
+    "potential": "gemini",
+    "personality": "gemini",
+    "case": "openai",
+    "rubric": "openai",
+}
+DEFAULT_STAGES = ("case", "rubric")
+
+POTENTIAL_FIELDS = set(PotentialAnalysis.model_fields)
+PERSONAL_FIELDS = set(PersonalProfile.model_fields)
+
+
+def _parse_cell(value: str, field_info) -> Any:
+    value = (value or "").strip()
+    if value == "":
+        return None
+    if value[0] in "[{":
+        return json.loads(value)
+    annotation = str(field_info.annotation)
+    if "List" in annotation or "list" in annotation:
+        return [v.strip() for v in value.split(";") if v.strip()]
+    if "bool" in annotation:
+        return value.lower() in ("1", "true", "yes", "y", "có")
+    return value
+
+
+def _record_to_case(record: Dict[str, Any]) -> StudentCase:
+    if "potential" in record or "personal" in record:
+        return StudentCase(
+            potential=PotentialAnalysis.model_validate(record.get("potential") or {}),
+            personal=PersonalProfile.model_validate(record.get("personal") or {}),
+        )
+    return StudentCase(
+        potential=PotentialAnalysis.model_validate({k: v for k, v in record.items() if k in POTENTIAL_FIELDS and v is not None}),
+        personal=PersonalProfile.model_validate({k: v for k, v in record.items() if k in PERSONAL_FIELDS and v is not None}),
+    )
+
+
+def iter_records(path: Path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (id, raw record) lazily; ids default to the 1-based line/row number."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            fields = {**PotentialAnalysis.model_fields, **PersonalProfile.model_fields}
+            for n, row in enumerate(csv.DictReader(f), 1):
+                record = {k: _parse_cell(v, fields[k]) for k, v in row.items() if k in fields}
+                yield str(row.get("id") or f"row-{n}"), record
+        else:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                yield str(record.get("id") or f"line-{n}"), record
+
+
+def completed_ids(output_path: Path) -> Set[str]:
+    done: Set[str] = set()
+    if not output_path.exists():
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by the interruption
+            if "id" in result and not result.get("error"):
+                done.add(result["id"])
+    return done
+
+
+class BatchStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, result: Dict[str, Any]) -> None:
+        with self._lock:
+            if result.get("error"):
+                self.failed += 1
+            else:
+                self.done += 1
+            for usage in result.get("usage", {}).values():
+                self.input_tokens += usage.get("input_tokens", 0)
+                self.output_tokens += usage.get("output_tokens", 0)
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started
+        processed = self.done + self.failed
+        return {
+            "processed": processed,
+            "ok": self.done,
+            "failed": self.failed,
+            "skipped_resumed": self.skipped,
+            "elapsed_sec": round(elapsed, 1),
+            "profiles_per_min": round(processed / elapsed * 60, 2) if elapsed else 0.0,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+        }
+
+
+def score_record(
+    run: WorkFlow,
+    record_id: str,
+    record: Dict[str, Any],
+    stages,
+    limiters: Dict[str, TokenBucket],
+) -> Dict[str, Any]:
+    started = time.monotonic()
+    result: Dict[str, Any] = {"id": record_id}
+    try:
+        case = _record_to_case(record)
+        calls = {
+            "potential": lambda: run._analyze_potential(case.potential),
+            "personality": lambda: run._analyze_personality(case.personal),
+            "case": lambda: run._analyze_case(case),
+            "rubric": lambda: run._rate_profile(academic=case.potential, personality=case.personal),
+        }
+        fallbacks = []
+        # the callback is thread-local, so it only sees this record's calls
+        with get_usage_metadata_callback() as usage:
+            for name in stages:
+                limiter = limiters.get(STAGE_PROVIDERS[name])
+                if limiter is not None:
+                    limiter.acquire()
+                value = calls[name]()
+                # a stand-in loses its fallback flag once dumped, so check before
+                if is_fallback(value):
+                    fallbacks.append(name)
+                result[name] = stage_value(name, value)
+        result["usage"] = {model: dict(u) for model, u in usage.usage_metadata.items()}
+        if fallbacks:
+            # counted as failed, so completed_ids() retries the record on resume
+            result["error"] = f"fallback result for stages: {', '.join(fallbacks)}"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return result
+
+
+def run_batch(
+    input_path: Path,
+    output_path: Path,
+    stages=DEFAULT_STAGES,
+    concurrency: int = 4,
+    rpm: Optional[Dict[str, float]] = None,
+    progress_every: int = 50,
+    run: Optional[WorkFlow] = None,
+) -> Dict[str, Any]:
+    input_path, output_path = Path(input_path), Path(output_path)
+    run = run or get_workflow()
+    limiters = {provider: TokenBucket(limit) for provider, limit in (rpm or {}).items() if limit}
+    stats = BatchStats()
+    done_ids = completed_ids(output_path)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.exists() and output_path.stat().st_size:
+        with open(output_path, "rb") as f:
+            f.seek(-1, 2)
+            needs_newline = f.read(1) != b"\n"
+    else:
+        needs_newline = False
+
+    write_lock = threading.Lock()
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        if needs_newline:
+            out.write("\n")
+
+        def finish(future) -> None:
+            result = future.result()
+            with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+            stats.add(result)
+            processed = stats.done + stats.failed
+            if progress_every and processed % progress_every == 0:
+                print(f"[batch] {stats.summary()}")
+
+        in_flight = set()
+        for record_id, record in iter_records(input_path):
+            if record_id in done_ids:
+                stats.skipped += 1
+                continue
+            # keep at most 2x concurrency records in memory
+            while len(in_flight) >= concurrency * 2:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    finish(future)
+            in_flight.add(pool.submit(score_record, run, record_id, record, stages, limiters))
+        for future in wait(in_flight).done:
+            finish(future)
+
+    summary = stats.summary()
+    print(f"[batch] finished: {summary}")
+    return summary
+
+
+def pending_path(output_path: Path) -> Path:
+    return output_path.with_name(output_path.name + ".pending")
+
+
+def load_pending(output_path: Path) -> Dict[str, Dict[str, Any]]:
+    """{batch_id: {"ids": [...], "stages": [...]}} for batches submitted but not yet written."""
+    path = pending_path(output_path)
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_pending(output_path: Path, pending: Dict[str, Dict[str, Any]]) -> None:
+    path = pending_path(output_path)
+    if not pending:
+        path.unlink(missing_ok=True)
+        return
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(pending, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def run_provider_batch(
+    input_path: Path,
+    output_path: Path,
+    stages=DEFAULT_STAGES,
+    chunk_size: int = 1000,
+    backend: Optional[ProviderBatchBackend] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    input_path, output_path = Path(input_path), Path(output_path)
+    backend = backend or ProviderBatchBackend()
+    stats = BatchStats()
+    done_ids = completed_ids(output_path)
+    pending = load_pending(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(parsed, record_ids: List[str], batch_stages, out) -> None:
+        for record_id in record_ids:
+            entry = parsed.get(record_id, {"errors": {"*": "missing"}})
+            result: Dict[str, Any] = {"id": record_id}
+            for stage in batch_stages:
+                if stage in entry:
+                    result[stage] = entry[stage].model_dump()
+            if entry["errors"]:
+                result["error"] = entry["errors"]
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            stats.add(result)
+        out.flush()
+        print(f"[batch] {stats.summary()}")
+
+    def written(batch_id: str) -> None:
+        pending.pop(batch_id, None)
+        save_pending(output_path, pending)
+
+    def flush(chunk, out) -> None:
+        cases = {}
+        for record_id, record in chunk:
+            try:
+                cases[record_id] = _record_to_case(record)
+            except Exception as e:
+                result = {"id": record_id, "error": f"{type(e).__name__}: {e}"}
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                stats.add(result)
+        if not cases:
+            return
+        record_ids = list(cases)
+        submitted: List[str] = []
+
+        def record(batch_id: str) -> None:
+            submitted.append(batch_id)
+            pending[batch_id] = {"ids": record_ids, "stages": list(stages)}
+            save_pending(output_path, pending)
+
+        parsed = backend.run(cases.items(), stages=stages, timeout=timeout, on_submit=record)
+        write(parsed, record_ids, stages, out)
+        written(submitted[0])
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        # batches submitted by an earlier run that never got written: collect them first
+        resumed: Set[str] = set()
+        for batch_id, info in list(pending.items()):
+            print(f"[batch] resuming {batch_id} ({len(info['ids'])} records)")
+            parsed = backend.collect(batch_id, info["ids"], stages=info["stages"], timeout=timeout)
+            write(parsed, info["ids"], info["stages"], out)
+            written(batch_id)
+            resumed.update(info["ids"])
+
+        chunk = []
+        for record_id, record in iter_records(input_path):
+            if record_id in done_ids:
+                stats.skipped += 1
+                continue
+            if record_id in resumed:
+                continue  # written above, failures included; retried on the next run
+            chunk.append((record_id, record))
+            if len(chunk) >= chunk_size:
+                flush(chunk, out)
+                chunk = []
+        if chunk:
+            flush(chunk, out)
+
+    summary = stats.summary()
+    print(f"[batch] finished: {summary}")
+    return summary
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Score a cohort of student profiles.")
+    parser.add_argument("input", type=Path, help="JSONL or CSV of profiles")
+    parser.add_argument("output", type=Path, help="results JSONL (appended; used to resume)")
+    parser.add_argument("--stages", default=",".join(DEFAULT_STAGES),
+                        help="comma separated subset of potential,personality,case,rubric")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--openai-rpm", type=float, default=500)
+    parser.add_argument("--gemini-rpm", type=float, default=300)
+    parser.add_argument("--progress-every", type=int, default=50)
+    parser.add_argument("--backend", choices=("interactive", "provider"), default="interactive",
+                        help="interactive calls, or the provider's offline Batch API")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="records per provider batch")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGE_PROVIDERS]
+    if unknown:
+        parser.error(f"unknown stages: {unknown}")
+    if args.backend == "provider":
+        unsupported = [s for s in stages if s not in BATCH_STAGES]
+        if unsupported:
+            parser.error(f"provider batches only support {sorted(BATCH_STAGES)}, not {unsupported}")
+        run_provider_batch(args.input, args.output, stages=stages, chunk_size=args.chunk_size)
+        return
+    run_batch(
+        args.input, args.output,
+        stages=stages,
+        concurrency=args.concurrency,
+        rpm={"openai": args.openai_rpm, "gemini": args.gemini_rpm},
+        progress_every=args.progress_every,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,685 @@
+"""
+Offline benchmark of the analysis pipeline, replayed from recorded fixtures.
+
+    python -m services.benchmark --users 8 --iterations 3 --llm-latency 0.8 --error-rate 0.05 \
+        --json bench.json --compare bench_prev.json
+
+Nothing leaves the machine. DDGS, the page fetch and every LLM client are
+replaced by stand-ins that answer from the fixtures (gogoduck payloads such as
+result.json) after a sampled latency, and fail at the configured rate with a
+transient error. Extraction, compression, routing, resilience and the stores
+run for real, in a temporary directory, with the caches off. Scenarios:
+
+  pipeline  _return_result for N concurrent users (per-stage timings)
+  gogoduck  gogoduck_trafilatura_openai for N concurrent queries
+  http      N simulated users on the Flask app: both /input endpoints, then
+            /AnalyzedData/Advices computed, stored, and revalidated (304)
+
+The JSON report (latency percentiles, throughput, span summaries, tokens,
+peak memory, commit) is meant to be compared across commits with --compare.
+"""
+import argparse
+import asyncio
+import html
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from unittest import mock
+
+import httpx
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+from agent import async_engine, clients, resilience, workflows
+from agent.clients import ClientRegistry
+from agent.extract import get_extract_pool
+from agent.metrics import metrics
+from agent.models import FusedAnalysis, PersonalProfile, PotentialAnalysis, RubricScore, improving
+from agent.prompts import TEMPLATES
+from agent.resilience import estimate_tokens
+from .profileStore import BASE_DIR
+
+DEFAULT_FIXTURES = BASE_DIR.parent.parent / "result.json"
+SCENARIOS = ("pipeline", "gogoduck", "http")
+STREAM_CHUNKS = 8
+
+# caches would turn every run after the first into a lookup; stores go to a temp dir
+ISOLATED_ENV = {
+    "STAGE_CACHE_BACKEND": "none",
+    "SUMMARY_CACHE_BACKEND": "none",
+    "PAGE_CACHE_BACKEND": "none",
+    "SEMANTIC_CACHE_BACKEND": "none",
+    "LOCAL_INDEX_BACKEND": "none",
+    "PRESCORE_SAMPLES": "off",
+    "OPENAI_API_KEY": "replay",
+    "OPENAI_API_KEY2": "replay",
+    "GEMINI_API_KEY": "replay",
+    "GOOGLE_API_KEY": "replay",
+}
+
+
+# ---- injected latency and failures ----
+class InjectedError(Exception):
+    """A replayed provider failure; status 503 makes agent.resilience retry it like a real one."""
+    status_code = 503
+
+
+@dataclass
+class Delay:
+    median: float  # seconds; samples are lognormal around it
+    error_rate: float = 0.0
+
+
+class Faults:
+    """Seeded latency / failure draws per kind of call ("llm", "search", "fetch", "summarize")."""
+
+    def __init__(self, delays: Dict[str, Delay], jitter: float = 0.35, seed: int = 0):
+        self.delays = delays
+        self.jitter = jitter
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._rng = random.Random(self.seed)
+            self.counts = {}
+
+    def draw(self, kind: str) -> Tuple[float, bool]:
+        delay = self.delays[kind]
+        with self._lock:
+            seconds = delay.median * math.exp(self._rng.gauss(0, self.jitter)) if delay.median > 0 else 0.0
+            failed = self._rng.random() < delay.error_rate
+            counts = self.counts.setdefault(kind, {"calls": 0, "errors": 0})
+            counts["calls"] += 1
+            counts["errors"] += int(failed)
+        return seconds, failed
+
+    def wait(self, kind: str) -> None:
+        seconds, failed = self.draw(kind)
+        time.sleep(seconds)
+        if failed:
+            raise InjectedError(f"injected {kind} failure")
+
+    async def await_(self, kind: str) -> None:
+        seconds, failed = self.draw(kind)
+        await asyncio.sleep(seconds)
+        if failed:
+            raise InjectedError(f"injected {kind} failure")
+
+    def config(self) -> Dict[str, Any]:
+        return {"jitter": self.jitter, "seed": self.seed, **{k: asdict(d) for k, d in self.delays.items()}}
+
+
+# ---- fixtures ----
+@dataclass
+class Fixtures:
+    queries: List[str]
+    results: List[Dict[str, Any]]  # recorded search results: title, url, snippet, summary, extracted_chars
+    answers: Dict[str, Any]  # stage -> recorded LLM answer (str, or the schema's fields)
+
+
+def load_fixtures(paths: Sequence[Path]) -> Fixtures:
+    """
+    gogoduck payloads (result.json) supply the search results, pages and
+    summaries. An optional "answers" object overrides the per-stage LLM
+    answers, which are otherwise derived from the recorded summaries.
+    """
+    queries, results, answers = [], [], {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("query"):
+            queries.append(data["query"])
+        results += [r for r in data.get("results", []) if r.get("url") and not r.get("error")]
+        answers.update(data.get("answers", {}))
+    if not results:
+        raise ValueError(f"no usable search results in {[str(p) for p in paths]}")
+
+    summaries = [r.get("summary") or r.get("snippet") or r["title"] for r in results]
+    titles = [r["title"] for r in results]
+    answers.setdefault("potential", "\n".join(summaries[:3]))
+    answers.setdefault("personality", "\n".join(summaries[-3:]))
+    answers.setdefault("case", {
+        "advice": summaries[0],
+        "article": titles[0],
+        "books": titles[1 % len(titles)],
+        "newspaper": titles[2 % len(titles)],
+        "certificatin_course": titles[-1],
+    })
+    answers.setdefault("rubric", {
+        "professional_knowledge": 15, "practical_skills": 13, "experience_achievements": 12,
+        "personal_branding": 9, "goals_vision": 10, "growth_potential": 7,
+    })
+    return Fixtures(queries or ["system analysis and design certificate"], results, answers)
+
+
+def page_html(result: Dict[str, Any], variant: int = 0) -> str:
+    """
+    A plausible article page about as long as the one that was recorded.
+    Each `variant` has distinct paragraph text: extract_main_text deduplicates
+    against what its worker process has already seen, so replaying the very
+    same page twice would come back nearly empty.
+    """
+    title = html.escape(result["title"])
+    body = html.escape(" ".join(filter(None, (result.get("snippet"), result.get("summary")))) or title)
+    target = max(int(result.get("extracted_chars") or 0), 1500)
+    paragraphs, size = [], 0
+    while size < target:
+        paragraphs.append(f"<p>{variant}.{len(paragraphs) + 1}. {body}</p>")
+        size += len(body)
+    return (
+        f"<html><head><meta charset='utf-8'><title>{title}</title></head><body>"
+        f"<nav><a href='/'>Home</a> <a href='/courses'>Courses</a></nav>"
+        f"<article><h1>{title}</h1>{''.join(paragraphs)}</article>"
+        f"<footer>© {title}</footer></body></html>"
+    )
+
+
+# ---- stand-ins ----
+class Replay:
+    """Answers every external call from the fixtures, after Faults has had its say."""
+
+    def __init__(self, fixtures: Fixtures, faults: Faults):
+        self.fixtures = fixtures
+        self.faults = faults
+        self.pages = {r["url"]: r for r in fixtures.results}
+        self._fetches = itertools.count()
+
+    def page(self, url: str) -> Optional[bytes]:
+        result = self.pages.get(url)
+        return page_html(result, next(self._fetches)).encode("utf-8") if result is not None else None
+
+    # LLM answers
+    @staticmethod
+    def stage(messages) -> str:
+        human = messages[-1].content if messages else ""
+        for name, template in TEMPLATES.items():
+            if human.startswith(template.task):
+                return name
+        return "potential"
+
+    def text(self, messages) -> str:
+        answer = self.fixtures.answers.get(self.stage(messages))
+        return answer if isinstance(answer, str) else self.fixtures.answers["potential"]
+
+    def parsed(self, schema: type) -> Any:
+        answers = self.fixtures.answers
+        if schema is improving:
+            return improving(**answers["case"])
+        if schema is RubricScore:
+            return RubricScore(**answers["rubric"])
+        if schema is FusedAnalysis:
+            return FusedAnalysis(
+                potentialResult=answers["potential"], personalityResult=answers["personality"],
+                source_advice=improving(**answers["case"]), rubricResult=RubricScore(**answers["rubric"]),
+            )
+        raise TypeError(f"no fixture answer for {schema.__name__}")
+
+    @staticmethod
+    def usage(messages, text: str) -> Dict[str, Any]:
+        prompt = estimate_tokens(*(m.content for m in messages))
+        output = estimate_tokens(text)
+        return {"input_tokens": prompt, "output_tokens": output, "total_tokens": prompt + output}
+
+    # search / fetch / summarize
+    def ddgs_search(self, query: str, region: str, backend: str, k: int) -> List[Dict[str, Any]]:
+        self.faults.wait("search")
+        results = self.fixtures.results
+        start = sum(map(ord, query)) % len(results)  # different queries get different (stable) orders
+        picked = [results[(start + i) % len(results)] for i in range(min(k, len(results)))]
+        return [{"title": r["title"], "href": r["url"], "body": r.get("snippet", "")} for r in picked]
+
+    async def fetch_capped(self, client, url: str, headers, timeout_sec: float, max_bytes: int):
+        await self.faults.await_("fetch")
+        body = self.page(url)
+        if body is None:
+            return 404, httpx.Headers(), b"", None
+        return 200, httpx.Headers({"Content-Type": "text/html; charset=utf-8"}), body[:max_bytes], "utf-8"
+
+    def summary(self, prompt: str) -> SimpleNamespace:
+        results = self.fixtures.results
+        text = results[len(prompt) % len(results)].get("summary") or results[0]["title"]
+        return SimpleNamespace(
+            output_text=text,
+            usage=SimpleNamespace(input_tokens=estimate_tokens(prompt), output_tokens=estimate_tokens(text),
+                                  input_tokens_details=SimpleNamespace(cached_tokens=0)),
+        )
+
+
+class ReplayLLM:
+    """Stands in for ChatOpenAI / ChatGoogleGenerativeAI (chat=True) and GoogleGenerativeAI."""
+
+    def __init__(self, replay: Replay, chat: bool = True):
+        self.replay = replay
+        self.chat = chat
+
+    def invoke(self, messages, config=None, **kwargs):
+        self.replay.faults.wait("llm")
+        text = self.replay.text(messages)
+        return AIMessage(content=text, usage_metadata=self.replay.usage(messages, text)) if self.chat else text
+
+    def stream(self, messages, config=None, **kwargs) -> Iterator[Any]:
+        self.replay.faults.wait("llm")  # fails before the first token, like a refused request
+        text = self.replay.text(messages)
+        size = max(1, len(text) // STREAM_CHUNKS)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for i, piece in enumerate(pieces):
+            if not self.chat:
+                yield piece
+            elif i == len(pieces) - 1:
+                yield AIMessageChunk(content=piece, usage_metadata=self.replay.usage(messages, text))
+            else:
+                yield AIMessageChunk(content=piece)
+
+    def with_structured_output(self, schema: type, include_raw: bool = False):
+        return _ReplayStructured(self.replay, schema, include_raw)
+
+
+class _ReplayStructured:
+    def __init__(self, replay: Replay, schema: type, include_raw: bool):
+        self.replay = replay
+        self.schema = schema
+        self.include_raw = include_raw
+
+    def invoke(self, messages, config=None, **kwargs):
+        self.replay.faults.wait("llm")
+        parsed = self.replay.parsed(self.schema)
+        if not self.include_raw:
+            return parsed
+        raw = parsed.model_dump_json()
+        return {"raw": AIMessage(content=raw, usage_metadata=self.replay.usage(messages, raw)),
+                "parsed": parsed, "parsing_error": None}
+
+
+class _ReplayResponses:
+    def __init__(self, replay: Replay):
+        self.replay = replay
+
+    def create(self, model: str, input: str, **kwargs):
+        self.replay.faults.wait("summarize")
+        return self.replay.summary(input)
+
+
+class _ReplayAsyncResponses(_ReplayResponses):
+    async def create(self, model: str, input: str, **kwargs):
+        await self.replay.faults.await_("summarize")
+        return self.replay.summary(input)
+
+
+class ReplayRegistry(ClientRegistry):
+    """ClientRegistry whose provider clients are replay stand-ins; HTTP pools stay real."""
+
+    def __init__(self, replay: Replay):
+        super().__init__()
+        self.replay = replay
+
+    def chat_openai(self, model: str = "gpt-4o-mini", temperature: float = 0.1):
+        return self._get_or_create(self._clients, ("chat_openai", model, temperature), lambda: ReplayLLM(self.replay))
+
+    def gemini(self, model: str = "gemini-2.5-flash", temperature: float = 0.3):
+        return self._get_or_create(self._clients, ("gemini", model, temperature),
+                                   lambda: ReplayLLM(self.replay, chat=False))
+
+    def gemini_chat(self, model: str = "gemini-2.5-flash", temperature: float = 0.3):
+        return self._get_or_create(self._clients, ("gemini_chat", model, temperature), lambda: ReplayLLM(self.replay))
+
+    def openai(self, api_key: Optional[str] = None):
+        return self._get_or_create(self._clients, ("openai", None),
+                                   lambda: SimpleNamespace(responses=_ReplayResponses(self.replay)))
+
+    def async_openai(self, api_key: Optional[str] = None):
+        return self._get_or_create(self._clients, ("async_openai", None),
+                                   lambda: SimpleNamespace(responses=_ReplayAsyncResponses(self.replay)))
+
+
+@contextmanager
+def replaying(replay: Replay) -> Iterator[ReplayRegistry]:
+    """
+    Route every external call through `replay` for the duration. The workflow
+    and resilience singletons are rebuilt inside, so router EWMAs and circuit
+    breakers start fresh for each scenario.
+    """
+    registry = ReplayRegistry(replay)
+    with ExitStack() as stack:
+        for target, name, value in (
+            (clients, "_registry", registry),
+            (clients, "_registry_pid", os.getpid()),
+            (workflows, "_workflow", None),
+            (resilience, "_resilience", None),
+            (async_engine, "_ddgs_search", replay.ddgs_search),
+            (async_engine, "fetch_capped", replay.fetch_capped),
+        ):
+            stack.enter_context(mock.patch.object(target, name, value))
+        try:
+            yield registry
+        finally:
+            registry.close()
+
+
+# ---- measurement ----
+def _latency(ms: Sequence[float]) -> Dict[str, Any]:
+    if not len(ms):
+        return {"count": 0}
+    values = np.asarray(ms, dtype=float)
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {"count": int(values.size), "mean": round(float(values.mean()), 1), "p50": round(float(p50), 1),
+            "p95": round(float(p95), 1), "p99": round(float(p99), 1), "max": round(float(values.max()), 1)}
+
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+
+@contextmanager
+def _memory(trace: bool) -> Iterator[Dict[str, Any]]:
+    out: Dict[str, Any] = {}
+    if trace:
+        tracemalloc.start()
+    try:
+        yield out
+    finally:
+        if trace:
+            out["python_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+            tracemalloc.stop()
+        out["rss_peak_mb"] = _max_rss_mb()  # whole-process high-water mark so far, not per scenario
+
+
+Op = Callable[[int, int], Dict[str, Any]]
+
+
+def _drive(users: int, iterations: int, op: Op) -> Tuple[float, List[Tuple[float, Optional[str], Dict[str, Any]]]]:
+    """
+    op(user, iteration) for every simulated user on its own thread, each user's
+    iterations back to back. op returns extras ("steps": {name: ms}, "error",
+    "requests"); an exception counts as a failed op.
+    """
+    samples: List[Tuple[float, Optional[str], Dict[str, Any]]] = []
+    lock = threading.Lock()
+
+    def user(u: int) -> None:
+        for i in range(iterations):
+            start = time.perf_counter()
+            try:
+                extra = op(u, i) or {}
+                error = extra.pop("error", None)
+            except Exception as e:
+                extra, error = {}, f"{type(e).__name__}: {e}"
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                samples.append((elapsed, error, extra))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix="bench-user") as pool:
+        list(pool.map(user, range(users)))
+    return time.perf_counter() - start, samples
+
+
+def run_scenario(name: str, replay: Replay, users: int, iterations: int, op_factory: Callable[[], Op],
+                 trace_memory: bool = False, verbose: bool = False) -> Dict[str, Any]:
+    replay.faults.reset()
+    with replaying(replay):
+        get_extract_pool().warm()  # the worker spawn lands in no scenario's numbers
+        op = op_factory()  # setup (seeding profiles, building the app) stays out of the numbers
+        metrics.reset()
+        with _memory(trace_memory) as memory, redirect_stdout(sys.stdout if verbose else io.StringIO()):
+            wall, samples = _drive(users, iterations, op)
+        spans = metrics.summary()
+        tokens = {"{provider}/{model}/{kind}".format(**dict(labels)): n
+                  for labels, n in sorted(metrics.snapshot()["tokens"].items())}
+
+    ops = len(samples)
+    errors = [e for _, e, _ in samples if e]
+    steps: Dict[str, List[float]] = {}
+    for _, _, extra in samples:
+        for step, ms in extra.get("steps", {}).items():
+            steps.setdefault(step, []).append(ms)
+    requests = sum(extra.get("requests", 1) for _, _, extra in samples)
+    return {
+        "users": users,
+        "iterations": iterations,
+        "ops": ops,
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "wall_sec": round(wall, 3),
+        "throughput_per_sec": round(ops / wall, 3) if wall else None,
+        "requests_per_sec": round(requests / wall, 3) if wall else None,
+        "latency_ms": _latency([ms for ms, _, _ in samples]),
+        "steps_ms": {step: _latency(ms) for step, ms in sorted(steps.items())},
+        "spans_ms": spans,
+        "tokens": tokens,
+        "faults": replay.faults.counts,
+        "memory": memory,
+    }
+
+
+# ---- scenarios ----
+def _user_id(u: int, scenario: str) -> str:
+    # per scenario, so one scenario never reads results another one stored
+    return f"bench-{scenario}-{u:03d}"
+
+
+def _profile(u: int, i: int = 0) -> Tuple[PotentialAnalysis, PersonalProfile]:
+    """The sample profile in data/, varied per user and iteration so every run is a new profile."""
+    with open(BASE_DIR / "data" / "potential.json", encoding="utf-8") as f:
+        potential = PotentialAnalysis.model_validate(json.load(f))
+    with open(BASE_DIR / "data" / "personality.json", encoding="utf-8") as f:
+        personality = PersonalProfile.model_validate(json.load(f))
+    potential.gpa = round(2.4 + (u % 8) * 0.2, 2)
+    potential.year = 1 + (u + i) % 4
+    potential.achievements = potential.achievements[: (u + i) % (len(potential.achievements) + 1)]
+    return potential, personality
+
+
+def pipeline_op(mode: str, users: int) -> Callable[[], Op]:
+    from .AnalyzingData import _return_result
+    from .loadFile import save_personality, save_potential
+
+    def setup() -> Op:
+        def op(u: int, i: int) -> Dict[str, Any]:
+            data = _return_result(UserID=_user_id(u, "pipeline"), mode=mode, semantic=False)
+            if not data:
+                return {"error": "no result"}
+            timings = {k: v for k, v in data["timings"].items() if k != "total"}
+            fallbacks = data["result"].fallbacks
+            return {"steps": timings, **({"error": f"fallbacks: {fallbacks}"} if fallbacks else {})}
+
+        for u in range(users):
+            potential, personality = _profile(u)
+            save_potential(potential, _user_id(u, "pipeline"))
+            save_personality(personality, _user_id(u, "pipeline"))
+        return op
+    return setup
+
+
+def gogoduck_op(queries: Sequence[str], k: int) -> Callable[[], Op]:
+    from agent.engine import gogoduck_trafilatura_openai
+
+    def setup() -> Op:
+        def op(u: int, i: int) -> Dict[str, Any]:
+            payload = gogoduck_trafilatura_openai(query=queries[(u + i) % len(queries)], k=k, verbose=False)
+            failed = [r["error"] for r in payload["results"] if r["error"]]
+            return {"error": failed[0]} if failed else {}
+        return op
+    return setup
+
+
+def http_op() -> Callable[[], Op]:
+    def setup() -> Op:
+        from app import create_app
+
+        app = create_app()
+        local = threading.local()
+
+        def client():
+            if not hasattr(local, "client"):
+                local.client = app.test_client()
+            return local.client
+
+        def op(u: int, i: int) -> Dict[str, Any]:
+            c, headers = client(), {"X-User-Id": _user_id(u, "http")}
+            potential, personality = _profile(u, i)
+            steps, statuses = {}, {}
+
+            def call(step: str, method: str, path: str, **kwargs):
+                start = time.perf_counter()
+                response = c.open(path, method=method, headers={**headers, **kwargs.pop("headers", {})}, **kwargs)
+                steps[step] = round((time.perf_counter() - start) * 1000, 1)
+                statuses[step] = response.status_code
+                return response
+
+            call("input_potential", "POST", "/input/potential", json=potential.model_dump())
+            call("input_personality", "POST", "/input/personality", json=personality.model_dump())
+            computed = call("advices_computed", "GET", "/AnalyzedData/Advices?force=1")
+            stored = call("advices_stored", "GET", "/AnalyzedData/Advices")
+            if computed.headers.get("ETag"):
+                call("advices_304", "GET", "/AnalyzedData/Advices", headers={"If-None-Match": computed.headers["ETag"]})
+            bad = {step: code for step, code in statuses.items() if code >= 400}
+            if bad:
+                return {"steps": steps, "requests": len(steps), "error": f"HTTP {bad}"}
+            sources = {"advices_computed": (computed, "computed"), "advices_stored": (stored, "stored")}
+            wrong = {step: r.headers.get("X-Result-Source") for step, (r, want) in sources.items()
+                     if r.headers.get("X-Result-Source") != want}
+            return {"steps": steps, "requests": len(steps), **({"error": f"X-Result-Source {wrong}"} if wrong else {})}
+        return op
+    return setup
+
+
+# ---- report / compare ----
+def _commit() -> Dict[str, Any]:
+    def git(*args: str) -> Optional[str]:
+        try:
+            return subprocess.run(["git", *args], cwd=BASE_DIR, capture_output=True, text=True, timeout=10,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+COMPARED = (("latency_ms", "p50", 1), ("latency_ms", "p95", 1), ("latency_ms", "p99", 1),
+            ("throughput_per_sec", None, -1))  # sign: +1 when bigger is worse
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Tuple[List[str], float]:
+    """Lines describing the change per scenario metric, and the worst regression in percent."""
+    lines, worst = [], 0.0
+    if report["config"] != baseline.get("config"):
+        lines.append("note: configs differ; numbers are not like for like")
+    for name, now in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        for section, key, sign in COMPARED:
+            new = now[section][key] if key else now[section]
+            old = before[section].get(key) if key else before.get(section)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worst = max(worst, sign * change)
+            lines.append(f"{name:>9} {section + ('.' + key if key else ''):<22} {old:>10} -> {new:>10} ({change:+.1f}%)")
+    return lines, worst
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixtures", nargs="+", type=Path, default=[DEFAULT_FIXTURES],
+                        help="gogoduck payloads (result.json) to replay")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=4, help="concurrent simulated users")
+    parser.add_argument("--iterations", type=int, default=3, help="operations per user")
+    parser.add_argument("--mode", default="concurrent", help="_return_result mode for the pipeline scenario")
+    parser.add_argument("--k", type=int, default=3, help="search results per gogoduck query")
+    parser.add_argument("--llm-latency", type=float, default=0.6)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--fetch-latency", type=float, default=0.15)
+    parser.add_argument("--summarize-latency", type=float, default=0.4)
+    parser.add_argument("--jitter", type=float, default=0.35, help="lognormal sigma of the injected latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="injected failure rate of every call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="also report tracemalloc peaks (slower)")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own prints")
+    parser.add_argument("--json", type=Path, help="write the report to this path")
+    parser.add_argument("--compare", type=Path, help="a previous --json report to diff against")
+    parser.add_argument("--max-regression", type=float,
+                        help="exit 1 when a compared metric got worse by more than this many percent")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="mybrand-bench-")
+    os.environ.update(ISOLATED_ENV)
+    for name in ("PROFILE_STORE_PATH", "RESULT_STORE_PATH", "JOB_STORE_PATH"):
+        os.environ[name] = os.path.join(workdir, name.split("_")[0].lower() + "s.sqlite")
+
+    fixtures = load_fixtures(args.fixtures)
+    faults = Faults({
+        "llm": Delay(args.llm_latency, args.error_rate),
+        "search": Delay(args.search_latency, args.error_rate),
+        "fetch": Delay(args.fetch_latency, args.error_rate),
+        "summarize": Delay(args.summarize_latency, args.error_rate),
+    }, jitter=args.jitter, seed=args.seed)
+    replay = Replay(fixtures, faults)
+
+    setups = {
+        "pipeline": pipeline_op(args.mode, args.users),
+        "gogoduck": gogoduck_op(fixtures.queries, args.k),
+        "http": http_op(),
+    }
+    report: Dict[str, Any] = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        **_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "users": args.users, "iterations": args.iterations, "mode": args.mode, "k": args.k,
+            "fixtures": sorted(p.name for p in args.fixtures), "faults": faults.config(),
+        },
+        "scenarios": {},
+    }
+    for name in args.scenarios:
+        row = run_scenario(name, replay, args.users, args.iterations, setups[name],
+                           trace_memory=args.trace_memory, verbose=args.verbose)
+        report["scenarios"][name] = row
+        latency = row["latency_ms"]
+        print(f"{name:>9}: {row['ops']} ops, {row['errors']} errors, {row['throughput_per_sec']}/s, "
+              f"p50={latency.get('p50')}ms p95={latency.get('p95')}ms p99={latency.get('p99')}ms, "
+              f"rss_peak={row['memory']['rss_peak_mb']}MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            lines, worst = compare(report, json.load(f))
+        print("\n".join(lines))
+        if args.max_regression is not None and worst > args.max_regression:
+            print(f"regression of {worst:.1f}% exceeds {args.max_regression}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compare latency and token use of the fused single-call mode with the split
+four-call mode (search stage excluded, stage cache disabled).
+
+    python -m services.benchmark_fused --runs 3 --user-id default --json bench_fused.json
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from langchain_core.callbacks import get_usage_metadata_callback
+
+from agent.cache import Cache
+from agent.models import StudentCase
+from agent.workflows import WorkFlow
+from .loadFile import load_personality, load_potential
+
+
+def _split(run: WorkFlow, case: StudentCase) -> bool:
+    # same fan-out as _run_concurrent; the usage callback is per thread, so each
+    # worker collects its own usage and we sum them
+    def staged(fn, *args, **kwargs):
+        with get_usage_metadata_callback() as cb:
+            fn(*args, **kwargs)
+        return cb.usage_metadata
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [
+            pool.submit(staged, run._analyze_potential, case.potential),
+            pool.submit(staged, run._analyze_personality, case.personal),
+            pool.submit(staged, run._analyze_case, case),
+            pool.submit(staged, run._rate_profile, academic=case.potential, personality=case.personal),
+        ]
+        return [f.result() for f in futures]
+
+
+def _fused(run: WorkFlow, case: StudentCase):
+    with get_usage_metadata_callback() as cb:
+        ok = run._analyze_fused(case) is not None
+    return [cb.usage_metadata], ok
+
+
+def _tokens(usages) -> Dict[str, int]:
+    total = {"input_tokens": 0, "output_tokens": 0}
+    for usage in usages:
+        for per_model in usage.values():
+            total["input_tokens"] += per_model.get("input_tokens", 0)
+            total["output_tokens"] += per_model.get("output_tokens", 0)
+    return total
+
+
+def benchmark(case: StudentCase, runs: int = 3) -> Dict[str, Any]:
+    run = WorkFlow(cache=Cache(None, "disabled"))
+    report: Dict[str, Any] = {}
+    for mode in ("split", "fused"):
+        latencies, inputs, outputs, fallbacks = [], [], [], 0
+        for _ in range(runs):
+            start = time.perf_counter()
+            if mode == "split":
+                usages, ok = _split(run, case), True
+            else:
+                usages, ok = _fused(run, case)
+            latencies.append((time.perf_counter() - start) * 1000)
+            tokens = _tokens(usages)
+            inputs.append(tokens["input_tokens"])
+            outputs.append(tokens["output_tokens"])
+            fallbacks += 0 if ok else 1
+        report[mode] = {
+            "runs": runs,
+            "latency_ms_median": round(statistics.median(latencies), 1),
+            "latency_ms_max": round(max(latencies), 1),
+            "input_tokens_mean": round(statistics.mean(inputs), 1),
+            "output_tokens_mean": round(statistics.mean(outputs), 1),
+            "validation_failures": fallbacks,
+        }
+    return report
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--user-id", default="default")
+    parser.add_argument("--json", help="also write the report to this path")
+    args = parser.parse_args(argv)
+
+    case = StudentCase(potential=load_potential(args.user_id), personal=load_personality(args.user_id))
+    report = benchmark(case, runs=args.runs)
+    for mode, row in report.items():
+        print(f"{mode:>6}: " + ", ".join(f"{k}={v}" for k, v in row.items()))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
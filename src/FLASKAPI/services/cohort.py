@@ -0,0 +1,225 @@
+"""
+Cohort analytics over every stored profile, in columnar NumPy form.
+
+A user's rubric is their stored LLM result (services.resultStore) when it was
+computed from their current profile, and otherwise the rubric pre-scorer's
+(agent.prescore), run over the whole cohort in one matrix pass. The statistics
+cover stored results only; pre-scorer estimates are not calibrated against
+them, so they are reported as their own series under "estimated". The arrays are
+rebuilt only when the profile or result store changes, so a stats request is
+a handful of vectorized reductions over memory that is already loaded.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from agent.models import BAND_NAMES, PersonalProfile, PotentialAnalysis, StudentCase
+from agent.prescore import BAND_EDGES, DIMENSIONS, WEIGHTS, PreScorer, RuleModel, bands, get_prescorer
+from services.profileStore import ProfileStore, get_profile_store
+from services.resultStore import ResultStore, get_result_store, profile_version
+
+PERCENTILES = (10, 25, 50, 75, 90)
+UNKNOWN = "(unknown)"
+
+
+@dataclass
+class Cohort:
+    user_ids: np.ndarray  # (n,) str
+    scores: np.ndarray  # (n, len(DIMENSIONS)) int, RUBRIC_WEIGHTS order
+    majors: np.ndarray  # (n,) str, UNKNOWN when missing
+    years: np.ndarray  # (n,) int, 0 when missing
+    major_codes: np.ndarray  # (n,) int index into major_labels (case-insensitive groups)
+    major_labels: np.ndarray  # one display spelling per code
+    year_codes: np.ndarray  # (n,) int index into year_labels
+    year_labels: np.ndarray  # distinct years as strings, UNKNOWN for 0
+    stored: np.ndarray  # (n,) bool, True where the scores are a stored LLM result
+    source: str = ""
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def totals(self) -> np.ndarray:
+        return self.scores.sum(1)
+
+    def where(self, mask: np.ndarray) -> "Cohort":
+        return Cohort(self.user_ids[mask], self.scores[mask], self.majors[mask], self.years[mask],
+                      self.major_codes[mask], self.major_labels, self.year_codes[mask], self.year_labels,
+                      self.stored[mask], self.source)
+
+    def major_code(self, major: str) -> int:
+        """Code of `major` (any spelling), or -1 when nobody has it."""
+        key = " ".join(major.split()).casefold()
+        for code, label in enumerate(self.major_labels):
+            if label.casefold() == key:
+                return code
+        return -1
+
+
+def build_cohort(user_ids: Sequence[str], cases: Sequence[StudentCase], prescorer: PreScorer,
+                 stored: Optional[Dict[str, Tuple[str, Dict[str, Any]]]] = None) -> Cohort:
+    """`stored` is ResultStore.latest_rubrics(); entries for an outdated profile version are ignored."""
+    scores = prescorer.score_cohort(cases).scores.reshape(-1, len(DIMENSIONS))
+    from_store = np.zeros(len(cases), dtype=bool)
+    for i, (user_id, case) in enumerate(zip(user_ids, cases)):
+        entry = (stored or {}).get(user_id)
+        if entry is not None and entry[0] == profile_version(case.potential, case.personal):
+            scores[i] = [entry[1].get(d, 0) for d in DIMENSIONS]
+            from_store[i] = True
+    majors = [" ".join((c.potential.major or "").split()) or UNKNOWN for c in cases]
+    # strings are encoded once here, so grouping and filtering later are integer work
+    keys = np.array([m.casefold() for m in majors], dtype=object)
+    _, first, codes = np.unique(keys, return_index=True, return_inverse=True)
+    # years are free-form user input, so they are grouped by value, never used as an index
+    years = np.array([c.potential.year or 0 for c in cases], dtype=np.int64)
+    distinct_years, year_codes = np.unique(years, return_inverse=True)
+    return Cohort(
+        user_ids=np.array(user_ids, dtype=object),
+        scores=scores,
+        majors=np.array(majors, dtype=object),
+        years=years,
+        major_codes=codes.reshape(-1).astype(np.int64),
+        major_labels=np.array([majors[i] for i in first], dtype=object),
+        year_codes=year_codes.reshape(-1).astype(np.int64),
+        year_labels=np.array([str(y) if y else UNKNOWN for y in distinct_years], dtype=object),
+        stored=from_store,
+        source=f"prescore:{prescorer.model.kind}",
+    )
+
+
+def _histogram(values: np.ndarray, maxima: np.ndarray, bins: int) -> np.ndarray:
+    """(columns, bins) counts, each column binned over 0..its own maximum, in one bincount."""
+    columns = values.shape[1]
+    # clipped both ways: a stored score can fall outside 0..max, and bincount rejects negatives
+    idx = np.clip((values / maxima * bins).astype(np.int64), 0, bins - 1)
+    flat = (np.arange(columns) * bins + idx).ravel()
+    return np.bincount(flat, minlength=columns * bins).reshape(columns, bins)
+
+
+def _breakdown(codes: np.ndarray, labels: Sequence[str], cohort: Cohort, band_idx: np.ndarray,
+               max_groups: int) -> Dict[str, Any]:
+    # codes are small non-negative ints, so every aggregate is one bincount
+    g = len(labels)
+    counts = np.bincount(codes, minlength=g)
+    sums = np.stack([np.bincount(codes, weights=cohort.scores[:, j], minlength=g)
+                     for j in range(len(DIMENSIONS))], axis=1)
+    totals = np.bincount(codes, weights=cohort.totals, minlength=g)
+    band_counts = np.bincount(codes * len(BAND_NAMES) + band_idx, minlength=g * len(BAND_NAMES)).reshape(g, -1)
+    order = [i for i in np.argsort(-counts, kind="stable")[:max_groups] if counts[i]]
+    return {
+        str(labels[i]): {
+            "n": int(counts[i]),
+            "mean_total": round(float(totals[i] / counts[i]), 2),
+            "bands": dict(zip(BAND_NAMES, band_counts[i].tolist())),
+            "mean": {d: round(float(v), 2) for d, v in zip(DIMENSIONS, sums[i] / counts[i])},
+        }
+        for i in order
+    }
+
+
+def summarize(cohort: Cohort, percentiles: Sequence[int] = PERCENTILES, bins: int = 10,
+              max_groups: int = 20) -> Dict[str, Any]:
+    """Statistics over the stored rubrics, with the pre-scorer's estimates for everyone else kept apart."""
+    stored = int(cohort.stored.sum())
+    out = {
+        "profiles": len(cohort),
+        "source": {"stored": stored, cohort.source: len(cohort) - stored} if len(cohort) else {},
+        **_series(cohort.where(cohort.stored), percentiles, bins, max_groups),
+    }
+    if stored < len(cohort):
+        out["estimated"] = {
+            "source": cohort.source,
+            **_series(cohort.where(~cohort.stored), percentiles, bins, max_groups),
+        }
+    return out
+
+
+def _series(cohort: Cohort, percentiles: Sequence[int], bins: int, max_groups: int) -> Dict[str, Any]:
+    n = len(cohort)
+    if not n:
+        return {"n": 0}
+    totals = cohort.totals
+    band_idx = bands(totals)
+    dim_pct = np.percentile(cohort.scores, percentiles, axis=0)  # (len(percentiles), dims)
+    dim_hist = _histogram(cohort.scores, WEIGHTS, bins)
+    total_hist = _histogram(totals[:, None], np.array([100.0]), bins)[0]
+    return {
+        "n": n,
+        "overall": {
+            "mean": round(float(totals.mean()), 2),
+            "std": round(float(totals.std()), 2),
+            "percentiles": {str(p): float(v) for p, v in zip(percentiles, np.percentile(totals, percentiles))},
+            "histogram": {"edges": np.linspace(0, 100, bins + 1).tolist(), "counts": total_hist.tolist()},
+        },
+        "bands": dict(zip(BAND_NAMES, np.bincount(band_idx, minlength=len(BAND_NAMES)).tolist())),
+        "band_edges": BAND_EDGES.tolist(),
+        "dimensions": {
+            d: {
+                "max": int(WEIGHTS[j]),
+                "mean": round(float(cohort.scores[:, j].mean()), 2),
+                "percentiles": {str(p): float(v) for p, v in zip(percentiles, dim_pct[:, j])},
+                "histogram": {"edges": np.linspace(0, WEIGHTS[j], bins + 1).round(2).tolist(),
+                              "counts": dim_hist[j].tolist()},
+            }
+            for j, d in enumerate(DIMENSIONS)
+        },
+        "by_major": _breakdown(cohort.major_codes, cohort.major_labels, cohort, band_idx, max_groups),
+        "by_year": _breakdown(cohort.year_codes, cohort.year_labels, cohort, band_idx, max_groups),
+    }
+
+
+class CohortCache:
+    """The loaded Cohort, rebuilt only when the profile store's fingerprint moves."""
+
+    def __init__(self, store: ProfileStore, results: ResultStore, prescorer: Optional[PreScorer] = None):
+        self.store = store
+        self.results = results
+        # analytics still want numbers when PRESCORE_BACKEND=none keeps the pre-scorer out of the request path
+        self.prescorer = prescorer or PreScorer(RuleModel())
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[Tuple] = None
+        self._cohort: Optional[Cohort] = None
+        self.build_ms = 0.0
+
+    def get(self) -> Cohort:
+        fingerprint = (self.store.fingerprint(), self.results.fingerprint())
+        with self._lock:
+            if self._cohort is None or fingerprint != self._fingerprint:
+                start = time.perf_counter()
+                user_ids, cases = [], []
+                for user_id, kinds in self.store.snapshot().items():
+                    user_ids.append(user_id)
+                    cases.append(StudentCase(
+                        potential=PotentialAnalysis.model_validate_json(kinds.get("potential", "{}")),
+                        personal=PersonalProfile.model_validate_json(kinds.get("personality", "{}")),
+                    ))
+                self._cohort = build_cohort(user_ids, cases, self.prescorer, self.results.latest_rubrics())
+                self._fingerprint = fingerprint
+                self.build_ms = round((time.perf_counter() - start) * 1000, 1)
+            return self._cohort
+
+
+_cohort_cache: Optional[CohortCache] = None
+_cohort_cache_lock = threading.Lock()
+
+
+def get_cohort_cache() -> CohortCache:
+    global _cohort_cache
+    if _cohort_cache is None:
+        with _cohort_cache_lock:
+            if _cohort_cache is None:
+                _cohort_cache = CohortCache(get_profile_store(), get_result_store(), get_prescorer())
+    return _cohort_cache
+
+
+def cohort_stats(major: Optional[str] = None, year: Optional[int] = None, bins: int = 10) -> Dict[str, Any]:
+    cohort = get_cohort_cache().get()
+    mask = np.ones(len(cohort), dtype=bool)
+    if major:
+        mask &= cohort.major_codes == cohort.major_code(major)
+    if year is not None:
+        mask &= cohort.years == year
+    return summarize(cohort if mask.all() else cohort.where(mask), bins=bins)
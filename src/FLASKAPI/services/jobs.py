@@ -0,0 +1,303 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from agent.cache import DEFAULT_CACHE_DIR
+from .AnalyzingData import _return_result, stage_value, STAGE_FIELDS
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+FINISHED = (DONE, FAILED, CANCELLED, TIMEOUT)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobAborted(Exception):
+    pass
+
+
+class LocalBroker:
+    """
+    In-process stand-in for an external broker: a bounded FIFO of job ids.
+    Anything with publish/consume/qsize can replace it.
+    """
+
+    def __init__(self, maxsize: int = 16):
+        self.maxsize = maxsize
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=maxsize)
+
+    def publish(self, job_id: str) -> None:
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            raise QueueFull(f"job queue is full ({self.maxsize})")
+
+    def consume(self, timeout: float = 1.0) -> Optional[str]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class JobStore:
+    """
+    Job state in a WAL-mode SQLite file, so a poll or cancel that lands on a
+    different gunicorn worker still sees the job.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, user_id TEXT, status TEXT NOT NULL, created_at REAL NOT NULL,"
+            "started_at REAL, finished_at REAL, deadline REAL NOT NULL, cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            "timings TEXT, error TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_parts ("
+            "job_id TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (job_id, field))"
+        )
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, user_id: Optional[str], deadline_sec: float) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO jobs (id, user_id, status, created_at, deadline) VALUES (?, ?, ?, ?, ?)",
+            (job_id, user_id, QUEUED, now, now + deadline_sec),
+        )
+        conn.commit()
+        return job_id
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        if "timings" in fields:
+            fields["timings"] = json.dumps(fields["timings"])
+        columns = ", ".join(f"{k} = ?" for k in fields)
+        conn = self._conn()
+        conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        conn.commit()
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None, timings: Optional[Dict] = None) -> None:
+        # never overwrite a cancel/timeout that was recorded while the job ran
+        conn = self._conn()
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, timings = ?, finished_at = ? WHERE id = ? AND status = ?",
+            (status, error, json.dumps(timings or {}), time.time(), job_id, RUNNING),
+        )
+        conn.commit()
+
+    def put_part(self, job_id: str, field: str, value: Any) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO job_parts (job_id, field, value) VALUES (?, ?, ?)",
+            (job_id, field, json.dumps(value, ensure_ascii=False)),
+        )
+        conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["timings"] = json.loads(job["timings"]) if job["timings"] else {}
+        job["partial"] = {
+            r["field"]: json.loads(r["value"])
+            for r in conn.execute("SELECT field, value FROM job_parts WHERE job_id = ?", (job_id,))
+        }
+        return job
+
+    def request_cancel(self, job_id: str) -> bool:
+        conn = self._conn()
+        cur = conn.execute(
+            "UPDATE jobs SET cancel_requested = 1, status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+            (CANCELLED, time.time(), job_id, QUEUED, RUNNING),
+        )
+        conn.commit()
+        return cur.rowcount > 0
+
+    def mark(self, job_id: str, status: str) -> None:
+        conn = self._conn()
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)",
+            (status, time.time(), job_id, QUEUED, RUNNING),
+        )
+        conn.commit()
+
+    def purge(self, older_than_sec: float) -> None:
+        cutoff = time.time() - older_than_sec
+        conn = self._conn()
+        conn.execute(
+            "DELETE FROM job_parts WHERE job_id IN (SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?)",
+            (cutoff,),
+        )
+        conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+        conn.commit()
+
+
+class JobManager:
+    """
+    Runs analyses on a small pool of background threads fed by a bounded broker.
+
+    Stages cannot be interrupted mid-call, so cancellation and the per-job
+    deadline take effect at the next stage boundary; the job's status flips
+    immediately either way.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        broker: Optional[Any] = None,
+        workers: int = 2,
+        deadline_sec: float = 120,
+        max_deadline_sec: float = 900,
+        retention_sec: float = 3600,
+        runner: Callable[..., Dict[str, Any]] = _return_result,
+    ):
+        self.store = store
+        self.broker = broker or LocalBroker()
+        self.workers = workers
+        self.deadline_sec = deadline_sec
+        self.max_deadline_sec = max_deadline_sec
+        self.retention_sec = retention_sec
+        self.runner = runner
+        self._threads: list = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._loop, name=f"job-worker-{len(self._threads)}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def submit(self, user_id: Optional[str] = None, deadline_sec: Optional[float] = None) -> str:
+        self.start()
+        job_id = self.store.create(user_id, deadline_sec or self.deadline_sec)
+        try:
+            self.broker.publish(job_id)
+        except QueueFull:
+            self.store.mark(job_id, FAILED)
+            self.store.update(job_id, error="queue full")
+            raise
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        if job and job["status"] in (QUEUED, RUNNING) and time.time() > job["deadline"]:
+            self.store.mark(job_id, TIMEOUT)
+            job = self.store.get(job_id)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        return self.store.request_cancel(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": sum(1 for t in self._threads if t.is_alive()),
+            "queued": self.broker.qsize(),
+            "queue_size": getattr(self.broker, "maxsize", None),
+        }
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            job_id = self.broker.consume(timeout=1.0)
+            if job_id is None:
+                continue
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print(f"[jobs] {job_id} crashed: {e}")
+                self.store.finish(job_id, FAILED, error=str(e))
+            self.store.purge(self.retention_sec)
+
+    def _check(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        if job is None or job["cancel_requested"]:
+            raise JobAborted(CANCELLED)
+        if time.time() > job["deadline"]:
+            raise JobAborted(TIMEOUT)
+
+    def _run(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        if job is None or job["status"] != QUEUED:
+            return
+        if job["cancel_requested"]:
+            return
+        if time.time() > job["deadline"]:
+            self.store.mark(job_id, TIMEOUT)
+            return
+        self.store.update(job_id, status=RUNNING, started_at=time.time())
+
+        def on_stage(name: str, result: Any) -> None:
+            self.store.put_part(job_id, STAGE_FIELDS[name], stage_value(name, result))
+            self._check(job_id)
+
+        data = self.runner(UserID=job["user_id"], on_stage=on_stage)
+        try:
+            self._check(job_id)
+        except JobAborted as e:
+            self.store.mark(job_id, str(e))
+            return
+        if not data or "result" not in data:
+            self.store.finish(job_id, FAILED, error="No result generated")
+            return
+        self.store.put_part(job_id, "fallbacks", data["result"].fallbacks)
+        self.store.finish(job_id, DONE, timings=data.get("timings"))
+
+
+_manager: Optional[JobManager] = None
+_manager_pid: Optional[int] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Per-process manager (worker threads never survive a fork); job state is shared via SQLite."""
+    global _manager, _manager_pid
+    pid = os.getpid()
+    if _manager is not None and _manager_pid == pid:
+        return _manager
+    with _manager_lock:
+        if _manager is None or _manager_pid != pid:
+            _manager = JobManager(
+                store=JobStore(Path(os.getenv("JOB_STORE_PATH", DEFAULT_CACHE_DIR.parent / "jobs.sqlite"))),
+                broker=LocalBroker(maxsize=int(os.getenv("JOB_QUEUE_SIZE", 16))),
+                workers=int(os.getenv("JOB_WORKERS", 2)),
+                deadline_sec=float(os.getenv("JOB_DEADLINE_SEC", 120)),
+                max_deadline_sec=float(os.getenv("JOB_MAX_DEADLINE_SEC", 900)),
+            )
+            _manager_pid = pid
+        return _manager
@@ -0,0 +1,154 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from agent.cache import content_key
+from agent.models import PersonalProfile, PotentialAnalysis
+
+BASE_DIR = Path(__file__).parent.parent
+DEFAULT_USER = "default"
+USER_ID_RE = re.compile(r"^[A-Za-z0-9_.@-]{1,64}$")
+
+KINDS: Dict[str, Type[BaseModel]] = {
+    "potential": PotentialAnalysis,
+    "personality": PersonalProfile,
+}
+
+
+class InvalidUserId(ValueError):
+    pass
+
+
+def check_user_id(user_id: Optional[str]) -> str:
+    user_id = (user_id or DEFAULT_USER).strip()
+    if not USER_ID_RE.match(user_id):
+        raise InvalidUserId(f"invalid user id: {user_id!r}")
+    return user_id
+
+
+class ProfileStore:
+    """
+    Per-user profile records in a WAL-mode SQLite file (primary key = user id + kind).
+
+    Writes are single-row upserts, so concurrent users never clobber each other.
+    Parsed pydantic models are cached per process and revalidated against the
+    stored version hash, which is cheap compared with re-parsing the JSON.
+    """
+
+    def __init__(self, path: Path, legacy_dir: Optional[Path] = None):
+        self.path = Path(path)
+        self.legacy_dir = legacy_dir
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple[str, str], Tuple[str, BaseModel]] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "user_id TEXT NOT NULL, kind TEXT NOT NULL, data TEXT NOT NULL, version TEXT NOT NULL,"
+            "updated_at REAL NOT NULL, PRIMARY KEY (user_id, kind))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS profiles_updated ON profiles (updated_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, user_id: str, kind: str, model: BaseModel) -> str:
+        user_id = check_user_id(user_id)
+        data = model.model_dump()
+        version = content_key(kind, data)
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO profiles (user_id, kind, data, version, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, kind, json.dumps(data, ensure_ascii=False), version, time.time()),
+        )
+        conn.commit()
+        with self._lock:
+            self._models[(user_id, kind)] = (version, model.model_copy(deep=True))
+        return version
+
+    def version(self, user_id: str, kind: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT version FROM profiles WHERE user_id = ? AND kind = ?", (check_user_id(user_id), kind)
+        ).fetchone()
+        return row[0] if row else None
+
+    def load(self, user_id: str, kind: str) -> BaseModel:
+        user_id = check_user_id(user_id)
+        model_cls = KINDS[kind]
+        version = self.version(user_id, kind)
+        if version is None:
+            return self._load_legacy(user_id, kind) or model_cls()  # default rỗng
+
+        with self._lock:
+            cached = self._models.get((user_id, kind))
+        if cached is not None and cached[0] == version:
+            return cached[1].model_copy(deep=True)
+
+        row = self._conn().execute(
+            "SELECT data, version FROM profiles WHERE user_id = ? AND kind = ?", (user_id, kind)
+        ).fetchone()
+        model = model_cls.model_validate(json.loads(row[0]))
+        with self._lock:
+            self._models[(user_id, kind)] = (row[1], model)
+        return model.model_copy(deep=True)
+
+    def _load_legacy(self, user_id: str, kind: str) -> Optional[BaseModel]:
+        # data/potential.json / data/personality.json from the single-user days
+        if user_id != DEFAULT_USER or self.legacy_dir is None:
+            return None
+        path = self.legacy_dir / f"{kind}.json"
+        if not path.exists():
+            return None
+        return KINDS[kind].model_validate(json.loads(path.read_text(encoding="utf-8")))
+
+    def users(self, limit: int = 100, offset: int = 0) -> list:
+        rows = self._conn().execute(
+            "SELECT DISTINCT user_id FROM profiles ORDER BY user_id LIMIT ? OFFSET ?", (limit, offset)
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def fingerprint(self) -> Tuple[int, float]:
+        """Changes whenever any profile is written; two index lookups, no scan."""
+        # one aggregate per statement, so SQLite answers each from an index instead of scanning
+        conn = self._conn()
+        (last_row,) = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM profiles").fetchone()
+        (last_update,) = conn.execute("SELECT COALESCE(MAX(updated_at), 0) FROM profiles").fetchone()
+        return last_row, last_update
+
+    def snapshot(self) -> Dict[str, Dict[str, str]]:
+        """Every stored profile as raw JSON, {user_id: {kind: data}}, in one query."""
+        out: Dict[str, Dict[str, str]] = {}
+        for user_id, kind, data in self._conn().execute("SELECT user_id, kind, data FROM profiles ORDER BY user_id"):
+            out.setdefault(user_id, {})[kind] = data
+        return out
+
+
+_store: Optional[ProfileStore] = None
+_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ProfileStore(
+                    Path(os.getenv("PROFILE_STORE_PATH", BASE_DIR / "data" / "profiles.sqlite")),
+                    legacy_dir=BASE_DIR / "data",
+                )
+    return _store
@@ -0,0 +1,151 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.cache import content_key
+from agent.models import Conclusion, PersonalProfile, PotentialAnalysis
+from .profileStore import BASE_DIR, check_user_id
+
+
+def profile_version(potential: PotentialAnalysis, personality: PersonalProfile) -> str:
+    """Hash of both profile halves: a stored Conclusion is current while this is unchanged."""
+    return content_key("profile", potential, personality)
+
+
+@dataclass
+class StoredResult:
+    id: int
+    user_id: str
+    profile_version: str
+    digest: str  # hash of the Conclusion JSON; doubles as its ETag
+    created_at: float
+    timings: Dict[str, float]
+    conclusion_json: str
+
+    @property
+    def conclusion(self) -> Conclusion:
+        return Conclusion.model_validate_json(self.conclusion_json)
+
+
+class ResultStore:
+    """
+    Append-only history of Conclusions per user in a WAL-mode SQLite file.
+
+    Every row records the profile version it was computed from, so the latest
+    row for (user, current version) can be served instead of re-running the
+    pipeline. A result identical to the user's latest one is not appended
+    again, and only the newest `keep` rows per user are retained.
+    """
+
+    def __init__(self, path: Path, keep: int = 50):
+        self.path = Path(path)
+        self.keep = keep
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, profile_version TEXT NOT NULL,"
+            "digest TEXT NOT NULL, conclusion TEXT NOT NULL, timings TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_user ON results (user_id, id)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(row: Tuple) -> StoredResult:
+        id_, user_id, version, digest, conclusion, timings, created_at = row
+        return StoredResult(id_, user_id, version, digest, created_at, json.loads(timings), conclusion)
+
+    _COLUMNS = "id, user_id, profile_version, digest, conclusion, timings, created_at"
+
+    def save(self, user_id: Optional[str], version: str, conclusion: Conclusion,
+             timings: Optional[Dict[str, float]] = None) -> StoredResult:
+        user_id = check_user_id(user_id)
+        data = conclusion.model_dump_json()
+        digest = content_key("conclusion", version, json.loads(data))[:32]
+        conn = self._conn()
+        with conn:
+            latest = conn.execute(
+                f"SELECT {self._COLUMNS} FROM results WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,)
+            ).fetchone()
+            if latest is not None and latest[3] == digest:
+                return self._row(latest)
+            row_id = conn.execute(
+                "INSERT INTO results (user_id, profile_version, digest, conclusion, timings, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, version, digest, data, json.dumps(timings or {}), time.time()),
+            ).lastrowid
+            conn.execute(
+                "DELETE FROM results WHERE user_id = ? AND id NOT IN "
+                "(SELECT id FROM results WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+                (user_id, user_id, self.keep),
+            )
+        return self.get(row_id)
+
+    def get(self, result_id: int) -> Optional[StoredResult]:
+        row = self._conn().execute(f"SELECT {self._COLUMNS} FROM results WHERE id = ?", (result_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def latest(self, user_id: Optional[str], version: Optional[str] = None) -> Optional[StoredResult]:
+        """Newest result for the user, optionally only if computed from profile `version`."""
+        user_id = check_user_id(user_id)
+        if version is None:
+            row = self._conn().execute(
+                f"SELECT {self._COLUMNS} FROM results WHERE user_id = ? ORDER BY id DESC LIMIT 1", (user_id,)
+            ).fetchone()
+        else:
+            row = self._conn().execute(
+                f"SELECT {self._COLUMNS} FROM results WHERE user_id = ? AND profile_version = ?"
+                " ORDER BY id DESC LIMIT 1", (user_id, version)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def history(self, user_id: Optional[str], limit: int = 10, before: Optional[int] = None) -> List[StoredResult]:
+        """Newest first; pass the last id of a page as `before` to get the next one."""
+        rows = self._conn().execute(
+            f"SELECT {self._COLUMNS} FROM results WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (check_user_id(user_id), before if before is not None else 2 ** 63 - 1, limit),
+        ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def latest_rubrics(self) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """{user_id: (profile_version, rubricResult)} of every user's newest result."""
+        rows = self._conn().execute(
+            "SELECT r.user_id, r.profile_version, r.conclusion FROM results r JOIN "
+            "(SELECT user_id, MAX(id) AS id FROM results GROUP BY user_id) last ON last.id = r.id"
+        )
+        return {user_id: (version, json.loads(data)["rubricResult"]) for user_id, version, data in rows}
+
+    def fingerprint(self) -> int:
+        (last,) = self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM results").fetchone()
+        return last
+
+
+_store: Optional[ResultStore] = None
+_store_lock = threading.Lock()
+
+
+def get_result_store() -> ResultStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ResultStore(
+                    Path(os.getenv("RESULT_STORE_PATH", BASE_DIR / "data" / "results.sqlite")),
+                    keep=int(os.getenv("RESULT_STORE_KEEP", 50)),
+                )
+    return _store